@@ -30,15 +30,37 @@ def jupyter_clear_output(notebook):
 # fmt: on
 
 
+# Source modules of each script, including the modules of `src` it imports: a change to any of them runs the task again
+SRC_DIR = Path("./src")
+LOAD_DEPS = ["config.py"]
+MERGE_DEPS = [*LOAD_DEPS, "load_crsp.py", "load_markit.py", "load_reprisk.py", "merge_markit_crsp.py",
+              "merge_markit_crsp_reprisk.py", "event_index.py", "security_index.py"]
+PLOT_DEPS = ["config.py", "plot_lend_ind.py", "downsampling.py", "security_index.py", "event_index.py",
+             "trading_calendar.py"]
+STATS_DEPS = ["config.py", "compute_desc_stats.py", "misc_tools.py", "grouped_kernels.py", "trading_calendar.py",
+              "sketches.py", "event_index.py"]
+LATEX_DEPS = [*STATS_DEPS, "pandas_to_latex_tables.py"]
+SORT_DEPS = [*STATS_DEPS, "portfolio_sorts.py", "cross_section.py"]
+
+
+def src_deps(modules):
+    return [SRC_DIR / module for module in modules]
+
+
+PULLED_FILES = [DATA_DIR / "pulled" / file for file in ["crsp.parquet", "markit.parquet", "reprisk.parquet"]]
+MERGED_FILE = DATA_DIR / "pulled" / "merged_data.parquet"
+# Cache of the trading calendar shared by the plots and the statistics (see `trading_calendar.load_trading_calendar`)
+CALENDAR_FILE = DATA_DIR / "derived" / "trading_calendar_NYSE.parquet"
+# Years of the sample, one partition of the merged data and one task per year with `INCREMENTAL_STATS`
+YEARS = config.YEARS
+
+
 def task_create_dirs():
     """Create the directories for the project."""
+    dirs = [DATA_DIR / "pulled", DATA_DIR / "derived", OUTPUT_DIR, OUTPUT_DIR / "stats", OUTPUT_DIR / "tables"]
     return {
-        "actions": [
-            f"mkdir -p {DATA_DIR / 'pulled'}",
-            f"mkdir -p {OUTPUT_DIR}",
-            f"mkdir -p {OUTPUT_DIR / 'stats'}",
-            f"mkdir -p {OUTPUT_DIR / 'tables'}",
-        ],
+        "actions": [f"mkdir -p {directory}" for directory in dirs],
+        "uptodate": [all(directory.exists() for directory in dirs)],
     }
 
 
@@ -46,7 +68,7 @@ def task_pull_crsp():
     '''
     Pull data from CRSP and save it to a parquet file in the data/pulled directory
     '''
-    file_dep = ["./src/load_crsp.py"]
+    file_dep = src_deps([*LOAD_DEPS, "load_crsp.py"])
     file_output = ["crsp.parquet"]
     targets = [DATA_DIR / "pulled" / file for file in file_output]
 
@@ -56,6 +78,7 @@ def task_pull_crsp():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
@@ -64,7 +87,7 @@ def task_pull_markit():
     '''
     Pull data from Markit and save it to a parquet file in the data/pulled directory
     '''
-    file_dep = ["./src/load_markit.py"]
+    file_dep = src_deps([*LOAD_DEPS, "load_markit.py"])
     file_output = ["markit.parquet"]
     targets = [DATA_DIR / "pulled" / file for file in file_output]
 
@@ -74,6 +97,7 @@ def task_pull_markit():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
@@ -81,7 +105,7 @@ def task_pull_reprisk():
     '''
     Pull data from RepRisk and save it to a parquet file in the data/pulled directory
     '''
-    file_dep = ["./src/load_reprisk.py"]
+    file_dep = src_deps([*LOAD_DEPS, "load_reprisk.py"])
     file_output = ["reprisk.parquet"]
     targets = [DATA_DIR / "pulled" / file for file in file_output]
 
@@ -91,15 +115,18 @@ def task_pull_reprisk():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
 def task_merge_markit_crsp_reprisk():
     '''
     Excecute the merge_markit_crsp_reprisk.py file that will merge the data from the different sources.
+    The merge is run again when the pulled data changed.
     '''
-    file_dep = ["./src/merge_markit_crsp_reprisk.py"]
-    file_output = ["merged_data.parquet"]
+    file_dep = [*src_deps(MERGE_DEPS), *PULLED_FILES]
+    file_output = ["markit_crsp_ratios.parquet", "merged_data.parquet", "merged_data_security_index.parquet",
+                   "merged_data_daily.parquet", "merged_data_daily_security_index.parquet"]
     targets = [DATA_DIR / "pulled" / file for file in file_output]
 
     return {
@@ -108,16 +135,38 @@ def task_merge_markit_crsp_reprisk():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
+
+def task_trading_calendar():
+    '''
+    Build the trading calendar and save it to the data/derived directory
+    The plots and the statistics read it from there instead of each building and caching it.
+    '''
+    file_dep = src_deps(["config.py", "trading_calendar.py"])
+    targets = [CALENDAR_FILE]
+
+    return {
+        "actions": [
+            "ipython ./src/trading_calendar.py",
+        ],
+        "targets": targets,
+        "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
+        "clean": True,
+    }
+
+
+lend_ind_charts = [OUTPUT_DIR / f"{name}_lend_ind.png" for name in ["Apple Inc", "GameStop Corp", "Altria Group Inc"]]
+
 def task_plot_lend_ind():
     '''
     Plot apple's lending indicators and store the plot in the output directory
     '''
-    file_dep = ["./src/plot_lend_ind.py"]
-    file_output = ["output/Apple Inc_lend_ind.png", "output/GameStop Corp_lend_ind.png", "output/Altria Group Inc_lend_ind.png"]
-    targets = [OUTPUT_DIR / file for file in file_output]
+    file_dep = [*src_deps(PLOT_DEPS), MERGED_FILE, CALENDAR_FILE]
+    targets = lend_ind_charts
 
     return {
         "actions": [
@@ -125,21 +174,86 @@ def task_plot_lend_ind():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
-lending_indicators = ['short interest ratio', 'loan supply ratio', 'loan utilisation ratio', 'loan fee']
+lending_indicators = config.LENDING_INDICATORS
 esg = ['severity', 'novelty', 'reach', 'environment', 'social', 'governance']
+stats_input = MERGED_FILE
+if config.DAILY_INCIDENT_STATS:
+    # Statistics on the merged data with the incidents aggregated per day (see `compute_desc_stats.ESG_DAILY`)
+    esg = ['severity_max', 'novelty_max', 'reach_max', 'environment_any', 'social_any', 'governance_any']
+    stats_input = DATA_DIR / "pulled" / "merged_data_daily.parquet"
+horizons = config.CHANGE_HORIZONS
+
+output_files = [f"{j + '_' + i + k}.parquet" for i in esg for j in lending_indicators
+                for k in ['', *[f'_change_{h}' for h in horizons]]]
+# Partitions of the consolidated statistics dataset (see `compute_desc_stats.write_stats_dataset`)
+stats_dataset_files = [OUTPUT_DIR / "stats_dataset" / "desc_stats" / f"horizon={h}" / "part-0.parquet" for h in [0, *horizons]]
 
-output_files = [f"{j + '_' + i + k}.parquet" for i in esg for j in lending_indicators for k in ['', '_change_5', '_change_26']]
+def write_year_partitions():
+    # Imported when the task runs, not when the tasks are listed
+    from merge_markit_crsp_reprisk import write_year_partitions
+    _ = write_year_partitions(YEARS, file_name=stats_input.stem, data_dir=DATA_DIR)
+
+
+def sketch_year_partition(year):
+    from merge_markit_crsp_reprisk import year_partition_path
+    from compute_desc_stats import sketch_year_partition
+    partition_path = year_partition_path(year, file_name=stats_input.stem, data_dir=DATA_DIR)
+    _ = sketch_year_partition(partition_path, year, lending_indicators=lending_indicators, esg=esg,
+                              output_dir=OUTPUT_DIR)
+
+
+if config.INCREMENTAL_STATS:
+    # The levels are described from the aggregates of the yearly partitions of the statistics input, so that only the years
+    # whose rows changed are summarized again
+
+    def task_partition_merged_data():
+        '''
+        Split the merged data into one .parquet file per year in the data/derived directory
+        A partition is only rewritten when its rows changed, so that the tasks of the other years are not run again.
+        '''
+        from merge_markit_crsp_reprisk import year_partition_path
+
+        return {
+            "actions": [write_year_partitions],
+            "targets": [year_partition_path(year, file_name=stats_input.stem, data_dir=DATA_DIR) for year in YEARS],
+            "file_dep": [*src_deps(MERGE_DEPS), stats_input],
+            "task_dep": ["create_dirs"],
+            "clean": True,
+        }
+
+    def task_sketch_year_partitions():
+        '''
+        Summarize every yearly partition of the merged data by the aggregates of its descriptive statistics
+        Only the years whose partition changed are summarized again.
+        '''
+        from merge_markit_crsp_reprisk import year_partition_path
+
+        for year in YEARS:
+            yield {
+                "name": str(year),
+                "actions": [(sketch_year_partition, [year])],
+                "targets": [year_sketches_path(year, output_dir=OUTPUT_DIR)],
+                "file_dep": [*src_deps(STATS_DEPS),
+                             year_partition_path(year, file_name=stats_input.stem, data_dir=DATA_DIR)],
+                "clean": True,
+            }
+
+    from compute_desc_stats import year_sketches_path
+    stats_year_files = [year_sketches_path(year, output_dir=OUTPUT_DIR) for year in YEARS]
+else:
+    stats_year_files = []
 
 def task_compute_desc_stats():
     '''
-    Compute the descriptive statistics and store them in the data directory as .parquet files
+    Compute the descriptive statistics and store them in the output directory as .parquet files
     '''
-    file_dep = ["./src/compute_desc_stats.py"]
+    file_dep = [*src_deps(STATS_DEPS), stats_input, CALENDAR_FILE, *stats_year_files]
     file_output = output_files
-    targets = [DATA_DIR / "pulled" / file for file in file_output]
+    targets = [*[OUTPUT_DIR / "stats" / file for file in file_output], *stats_dataset_files]
 
     return {
         "actions": [
@@ -147,15 +261,44 @@ def task_compute_desc_stats():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
+# Tables of the portfolio sorts (see `portfolio_sorts.SORTS`), converted to LaTeX with the descriptive statistics
+sorts = ['incident_count_21', 'severity_max_21', 'current_rri']
+portfolio_sort_files = [f"portfolio_sort_{name}_{weighting}.parquet" for name in sorts for weighting in ['ew', 'vw']]
+
+def task_portfolio_sorts():
+    '''
+    Run the portfolio sorts and store the tables in the output directory as .parquet files
+    The sorts run on the merged data with the incidents aggregated per day.
+    '''
+    file_dep = [*src_deps(SORT_DEPS), DATA_DIR / "pulled" / "merged_data_daily.parquet"]
+    targets = [OUTPUT_DIR / "stats" / file for file in portfolio_sort_files]
+
+    return {
+        "actions": [
+            "ipython ./src/portfolio_sorts.py",
+        ],
+        "targets": targets,
+        "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
+        "clean": True,
+    }
+
+def latex_table_name(file_name):
+    # Name of the LaTeX table of a .parquet file, as in `pandas_to_latex_tables._latex_file_name`
+    return file_name.replace('.parquet', '.tex').replace(' ', '_')
+
 def task_parquet_to_latex_table():
     '''
     Convert the .parquet files to LaTeX tables
+    Only the tables whose statistics changed are rendered again.
     '''
-    file_dep = ["./src/pandas_to_latex_tables.py"]
-    file_output = [f"{file.replace('.parquet', '.tex')}" for file in output_files]
+    stats_files = [*output_files, *portfolio_sort_files]
+    file_dep = [*src_deps(LATEX_DEPS), *[OUTPUT_DIR / "stats" / file for file in stats_files], *stats_dataset_files]
+    file_output = [latex_table_name(file) for file in stats_files]
     targets = [OUTPUT_DIR / "tables" / file for file in file_output]
 
     return {
@@ -164,6 +307,7 @@ def task_parquet_to_latex_table():
         ],
         "targets": targets,
         "file_dep": file_dep,
+        "task_dep": ["create_dirs"],
         "clean": True,
     }
 
@@ -237,6 +381,9 @@ def task_compile_latex_docs():
     """Compiling the latex report"""
     file_dep = [
         "./reports/report.tex",
+        # Tables and charts included in the report
+        *[OUTPUT_DIR / "tables" / latex_table_name(file) for file in output_files],
+        *lend_ind_charts,
     ]
     file_output = [
         "./reports/report.pdf",
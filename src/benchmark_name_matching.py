@@ -0,0 +1,251 @@
+"""
+The `benchmark_name_matching.py` module has been designed to measure the accuracy and the throughput of the name matching
+used to link Markit instruments to RepRisk companies when the ISIN is missing (see the `Merging Markit - Resprisk Exploration
+- on Names` notebook).
+
+The module contains the following functions:
+    * clean_company_name - Cleans a company name before matching (same cleaning as in the notebook).
+    * build_labeled_pairs - Builds a labeled set of (Markit name, RepRisk id) pairs from the ISIN-confirmed matches.
+    * build_master_data - Builds the RepRisk master table the names are matched against.
+    * accept_matches - Applies the score thresholds used in the notebook to the best match of each name.
+    * score_matches - Computes the precision and the recall of the accepted matches against the labels.
+    * evaluate_matcher_config - Fits and runs one matcher configuration and reports its accuracy and throughput.
+    * run_benchmark - Runs every matcher configuration and flags the ones meeting a recall target.
+    * cheapest_config - Returns the fastest configuration meeting a recall target.
+
+Companies matched on ISIN give us a free ground truth: for those, we know the `reprisk_id` the name matcher should return.
+Matching their (cleaned) Markit names against the whole RepRisk company table with a given configuration tells us how many
+of them are found (recall), how many accepted matches are right (precision) and how many names are matched per second.
+Note that names of companies with an ISIN in both datasets may be slightly easier to match than the remaining ones, so the
+figures should be read as a comparison between configurations rather than as an absolute accuracy.
+"""
+
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from cleanco import basename
+from name_matching.name_matcher import NameMatcher
+
+import config
+
+DATA_DIR = Path(config.DATA_DIR)
+OUTPUT_DIR = Path(config.OUTPUT_DIR)
+
+# Configuration used in the notebook, the other configurations are variations of it
+BASE_MATCHER_PARAMS = {
+    'ngrams': (2, 5),
+    'top_n': 10,
+    'number_of_rows': 500,
+    'number_of_matches': 3,
+    'lowercase': True,
+    'punctuations': True,
+    'remove_ascii': True,
+    'legal_suffixes': False,
+    'common_words': False,
+    'preprocess_split': False,
+    'verbose': False,
+}
+BASE_DISTANCE_METRICS = ['iterative_sub_string', 'pearson_ii', 'bag', 'fuzzy_wuzzy_partial_string', 'editex']
+
+MATCHER_CONFIGS = {
+    'notebook': {},
+    'ngrams_2_3': {'ngrams': (2, 3)},
+    'ngrams_3_3': {'ngrams': (3, 3)},
+    'top_n_5': {'top_n': 5},
+    'top_n_3': {'top_n': 3},
+    'no_editex': {'distance_metrics': ['iterative_sub_string', 'pearson_ii', 'bag', 'fuzzy_wuzzy_partial_string']},
+    'no_partial_string': {'distance_metrics': ['iterative_sub_string', 'pearson_ii', 'bag', 'editex']},
+    'no_editex_no_partial_string': {'distance_metrics': ['iterative_sub_string', 'pearson_ii', 'bag']},
+    'fast': {'ngrams': (2, 3), 'top_n': 5, 'distance_metrics': ['iterative_sub_string', 'pearson_ii', 'bag']},
+}
+
+
+def clean_company_name(name):
+    """
+    Clean the company name by applying the following transformations:
+    - Handle non-string inputs.
+    - Remove legal entity identifiers.
+    - Convert to lowercase.
+    - Remove punctuation and special characters.
+    - Trim whitespace.
+    """
+    if pd.isnull(name) or not isinstance(name, str):
+        return None
+
+    name = basename(name)
+    name = name.lower()
+    name = re.sub(r'[^\w\s]', '', name)
+    name = re.sub(r'\s+', ' ', name).strip()
+    return name
+
+
+def build_labeled_pairs(markit_company, reprisk_company, sample_size=None, seed=100):
+    """
+    The `build_labeled_pairs` function has been designed to build the ground truth of the benchmark from the ISIN-confirmed
+    matches. Each Markit instrument whose ISIN is the primary ISIN of exactly one RepRisk company is labeled with the
+    `reprisk_id` of that company.
+
+    The function returns a DataFrame with the `isin`, `instrumentname`, `cleaned_name` and `reprisk_id` columns, optionally
+    sampled down to `sample_size` pairs.
+    """
+    reprisk_isin = reprisk_company[['reprisk_id', 'primary_isin']].dropna().drop_duplicates()
+    # An ISIN shared by several RepRisk companies does not give an unambiguous label
+    reprisk_isin = reprisk_isin[~reprisk_isin['primary_isin'].duplicated(keep=False)]
+
+    pairs = markit_company[['isin', 'instrumentname']].dropna().drop_duplicates(subset=['isin'])
+    pairs = pairs.merge(reprisk_isin, left_on='isin', right_on='primary_isin', how='inner').drop(columns=['primary_isin'])
+    pairs['cleaned_name'] = pairs['instrumentname'].apply(clean_company_name)
+    pairs = pairs[pairs['cleaned_name'].str.len() > 0]
+
+    if sample_size is not None and sample_size < len(pairs):
+        pairs = pairs.sample(n=sample_size, random_state=seed)
+
+    return pairs.reset_index(drop=True)
+
+
+def build_master_data(reprisk_company):
+    """
+    The `build_master_data` function has been designed to build the RepRisk table the names are matched against, that is the
+    RepRisk companies with their cleaned names and a unique positional index (as expected by `NameMatcher`).
+    """
+    master = reprisk_company[['reprisk_id', 'company_name']].dropna().copy()
+    master['clean_company_name'] = master['company_name'].apply(clean_company_name)
+    master = master[master['clean_company_name'].str.len() > 0]
+    return master.reset_index(drop=True)
+
+
+def accept_matches(matches, score_threshold=93, long_name_score_threshold=85, long_name_length=15):
+    """
+    The `accept_matches` function applies the thresholds used in the notebook to the best match of each name: a match is
+    accepted if its score is above `score_threshold`, or above `long_name_score_threshold` when the matched name is longer
+    than `long_name_length` characters.
+
+    The function returns a boolean Series aligned on `matches`.
+    """
+    score = matches['score_0']
+    long_name = matches['match_name_0'].str.len() > long_name_length
+    return (score > score_threshold) | ((score > long_name_score_threshold) & long_name)
+
+
+def score_matches(pairs, predicted_id):
+    """
+    The `score_matches` function compares the predicted `reprisk_id` of each labeled pair (NaN when no match was accepted)
+    with its label.
+
+    The function returns a dictionary with the number of pairs, the number of accepted and of correct matches, the precision
+    (correct / accepted) and the recall (correct / pairs).
+    """
+    predicted_id = pd.Series(predicted_id, index=pairs.index)
+    accepted = predicted_id.notna()
+    correct = accepted & (predicted_id == pairs['reprisk_id'])
+
+    n_pairs = len(pairs)
+    n_accepted = int(accepted.sum())
+    n_correct = int(correct.sum())
+
+    return {
+        'pairs': n_pairs,
+        'accepted': n_accepted,
+        'correct': n_correct,
+        'precision': n_correct / n_accepted if n_accepted else np.nan,
+        'recall': n_correct / n_pairs if n_pairs else np.nan,
+    }
+
+
+def evaluate_matcher_config(pairs, master, config_params=None, batch_size=100, **threshold_kwargs):
+    """
+    The `evaluate_matcher_config` function has been designed to fit a `NameMatcher` with the notebook configuration updated
+    with `config_params` on the master data, to match the names of the labeled pairs in batches of `batch_size` names and to
+    score the accepted matches.
+
+    The function returns a dictionary with the accuracy figures of `score_matches`, the time spent processing the master
+    data, the time spent matching and the number of names matched per second.
+    """
+    params = {**BASE_MATCHER_PARAMS, **(config_params or {})}
+    distance_metrics = params.pop('distance_metrics', BASE_DISTANCE_METRICS)
+
+    start = time.perf_counter()
+    matcher = NameMatcher(**params)
+    matcher.set_distance_metrics(distance_metrics)
+    matcher.load_and_process_master_data(column='clean_company_name', df_matching_data=master, transform=True)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    to_be_matched = pairs[['cleaned_name']]
+    matches = pd.concat([
+        matcher.match_names(to_be_matched=to_be_matched.iloc[i:i + batch_size], column_matching='cleaned_name')
+        for i in range(0, len(to_be_matched), batch_size)
+    ])
+    match_seconds = time.perf_counter() - start
+
+    matches = matches.reindex(pairs.index)
+    accepted = accept_matches(matches, **threshold_kwargs)
+    match_index = matches['match_index_0'].where(accepted)
+    predicted_id = pd.Series(np.nan, index=pairs.index, dtype=object)
+    predicted_id[accepted] = master['reprisk_id'].to_numpy()[match_index[accepted].astype(int)]
+
+    result = score_matches(pairs, predicted_id)
+    result['fit_seconds'] = fit_seconds
+    result['match_seconds'] = match_seconds
+    result['names_per_second'] = len(pairs) / match_seconds if match_seconds > 0 else np.nan
+    return result
+
+
+def run_benchmark(pairs, master, configs=None, recall_target=0.9, batch_size=100, **threshold_kwargs):
+    """
+    The `run_benchmark` function has been designed to run `evaluate_matcher_config` for each matcher configuration of
+    `configs` (by default `MATCHER_CONFIGS`) on the same labeled pairs and master data.
+
+    The function returns a DataFrame indexed by configuration name with the precision, recall and names per second of each
+    configuration, a `meets_recall_target` flag, and sorted from the fastest to the slowest configuration.
+    """
+    configs = MATCHER_CONFIGS if configs is None else configs
+
+    results = {}
+    for name, config_params in configs.items():
+        print(f"Evaluating name matcher configuration {name}")
+        results[name] = evaluate_matcher_config(pairs, master, config_params=config_params, batch_size=batch_size,
+                                                **threshold_kwargs)
+
+    df = pd.DataFrame.from_dict(results, orient='index')
+    df.index.name = 'config'
+    df['meets_recall_target'] = df['recall'] >= recall_target
+    return df.sort_values('names_per_second', ascending=False)
+
+
+def cheapest_config(results, recall_target=0.9):
+    """
+    The `cheapest_config` function returns the name of the configuration with the highest throughput among the ones whose
+    recall is at least `recall_target`, or None if no configuration meets it.
+    """
+    eligible = results[results['recall'] >= recall_target]
+    if eligible.empty:
+        return None
+    return eligible['names_per_second'].idxmax()
+
+
+if __name__ == "__main__":
+    from load_markit import load_Markit
+    from load_reprisk import pull_RepRisk_company
+
+    file_path = DATA_DIR / "pulled" / "reprisk_company.parquet"
+    if file_path.exists():
+        reprisk_company = pd.read_parquet(file_path)
+    else:
+        reprisk_company = pull_RepRisk_company()
+        reprisk_company.to_parquet(file_path)
+
+    markit_company = load_Markit(data_dir=DATA_DIR, from_cache=True, save_cache=True)[['isin', 'instrumentname']]
+
+    pairs = build_labeled_pairs(markit_company, reprisk_company, sample_size=2000)
+    master = build_master_data(reprisk_company)
+
+    results = run_benchmark(pairs, master, recall_target=0.9)
+    print(results)
+    print(f"Cheapest configuration with a recall of at least 90%: {cheapest_config(results, recall_target=0.9)}")
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    results.to_parquet(OUTPUT_DIR / "name_matching_benchmark.parquet")
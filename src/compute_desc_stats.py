@@ -4,13 +4,50 @@ ESG (Environmental, Social, and Governance) scores. It includes functionality to
 compute descriptive statistics for lending indicators across different ESG dimensions, and store the results in a 
 specified output directory. The primary goal is to facilitate the examination of the relationship between lending 
 behaviors and ESG metrics.
+
+The statistics are computed by `describe_by_groups`, a fused engine producing the same table as
+`df.groupby(i)[j].describe(percentiles=...)` for every ESG dimension i and lending indicator j. Each lending indicator is
+sorted by (group, value), either on the few rows with an ESG value or, for densely populated dimensions, by a stable sort
+of the group codes of the indicator sorted once; the count, mean, std, min, max and all the percentiles of every group are
+then read from the sorted array with vectorized operations. The ESG dimensions are independent and can be processed on
+several threads (NumPy releases the GIL while sorting).
+
+`describe_partitions` computes the same tables from a sequence of partitions of the data (e.g. one year at a time) with
+bounded memory, using the mergeable aggregates of the `sketches` module: the count, mean, std, min and max are exact and
+the percentiles come with a guaranteed rank error bound.
+
+`sketch_year_partition` keeps these aggregates on disk for one yearly partition of the merged data (see
+`merge_markit_crsp_reprisk.write_year_partitions`), and `compute_desc_stats_from_year_sketches` merges the aggregates of
+all the years into the statistics. They are used instead of `compute_desc_stats` when the `INCREMENTAL_STATS` setting is
+on, `dodo.py` summarizing again only the years whose partition changed. `compute_desc_stats_incremental` keeps the
+aggregates of the whole data along with the last date they include, so that a refresh after new days of data only folds
+in the new rows and rewrites the affected outputs.
+
+Besides one .parquet file per (lending indicator, ESG dimension, horizon) in the `stats` folder of the output directory,
+the statistics are written to a consolidated dataset, `stats_dataset/desc_stats`, with one row per (indicator, dimension,
+bucket) and one partition `horizon={h}` per horizon (0 for the levels). `read_stats_dataset` reads all the statistics
+in one scan, and `stats_table` returns the table of one (indicator, dimension, horizon) from them.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import pickle
 import config
-from src import misc_tools
+import grouped_kernels
+import misc_tools
+import sketches
+from trading_calendar import load_trading_calendar
+
+LENDING_INDICATORS = config.LENDING_INDICATORS
+ESG = ['severity', 'novelty', 'reach', 'environment', 'social', 'governance']
+# ESG columns of the merged data with the incidents aggregated per day (see `aggregate_daily_incidents`)
+ESG_DAILY = ['severity_max', 'novelty_max', 'reach_max', 'environment_any', 'social_any', 'governance_any']
+PERCENTILES = [.1, .25, .5, .75, .9]
+STATS_DATASET = Path("stats_dataset") / "desc_stats"
+YEAR_SKETCHES_DIR = Path("stats_state") / "desc_stats_sketches"
 
 
 def read_data(file_name, data_dir=config.DATA_DIR):
@@ -25,60 +62,419 @@ def read_data(file_name, data_dir=config.DATA_DIR):
     return df
 
 
-def compute_desc_stats(df):
+def _percentile_label(q):
+    """
+    Returns the label of a percentile as in `pandas.DataFrame.describe` (e.g. 0.1 -> '10%').
+    """
+    return f"{q * 100:g}%"
+
+
+def _describe_group_codes(codes, values, n_groups, percentiles, values_sorted=False):
+    """
+    Computes the descriptive statistics of every group from the group code (-1 for rows without group) and the value of
+    every row.
+
+    The values are sorted by (group, value), the count, mean, std, min, percentiles and max of every group are then read
+    from the sorted array with vectorized operations. If `values_sorted` is True, the values are already sorted. The
+    percentiles use the linear interpolation of `numpy.percentile`, so that the result is the one of `describe`.
+    """
+    rows, starts, counts = grouped_kernels.sort_by_group_and_value(codes, values, n_groups, values_sorted=values_sorted)
+    values, value_codes = values[rows], codes[rows]
+    has_values = counts > 0
+    safe_counts = np.where(has_values, counts, 1)
+    last = starts + safe_counts - 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(value_codes, weights=values, minlength=n_groups) / counts
+        squared_deviations = np.bincount(value_codes, weights=(values - mean[value_codes]) ** 2, minlength=n_groups)
+        std = np.sqrt(squared_deviations / (counts - 1))
+    std[counts <= 1] = np.nan
+
+    # Empty groups point to the padding NaN
+    padded = np.r_[values, np.nan]
+    starts = np.where(has_values, starts, len(values))
+    last = np.where(has_values, last, len(values))
+
+    stats = {
+        'count': counts.astype(np.float64),
+        'mean': mean,
+        'std': std,
+        'min': padded[starts],
+    }
+    for q in percentiles:
+        # `describe` passes the percentiles to `numpy.percentile` in percent
+        stats[_percentile_label(q)] = grouped_kernels.sorted_group_quantile(values, starts, counts, (q * 100) / 100)
+    stats['max'] = padded[last]
+    return stats
+
+
+def _sorted_values(values):
+    """
+    Returns the non-missing values sorted in increasing order and their row numbers.
+    """
+    rows = np.flatnonzero(~np.isnan(values))
+    order = np.argsort(values[rows])
+    return values[rows][order], rows[order]
+
+
+def describe_by_groups(df, by=ESG, columns=LENDING_INDICATORS, percentiles=PERCENTILES, n_jobs=1, dense_fraction=0.25):
+    """
+    Computes, in one pass, the descriptive statistics of every column of `columns` grouped by every column of `by`.
+
+    The function returns a dictionary mapping each (group column, column) pair to the DataFrame of
+    `df.groupby(group column)[column].describe(percentiles=percentiles)`: groups sorted in increasing order, rows with a
+    missing group dropped, and the count, mean, std, min, percentiles and max of the non-missing values of each group.
+    The numbers are equal to the ones of `describe` up to floating point rounding in the sums.
+
+    Group columns with a group on less than `dense_fraction` of the rows (e.g. the incident columns of the merged data)
+    only sort the values of those rows. For the other group columns, each column of `columns` is sorted once over the whole
+    frame and shared. With `n_jobs` > 1, the group columns are processed in parallel on `n_jobs` threads.
+    """
+    percentiles = sorted(percentiles)
+    values = {column: df[column].to_numpy(dtype=np.float64) for column in columns}
+
+    groups = {}
+    for group_col in by:
+        codes, uniques = pd.factorize(df[group_col], sort=True)
+        # Let pandas infer the type of the groups (e.g. booleans stored in an object column), as `groupby` does
+        groups[group_col] = (codes, pd.Index(uniques.tolist(), name=group_col))
+
+    dense = [group_col for group_col in by if (groups[group_col][0] >= 0).sum() > dense_fraction * len(df)]
+    sorted_columns = {column: _sorted_values(values[column]) for column in columns} if dense else {}
+
+    def describe_one(group_col):
+        codes, index = groups[group_col]
+        if group_col not in dense:
+            rows = np.flatnonzero(codes >= 0)
+            codes = codes[rows]
+
+        results = {}
+        for column in columns:
+            if group_col in dense:
+                column_values, column_rows = sorted_columns[column]
+                stats = _describe_group_codes(codes[column_rows], column_values, len(index), percentiles,
+                                              values_sorted=True)
+            else:
+                stats = _describe_group_codes(codes, values[column][rows], len(index), percentiles)
+            results[(group_col, column)] = pd.DataFrame(stats, index=index)
+        return results
+
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            partial_results = list(executor.map(describe_one, by))
+    else:
+        partial_results = [describe_one(group_col) for group_col in by]
+
+    results = {}
+    for partial_result in partial_results:
+        results.update(partial_result)
+    return results
+
+
+def describe_partitions(partitions, by=ESG, columns=LENDING_INDICATORS, percentiles=PERCENTILES, n_jobs=1,
+                        k=sketches.SKETCH_SIZE):
+    """
+    Computes the descriptive statistics of `describe_by_groups` over a sequence of partitions of the data, holding only
+    one partition per thread and the small aggregates of `sketches.sketch_by_groups` in memory.
+
+    `partitions` are DataFrames or paths to .parquet files (read with only the needed columns). Each partition is summarized
+    independently, on `n_jobs` threads if `n_jobs` > 1, and the summaries are merged. The count, mean, std, min and max are
+    the exact ones; the percentiles are approximate, within the rank error bound reported in the `rank_error` column
+    (exact for groups with at most `k` values).
+    """
+    def sketch_partition(partition):
+        if not isinstance(partition, pd.DataFrame):
+            partition = pd.read_parquet(partition, columns=list(dict.fromkeys([*by, *columns])))
+        return sketches.sketch_by_groups(partition, by=by, columns=columns, k=k)
+
+    merged = {}
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            for partial_sketches in executor.map(sketch_partition, partitions):
+                merged = sketches.merge_group_sketches(merged, partial_sketches)
+    else:
+        for partition in partitions:
+            merged = sketches.merge_group_sketches(merged, sketch_partition(partition))
+
+    return sketches.describe_from_sketches(merged, percentiles)
+
+
+def stats_to_long(stats):
+    """
+    Returns the tables of `stats`, a dictionary mapping (ESG dimension, lending indicator) to a table indexed by bucket, as
+    one long DataFrame with the `indicator`, the `dimension` and the `bucket` of every row. The buckets (ESG values) are
+    stored as floats along with the dtype of their index, `bucket_dtype`, so that `stats_table` restores them as they were.
+    """
+    tables = []
+    for (dimension, indicator), table in stats.items():
+        table = table.drop(columns=['rank_error'], errors='ignore')
+        keys = pd.DataFrame({'indicator': indicator, 'dimension': dimension,
+                             'bucket': table.index.to_numpy(dtype=np.float64), 'bucket_dtype': str(table.index.dtype)})
+        tables.append(pd.concat([keys, table.reset_index(drop=True)], axis=1))
+    return pd.concat(tables, ignore_index=True)
+
+
+def write_stats_dataset(stats, horizon=0, output_dir=config.OUTPUT_DIR, update=False, dataset=STATS_DATASET):
+    """
+    The `write_stats_dataset` function writes the tables of `stats` (see `stats_to_long`) to the `horizon={horizon}`
+    partition of the consolidated statistics dataset of the output directory (or of `dataset`). With `update=True`, only
+    the (indicator, dimension) pairs of `stats` are replaced and the other rows of the partition are kept; otherwise the
+    partition is rewritten. The partition is written to a temporary file first, so that readers never see a partial file.
+    """
+    partition = Path(output_dir) / dataset / f"horizon={horizon}"
+    partition.mkdir(parents=True, exist_ok=True)
+    file_path = partition / "part-0.parquet"
+    long_stats = stats_to_long(stats)
+
+    if update and file_path.exists():
+        existing = pd.read_parquet(file_path)
+        replaced = pd.MultiIndex.from_frame(long_stats[['indicator', 'dimension']].drop_duplicates())
+        kept = ~pd.MultiIndex.from_frame(existing[['indicator', 'dimension']]).isin(replaced)
+        long_stats = pd.concat([existing[kept], long_stats], ignore_index=True)
+
+    temporary_path = file_path.with_suffix('.tmp')
+    long_stats.to_parquet(temporary_path, index=False)
+    temporary_path.replace(file_path)
+    return file_path
+
+
+def read_stats_dataset(output_dir=config.OUTPUT_DIR, horizons=None, indicators=None, dimensions=None,
+                       dataset=STATS_DATASET):
+    """
+    The `read_stats_dataset` function reads the consolidated statistics dataset of the output directory (or `dataset`) in
+    one scan, optionally only the partitions of `horizons`, and returns the long DataFrame of the statistics with their
+    `horizon`, filtered on `indicators` and `dimensions` if given.
+    """
+    filters = None if horizons is None else [('horizon', 'in', [int(h) for h in horizons])]
+    long_stats = pd.read_parquet(Path(output_dir) / dataset, filters=filters)
+    long_stats['horizon'] = long_stats['horizon'].astype(np.int64)
+    if indicators is not None:
+        long_stats = long_stats[long_stats['indicator'].isin(indicators)]
+    if dimensions is not None:
+        long_stats = long_stats[long_stats['dimension'].isin(dimensions)]
+    return long_stats.reset_index(drop=True)
+
+
+def stats_table(long_stats, indicator, dimension, horizon=0):
+    """
+    Returns the table of the statistics of `indicator` by bucket of `dimension` at `horizon` from the long DataFrame of
+    `read_stats_dataset`, indexed by bucket (with the dtype of the original index) as the tables of `describe_by_groups`.
+    """
+    rows = ((long_stats['indicator'] == indicator) & (long_stats['dimension'] == dimension)
+            & (long_stats['horizon'] == horizon))
+    table = long_stats[rows].drop(columns=['indicator', 'dimension', 'horizon'])
+    dtype = table['bucket_dtype'].iloc[0] if len(table) else 'float64'
+    table = table.drop(columns=['bucket_dtype']).set_index('bucket')
+    table.index = table.index.astype(dtype)
+    table.index.name = dimension
+    return table
+
+
+def compute_desc_stats(df, lending_indicators=LENDING_INDICATORS, esg=ESG, output_dir=config.OUTPUT_DIR):
     """
     Computes descriptive statistics for specified lending indicators across different ESG (Environmental, Social,
     and Governance) score categories and saves the results to .parquet files in the output directory.
 
     This function specifically calculates the descriptive statistics, including percentiles, for combinations
-    of lending indicators and ESG scores, facilitating the analysis of their relationships.
+    of lending indicators and ESG scores, facilitating the analysis of their relationships. Use `esg=ESG_DAILY` on
+    the merged data with the incidents aggregated per day. The statistics are also written to the `horizon=0` partition
+    of the consolidated statistics dataset (see `write_stats_dataset`).
     """
-    lending_indicators = ['short interest ratio', 'loan supply ratio', 'loan utilisation ratio', 'loan fee']
-    esg = ['severity', 'novelty', 'reach', 'environment', 'social', 'governance']
+    stats = describe_by_groups(df, by=esg, columns=lending_indicators, percentiles=PERCENTILES)
 
     for i in esg:
         for j in lending_indicators:
-            file_path = Path(config.OUTPUT_DIR) / "stats" / f"{j + '_' + i}.parquet"
-            df.groupby(i)[j].describe(percentiles=[.1, .25, .5, .75, .9]).to_parquet(file_path)
+            file_path = Path(output_dir) / "stats" / f"{j + '_' + i}.parquet"
+            stats[(i, j)].to_parquet(file_path)
+    _ = write_stats_dataset(stats, horizon=0, output_dir=output_dir)
 
     return df
 
-def compute_des_stats_change_days_ahead(df, days=7):
+def compute_desc_stats_incremental(df, lending_indicators=LENDING_INDICATORS, esg=ESG, output_dir=config.OUTPUT_DIR,
+                                   date_col='date', k=sketches.SKETCH_SIZE):
+    """
+    Incremental version of `compute_desc_stats`: the aggregates of `sketches.sketch_by_groups` are kept in
+    `stats_state/desc_stats_state.pkl` of the output directory, with the last date they include (the watermark).
+
+    Without a saved state (or with a state computed for other columns), the statistics are computed from all the rows of
+    `df` by `compute_desc_stats` and the state is saved. Otherwise, only the rows dated after the watermark are summarized
+    and merged into the state, and only the outputs of the (ESG dimension, lending indicator) pairs with new values are
+    rewritten. Their count, mean, std, min and max are exact and their percentiles come from the sketches (see the
+    `sketches` module for the error bound). Rows added for dates already covered by the watermark are not picked up.
+
+    The rows of these pairs are also replaced in the `horizon=0` partition of the consolidated statistics dataset. The
+    function returns the list of the .parquet files written in the `stats` folder.
+    """
+    state_path = Path(output_dir) / "stats_state" / "desc_stats_state.pkl"
+    state = None
+    if state_path.exists():
+        with open(state_path, 'rb') as f:
+            state = pickle.load(f)
+        if (state['lending_indicators'], state['esg'], state['k']) != (list(lending_indicators), list(esg), k):
+            state = None
+
+    if state is None:
+        new_rows = df
+        state = {'lending_indicators': list(lending_indicators), 'esg': list(esg), 'k': k, 'sketches': {}}
+    else:
+        new_rows = df[df[date_col] > state['watermark']]
+    if len(new_rows) == 0:
+        return []
+
+    new_sketches = sketches.sketch_by_groups(new_rows, by=esg, columns=lending_indicators, k=k)
+    first_run = not state['sketches']
+    if not first_run:
+        affected = [key for key, groups in new_sketches.items()
+                    if any(moments.count > 0 for moments, _ in groups.values())]
+        stats = sketches.describe_from_sketches(
+            {key: groups for key, groups in sketches.merge_group_sketches(state['sketches'], new_sketches).items()
+             if key in affected},
+            PERCENTILES
+        )
+    else:
+        state['sketches'] = new_sketches
+        stats = describe_by_groups(df, by=esg, columns=lending_indicators, percentiles=PERCENTILES)
+        affected = list(stats)
+
+    written = []
+    for i, j in affected:
+        file_path = Path(output_dir) / "stats" / f"{j + '_' + i}.parquet"
+        stats[(i, j)].drop(columns=['rank_error'], errors='ignore').to_parquet(file_path)
+        written.append(file_path)
+    # A first run rewrites the whole partition of the consolidated dataset
+    _ = write_stats_dataset({key: stats[key] for key in affected}, horizon=0, output_dir=output_dir,
+                            update=not first_run)
+
+    state['watermark'] = max(state.get('watermark', new_rows[date_col].max()), new_rows[date_col].max())
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    # Written to a temporary file first, so that an interrupted run never leaves a truncated state
+    temporary_path = state_path.with_suffix('.tmp')
+    with open(temporary_path, 'wb') as f:
+        pickle.dump(state, f)
+    temporary_path.replace(state_path)
+    return written
+
+
+def year_sketches_path(year, output_dir=config.OUTPUT_DIR):
+    """
+    Returns the path of the aggregates of the partition of `year` (see `sketch_year_partition`).
+    """
+    return Path(output_dir) / YEAR_SKETCHES_DIR / f"year={year}.pkl"
+
+
+def sketch_year_partition(partition_path, year, lending_indicators=LENDING_INDICATORS, esg=ESG,
+                          output_dir=config.OUTPUT_DIR, k=sketches.SKETCH_SIZE):
+    """
+    Summarizes the yearly partition of the merged data at `partition_path` by the aggregates of
+    `sketches.sketch_by_groups`, reading only the needed columns, and saves them to `year_sketches_path(year)` along with
+    the columns they were computed for. Returns the path of the aggregates.
+    """
+    df = pd.read_parquet(partition_path, columns=list(dict.fromkeys([*esg, *lending_indicators])))
+    state = {'lending_indicators': list(lending_indicators), 'esg': list(esg), 'k': k,
+             'sketches': sketches.sketch_by_groups(df, by=esg, columns=lending_indicators, k=k)}
+
+    file_path = year_sketches_path(year, output_dir=output_dir)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    # Written to a temporary file first, so that an interrupted run never leaves a truncated file
+    temporary_path = file_path.with_suffix('.tmp')
+    with open(temporary_path, 'wb') as f:
+        pickle.dump(state, f)
+    temporary_path.replace(file_path)
+    return file_path
+
+
+def compute_desc_stats_from_year_sketches(years, lending_indicators=LENDING_INDICATORS, esg=ESG,
+                                          output_dir=config.OUTPUT_DIR, k=sketches.SKETCH_SIZE):
+    """
+    Merges the aggregates of the partitions of `years` (see `sketch_year_partition`) into the descriptive statistics of
+    `compute_desc_stats`, and writes them to the same .parquet files and to the `horizon=0` partition of the consolidated
+    statistics dataset. The count, mean, std, min and max are exact and the percentiles come from the sketches (see the
+    `sketches` module for the error bound). Raises a ValueError if the aggregates of a year were computed for other
+    columns.
+    """
+    merged = {}
+    for year in years:
+        with open(year_sketches_path(year, output_dir=output_dir), 'rb') as f:
+            state = pickle.load(f)
+        if (state['lending_indicators'], state['esg'], state['k']) != (list(lending_indicators), list(esg), k):
+            raise ValueError(f"The aggregates of {year} were computed for other columns, summarize the year again")
+        merged = sketches.merge_group_sketches(merged, state['sketches'])
+    stats = sketches.describe_from_sketches(merged, PERCENTILES)
+
+    for i in esg:
+        for j in lending_indicators:
+            file_path = Path(output_dir) / "stats" / f"{j + '_' + i}.parquet"
+            stats[(i, j)].drop(columns=['rank_error'], errors='ignore').to_parquet(file_path)
+    _ = write_stats_dataset(stats, horizon=0, output_dir=output_dir)
+    return stats
+
+
+def compute_des_stats_change_days_ahead(df, days=7, lending_indicators=LENDING_INDICATORS, esg=ESG, calendar=None,
+                                        output_dir=config.OUTPUT_DIR):
     """
     Computes descriptive statistics for the change in specified lending indicators across different ESG (Environmental, Social,
     and Governance) score categories and saves the results to .parquet files in the output directory. The change is calculated on a specified number of days ahead.
 
     This function specifically calculates the descriptive statistics, including percentiles, for combinations
-    of change in lending indicators and ESG scores, facilitating the analysis of their relationships.
+    of change in lending indicators and ESG scores, facilitating the analysis of their relationships. The statistics are
+    also written to the `horizon={days}` partition of the consolidated statistics dataset.
+    """
+    return compute_des_stats_change_horizons(df, horizons=[days], lending_indicators=lending_indicators, esg=esg,
+                                             calendar=calendar, output_dir=output_dir)
+
+
+def compute_des_stats_change_horizons(df, horizons=[5, 26], lending_indicators=LENDING_INDICATORS, esg=ESG,
+                                      calendar=None, output_dir=config.OUTPUT_DIR):
     """
-    lending_indicators = ['short interest ratio', 'loan supply ratio', 'loan utilisation ratio', 'loan fee']
-    esg = ['severity', 'novelty', 'reach', 'environment', 'social', 'governance']
+    Same as `compute_des_stats_change_days_ahead` for several numbers of days ahead at once: the values of the lending
+    indicators at every horizon are computed in a single pass by `misc_tools.with_multi_horizon_lagged_columns`.
 
-    df_change = misc_tools.with_lagged_columns(
-        data=df,
+    By default, days are the distinct dates of the data. With a `calendar` (see `trading_calendar.load_trading_calendar`),
+    days are the trading days of that calendar, and the rows dated on other days (holidays, or outside of the calendar)
+    are left out of the statistics of the changes. The statistics of every horizon are also written to its partition of the
+    consolidated statistics dataset, under the names of the lending indicators.
+    """
+    rows = df if calendar is None else df[calendar.is_trading_day(df['date'])]
+    df_change = misc_tools.with_multi_horizon_lagged_columns(
+        data=rows,
         columns_to_lag=lending_indicators,
         id_columns=['cusip'],
-        lags=-days,
+        lags=[-days for days in horizons],
         date_col='date',
-        prefix='L'
+        prefix='L',
+        day_numbers=None if calendar is None else calendar.day_numbers(rows['date'])
     )
 
-    for j in lending_indicators:
-        df_change[f'{j}_change'] = df_change[f'L-{days}_{j}'] - df_change[j]
-
-    for i in esg:
+    for days in horizons:
         for j in lending_indicators:
-            file_path = Path(config.OUTPUT_DIR) / "stats" / f"{j + '_' + i + '_change_' + str(days)}.parquet"
-            df_change.groupby(i)[f'{j}_change'].describe(percentiles=[.1, .25, .5, .75, .9]).to_parquet(file_path)
+            df_change[f'{j}_change_{days}'] = df_change[f'L-{days}_{j}'] - df_change[j]
+
+        change_columns = [f'{j}_change_{days}' for j in lending_indicators]
+        stats = describe_by_groups(df_change, by=esg, columns=change_columns, percentiles=PERCENTILES)
+
+        for i in esg:
+            for j in lending_indicators:
+                file_path = Path(output_dir) / "stats" / f"{j + '_' + i + '_change_' + str(days)}.parquet"
+                stats[(i, f'{j}_change_{days}')].to_parquet(file_path)
+        _ = write_stats_dataset({(i, j): stats[(i, f'{j}_change_{days}')] for i in esg for j in lending_indicators},
+                                horizon=days, output_dir=output_dir)
 
     return df
 
 
 if __name__ == '__main__':
-    # read the .parquet file in the data directory
-    df = read_data("merged_data")
+    # read the .parquet file in the data directory, with the incidents aggregated per day if set
+    if config.DAILY_INCIDENT_STATS:
+        df, esg = read_data("merged_data_daily"), ESG_DAILY
+    else:
+        df, esg = read_data("merged_data"), ESG
 
-    # Compute the descriptive statistics and store them in the data directory as .csv files
-    _ = compute_desc_stats(df)
-    _ = compute_des_stats_change_days_ahead(df, 5)  # 1 week ahead change
-    _ = compute_des_stats_change_days_ahead(df, 26)  # 1 month ahead change
+    # Compute the descriptive statistics and store them in the output directory as .parquet files
+    if config.INCREMENTAL_STATS:
+        # From the aggregates of the yearly partitions of the data, summarized beforehand (see `dodo.py`)
+        _ = compute_desc_stats_from_year_sketches(config.YEARS, esg=esg)
+    else:
+        _ = compute_desc_stats(df, esg=esg)
+    # 1 week and 1 month ahead changes, in trading days of the shared calendar if set
+    calendar = load_trading_calendar() if config.TRADING_DAY_HORIZONS else None
+    _ = compute_des_stats_change_horizons(df, config.CHANGE_HORIZONS, esg=esg, calendar=calendar)
@@ -24,6 +24,30 @@ WRDS_USERNAME = config("WRDS_USERNAME", default="")
 START_DATE = config("START_DATE", default="2022-01-01")
 END_DATE = config("END_DATE", default="2024-01-01")
 
+# Lending indicators of the Markit data studied across the project
+LENDING_INDICATORS = ['short interest ratio', 'loan supply ratio', 'loan utilisation ratio', 'loan fee']
+
+# Years of the sample, one partition of the merged data per year (see `write_year_partitions`)
+YEARS = list(range(int(START_DATE[:4]), int(END_DATE[:4]) + 1))
+
+# Build the descriptive statistics of the levels from the mergeable aggregates of every year of the merged data, so that a
+# refresh only summarizes the years whose rows changed (see `compute_desc_stats_from_year_sketches`)
+INCREMENTAL_STATS = config("INCREMENTAL_STATS", default=False, cast=bool)
+
+# Compute the descriptive statistics on the merged data with the incidents aggregated per day (`merged_data_daily`, one
+# row per Markit observation, see `aggregate_daily_incidents`) instead of the merged data with one row per incident
+DAILY_INCIDENT_STATS = config("DAILY_INCIDENT_STATS", default=False, cast=bool)
+
+# Horizons, in days, of the changes of the lending indicators described in the report (1 week and 1 month ahead)
+CHANGE_HORIZONS = [5, 26]
+
+# Count the horizons of the changes of the descriptive statistics in NYSE trading days (see `trading_calendar`) instead
+# of distinct dates of the data, leaving out the rows dated on other days
+TRADING_DAY_HORIZONS = config("TRADING_DAY_HORIZONS", default=False, cast=bool)
+
+# Maximum number of points per plotted series, longer series being downsampled (see `downsampling`)
+PLOT_MAX_POINTS = config("PLOT_MAX_POINTS", default=2000, cast=int)
+
 if __name__ == "__main__":
     
     ## If they don't exist, create the data and output directories
@@ -0,0 +1,163 @@
+"""
+The `cross_correlation.py` module has been designed to find at which lead or lag the RepRisk indices (`current_rri`,
+`trend_rri`) co-move with the lending indicators, for every security at once.
+
+The module contains the following functions:
+    * pack_series - Packs the series of every security into a padded (security, date, column) array with a mask.
+    * lagged_cross_correlation - Pearson correlations of two packed series at every lag, for all securities at once.
+    * cross_correlation_table - Tidy table of the lagged correlations of every security and pair of columns.
+    * rolling_correlation - Rolling-window correlation of two columns within every security.
+
+The series of all the securities are aligned on the dates of the panel into 2-D arrays (one row per security), missing
+observations being zeros with a zero mask. The correlation at lag l only uses the dates where both series are observed,
+so it needs, for every security and lag, the number of such pairs and the sums of x, y, x^2, y^2 and xy over them. Each
+of these is a cross-correlation of two masked arrays, computed at all the lags and for all the securities at once with
+one batched real FFT along the date axis.
+"""
+
+import numpy as np
+import pandas as pd
+
+import config
+
+RRI_COLUMNS = ['current_rri', 'trend_rri']
+CORRELATED_COLUMNS = ['loan fee', 'loan utilisation ratio']
+
+
+def pack_series(df, columns, id_col='cusip', date_col='date'):
+    """
+    The `pack_series` function returns the index of the securities, the index of the dates, the array of shape (number of
+    securities, number of dates, number of columns) of the values of `columns` (0 where missing) and the boolean array of
+    the observed values. The (security, date) pairs are expected to be unique; the first row is used otherwise.
+    """
+    id_codes, ids = pd.factorize(df[id_col], sort=True)
+    date_codes, dates = pd.factorize(df[date_col], sort=True)
+    values = np.zeros((len(ids), len(dates), len(columns)))
+    observed = np.zeros((len(ids), len(dates), len(columns)), dtype=bool)
+
+    # The first row of every (security, date) pair is written last, so that it is the one kept
+    rows = np.arange(len(df))[::-1]
+    for k, col in enumerate(columns):
+        column = df[col].to_numpy(dtype=np.float64)[rows]
+        values[id_codes[rows], date_codes[rows], k] = np.nan_to_num(column)
+        observed[id_codes[rows], date_codes[rows], k] = ~np.isnan(column)
+    return pd.Index(ids, name=id_col), pd.Index(dates, name=date_col), values, observed
+
+
+def _cross_correlate(a, b, n_fft, max_lag):
+    """
+    Returns c[:, l] = sum_t a[:, t] b[:, t + l] for l from -max_lag to max_lag, for every row of the 2-D arrays a and b.
+    """
+    c = np.fft.irfft(np.conj(np.fft.rfft(a, n_fft, axis=1)) * np.fft.rfft(b, n_fft, axis=1), n_fft, axis=1)
+    return np.concatenate([c[:, n_fft - max_lag:], c[:, :max_lag + 1]], axis=1)
+
+
+def lagged_cross_correlation(x, x_observed, y, y_observed, max_lag=20, min_periods=20):
+    """
+    The `lagged_cross_correlation` function returns the Pearson correlation between x at date t and y at date t + l of
+    every row (security) of the 2-D arrays `x` and `y`, for every lag l from -max_lag to max_lag, using the dates where
+    both are observed. A positive lag means that x leads y.
+
+    The function returns the arrays of shape (number of securities, 2 max_lag + 1) of the correlations (NaN with less than
+    `min_periods` pairs or without variation) and of the numbers of pairs, and the lags.
+    """
+    n_dates = x.shape[1]
+    max_lag = min(max_lag, n_dates - 1)
+    n_fft = 1 << int(np.ceil(np.log2(max(n_dates + max_lag, 1))))
+    x_mask, y_mask = x_observed.astype(np.float64), y_observed.astype(np.float64)
+    x, y = np.where(x_observed, x, 0.), np.where(y_observed, y, 0.)
+
+    # Center each series on its mean, so that the sums of squares do not lose precision
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = np.where(x_observed, x - np.nan_to_num(x.sum(axis=1) / x_mask.sum(axis=1))[:, None], 0.)
+        y = np.where(y_observed, y - np.nan_to_num(y.sum(axis=1) / y_mask.sum(axis=1))[:, None], 0.)
+
+    n = np.rint(_cross_correlate(x_mask, y_mask, n_fft, max_lag))
+    sum_x = _cross_correlate(x, y_mask, n_fft, max_lag)
+    sum_y = _cross_correlate(x_mask, y, n_fft, max_lag)
+    sum_xx = _cross_correlate(x ** 2, y_mask, n_fft, max_lag)
+    sum_yy = _cross_correlate(x_mask, y ** 2, n_fft, max_lag)
+    sum_xy = _cross_correlate(x, y, n_fft, max_lag)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = n * sum_xy - sum_x * sum_y
+        variance_x = np.maximum(n * sum_xx - sum_x ** 2, 0.)
+        variance_y = np.maximum(n * sum_yy - sum_y ** 2, 0.)
+        scale = np.maximum(n * np.maximum(sum_xx, sum_yy), 1e-300)
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+    # Variances that are only FFT rounding errors mean constant series
+    correlation[(n < max(min_periods, 2)) | (variance_x < 1e-10 * scale) | (variance_y < 1e-10 * scale)] = np.nan
+    return np.clip(correlation, -1., 1.), n.astype(np.int64), np.arange(-max_lag, max_lag + 1)
+
+
+def cross_correlation_table(df, x_columns=RRI_COLUMNS, y_columns=CORRELATED_COLUMNS, max_lag=20, min_periods=20,
+                            id_col='cusip', date_col='date'):
+    """
+    The `cross_correlation_table` function returns the tidy table of the lagged correlations (see
+    `lagged_cross_correlation`) of every column of `x_columns` with every column of `y_columns`, for every security: one
+    row per security, pair of columns and lag, with the `corr` and the number of pairs `n`.
+    """
+    columns = list(dict.fromkeys([*x_columns, *y_columns]))
+    ids, _, values, observed = pack_series(df, columns, id_col=id_col, date_col=date_col)
+
+    tables = []
+    for x_col in x_columns:
+        for y_col in y_columns:
+            i, j = columns.index(x_col), columns.index(y_col)
+            correlation, n, lags = lagged_cross_correlation(values[:, :, i], observed[:, :, i], values[:, :, j],
+                                                            observed[:, :, j], max_lag=max_lag, min_periods=min_periods)
+            tables.append(pd.DataFrame({
+                id_col: np.repeat(ids.to_numpy(), len(lags)),
+                'x': x_col,
+                'y': y_col,
+                'lag': np.tile(lags, len(ids)),
+                'corr': correlation.ravel(),
+                'n': n.ravel(),
+            }))
+    return pd.concat(tables, ignore_index=True)
+
+
+def rolling_correlation(df, x_col, y_col, window=63, min_periods=None, id_col='cusip', date_col='date'):
+    """
+    The `rolling_correlation` function returns, for every row of `df`, the Pearson correlation of `x_col` and `y_col` over
+    the `window` dates of the panel ending at the date of the row, within its security, using the dates where both are
+    observed (NaN with less than `min_periods` pairs, by default `window`).
+    """
+    ids, dates, values, observed = pack_series(df, [x_col, y_col], id_col=id_col, date_col=date_col)
+    both = observed[:, :, 0] & observed[:, :, 1]
+    x, y = np.where(both, values[:, :, 0], 0.), np.where(both, values[:, :, 1], 0.)
+    # Centered on the mean of the security, for the precision of the differences of cumulative sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = np.where(both, x - np.nan_to_num(x.sum(axis=1) / both.sum(axis=1))[:, None], 0.)
+        y = np.where(both, y - np.nan_to_num(y.sum(axis=1) / both.sum(axis=1))[:, None], 0.)
+
+    n_dates = x.shape[1]
+    sums = []
+    for a in (both.astype(np.float64), x, y, x ** 2, y ** 2, x * y):
+        # Cumulative sums along the dates, with window zeros in front so that every window is a difference of two
+        cumulative = np.cumsum(np.concatenate([np.zeros((len(ids), window)), a], axis=1), axis=1)
+        sums.append(cumulative[:, window:] - cumulative[:, :n_dates])
+    n, sum_x, sum_y, sum_xx, sum_yy, sum_xy = sums
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = (n * sum_xy - sum_x * sum_y) / np.sqrt(np.maximum(n * sum_xx - sum_x ** 2, 0.)
+                                                             * np.maximum(n * sum_yy - sum_y ** 2, 0.))
+    correlation[np.rint(n) < (window if min_periods is None else max(min_periods, 2))] = np.nan
+
+    id_codes = ids.get_indexer(df[id_col])
+    date_codes = dates.get_indexer(df[date_col])
+    return pd.Series(np.clip(correlation[id_codes, date_codes], -1., 1.), index=df.index,
+                     name=f'{x_col}_{y_col}_corr_{window}')
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from compute_desc_stats import read_data
+
+    df = read_data("merged_data").drop_duplicates(subset=['cusip', 'date'])
+    table = cross_correlation_table(df)
+    # Outside of the `stats` folder, whose tables are all converted to LaTeX
+    output_dir = Path(config.OUTPUT_DIR) / "cross_correlation"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    table.to_parquet(output_dir / "rri_cross_correlations.parquet")
@@ -0,0 +1,96 @@
+"""
+The `cross_section.py` module has been designed to make the lending indicators comparable across stocks, with per-date
+cross-sectional transforms: percentile ranks, z-scores and winsorization.
+
+The module contains the following functions:
+    * sort_by_date_and_value - Sorts the rows by (date, value) and returns the bounds of every date.
+    * cross_sectional_transforms - Returns the cross-sectional transforms of one column.
+    * with_cross_sectional_features - Adds the cross-sectional transforms of several columns as new columns.
+
+Each column is sorted once by (date, value), the missing values being left out. In that order, the rows of a date are
+consecutive and sorted, so that the rank of a value is its offset from the first row of its date (ties getting the average
+of their ranks), the tails of every date are read at fixed offsets with the linear interpolation of
+`pandas.Series.quantile`, and the means and standard deviations of every date are `np.bincount` sums.
+"""
+
+import numpy as np
+import pandas as pd
+
+import config
+from grouped_kernels import sort_by_group_and_value, sorted_group_quantile
+
+LENDING_INDICATORS = config.LENDING_INDICATORS
+CROSS_SECTIONAL_TRANSFORMS = ['rank', 'zscore', 'winsor']
+WINSOR_LIMITS = (0.01, 0.99)
+
+
+def sort_by_date_and_value(date_codes, values):
+    """
+    The `sort_by_date_and_value` function returns the rows with a value sorted by (date, value), and the first row (in that
+    order) and the number of values of every date (see `grouped_kernels.sort_by_group_and_value`).
+    """
+    n_dates = date_codes.max() + 1 if len(date_codes) else 0
+    return sort_by_group_and_value(date_codes, values, n_dates)
+
+
+def cross_sectional_transforms(date_codes, values, transforms=CROSS_SECTIONAL_TRANSFORMS, limits=WINSOR_LIMITS):
+    """
+    The `cross_sectional_transforms` function returns a dictionary mapping each transform of `transforms` to its array for
+    the values of one column, NaN for missing values:
+        * rank - Percentile rank within the date, as `groupby(date).rank(pct=True)` (ties get their average rank).
+        * zscore - Value minus the mean of the date, divided by its standard deviation (ddof=1).
+        * winsor - Value clipped to the `limits` quantiles of the date.
+    """
+    rows, starts, counts = sort_by_date_and_value(date_codes, values)
+    sorted_values, sorted_dates = values[rows], date_codes[rows]
+    n = len(rows)
+    results = {}
+
+    if 'rank' in transforms:
+        # Runs of equal values within a date get the average of their ranks
+        new_run = np.r_[True, (sorted_values[1:] != sorted_values[:-1]) | (sorted_dates[1:] != sorted_dates[:-1])]
+        run_ids = np.cumsum(new_run) - 1
+        run_starts = np.flatnonzero(new_run)
+        run_ends = np.r_[run_starts[1:], n] - 1
+        average_position = (run_starts + run_ends)[run_ids] / 2
+        rank = np.full(len(values), np.nan)
+        rank[rows] = (average_position - starts[sorted_dates] + 1) / counts[sorted_dates]
+        results['rank'] = rank
+
+    if 'zscore' in transforms:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(sorted_dates, weights=sorted_values, minlength=len(counts)) / counts
+            squared = np.bincount(sorted_dates, weights=(sorted_values - mean[sorted_dates]) ** 2, minlength=len(counts))
+            std = np.sqrt(squared / (counts - 1))
+            zscore = np.full(len(values), np.nan)
+            zscore[rows] = (sorted_values - mean[sorted_dates]) / std[sorted_dates]
+        results['zscore'] = zscore
+
+    if 'winsor' in transforms:
+        lower = sorted_group_quantile(sorted_values, starts, counts, limits[0])
+        upper = sorted_group_quantile(sorted_values, starts, counts, limits[1])
+        winsorized = np.full(len(values), np.nan)
+        winsorized[rows] = np.clip(sorted_values, lower[sorted_dates], upper[sorted_dates])
+        results['winsor'] = winsorized
+
+    unknown = set(transforms) - set(CROSS_SECTIONAL_TRANSFORMS)
+    if unknown:
+        raise ValueError(f"Unknown cross-sectional transforms {sorted(unknown)}")
+    return results
+
+
+def with_cross_sectional_features(df, columns=LENDING_INDICATORS, transforms=CROSS_SECTIONAL_TRANSFORMS,
+                                  limits=WINSOR_LIMITS, date_col='date'):
+    """
+    The `with_cross_sectional_features` function returns `df` with the columns `{col}_{transform}` of the per-date
+    cross-sectional transforms of every column of `columns` (see `cross_sectional_transforms`).
+    """
+    date_codes = pd.factorize(df[date_col])[0].astype(np.int64)
+    new_columns = [f'{col}_{transform}' for col in columns for transform in transforms]
+    block = np.empty((len(df), len(new_columns)), dtype=np.float64, order='F')
+    for i, col in enumerate(columns):
+        results = cross_sectional_transforms(date_codes, df[col].to_numpy(dtype=np.float64), transforms=transforms,
+                                             limits=limits)
+        for j, transform in enumerate(transforms):
+            block[:, i * len(transforms) + j] = results[transform]
+    return pd.concat([df, pd.DataFrame(block, index=df.index, columns=new_columns)], axis=1)
@@ -0,0 +1,112 @@
+"""
+The `downsampling.py` module has been designed to reduce the number of points of long series before plotting them, while
+keeping their visual shape: peaks, troughs and the overall path.
+
+The module contains the following functions:
+    * minmax_downsample - Keeps the first and last points and the min and max of every bucket of the x axis.
+    * lttb_downsample - Largest-Triangle-Three-Buckets downsampling to a given number of points.
+    * downsample - Returns the points to plot for a point budget, with either method.
+
+All the functions take the x values (numbers or datetimes, sorted) and the y values of a series and return the positions
+of the points to keep, in increasing order, so that the same rows can be selected in other arrays. The x axis of the
+min/max method is split into buckets of equal width, as pixels are, and the min and max of all the buckets are found with
+a single sort of the points by (bucket, y). Largest-Triangle-Three-Buckets picks, in every bucket of equal count, the point
+forming the largest triangle with the point picked in the previous bucket and the mean of the next bucket. The bucket
+means are computed at once with `np.add.reduceat`; the choice in a bucket depending on the previous one, the buckets are
+visited in turn, each with array operations over its points.
+"""
+
+import numpy as np
+
+import config
+
+PLOT_MAX_POINTS = config.PLOT_MAX_POINTS
+DOWNSAMPLING_METHODS = ['minmax', 'lttb']
+
+
+def _as_float(x):
+    """
+    Returns the x values as floats, datetimes being converted to nanoseconds.
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    return x.astype(np.float64)
+
+
+def minmax_downsample(x, y, n_buckets):
+    """
+    The `minmax_downsample` function returns the positions of the first and last points and of the minimum and maximum of
+    `y` in each of the `n_buckets` buckets of equal width of the x axis, at most 2 `n_buckets` + 2 points. The values of
+    `y` are expected to be finite.
+    """
+    x, y = _as_float(x), np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= 2 * n_buckets + 2:
+        return np.arange(n)
+
+    span = x[-1] - x[0]
+    if span > 0:
+        buckets = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    else:
+        buckets = np.zeros(n, dtype=np.int64)
+    # Sorted by y within each bucket: the min and the max of a bucket are its first and last points
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    new_bucket = sorted_buckets[1:] != sorted_buckets[:-1]
+    first, last = np.r_[True, new_bucket], np.r_[new_bucket, True]
+    return np.unique(np.r_[0, order[first], order[last], n - 1])
+
+
+def lttb_downsample(x, y, n_out):
+    """
+    The `lttb_downsample` function returns the positions of the `n_out` points picked by Largest-Triangle-Three-Buckets:
+    the first and last points and one point in each of the `n_out - 2` buckets of equal count of the points in between.
+    The values of `y` are expected to be finite.
+    """
+    x, y = _as_float(x), np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Relative to the first point, for the precision of the areas with datetimes
+    x = x - x[0]
+
+    # Bucket i holds the points edges[i] to edges[i + 1] (excluded)
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # Third point of the triangles of every bucket: the mean of the next bucket, the last point for the last bucket
+    next_x, next_y = np.r_[mean_x[1:], x[-1]], np.r_[mean_y[1:], y[-1]]
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(x, y, max_points=PLOT_MAX_POINTS, method='minmax'):
+    """
+    The `downsample` function returns the positions of the points of the series (x, y) to plot with at most `max_points`
+    points, with `method` 'minmax' (see `minmax_downsample`) or 'lttb' (see `lttb_downsample`). Series within the budget are
+    kept whole, missing values included. Otherwise, only the points with a finite `y` are downsampled, so that the gaps of
+    the series are bridged.
+    """
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"method must be one of {DOWNSAMPLING_METHODS}, got {method!r}")
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= max_points:
+        return np.arange(len(y))
+
+    finite = np.flatnonzero(np.isfinite(y))
+    x = np.asarray(x)[finite]
+    if method == 'minmax':
+        kept = minmax_downsample(x, y[finite], max(max_points // 2 - 1, 1))
+    else:
+        kept = lttb_downsample(x, y[finite], max_points)
+    return finite[kept]
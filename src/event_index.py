@@ -0,0 +1,212 @@
+"""
+The `event_index.py` module has been designed to handle the RepRisk incidents as a sparse table of events instead of
+columns repeated on every Markit row of the merged data, where they are almost always missing.
+
+The module contains the following functions:
+    * sort_panel - Sorts a panel by security and date.
+    * security_row_ranges - Returns the first and last (excluded) row of each security in a sorted panel.
+    * date_numbers - Numbers the dates by their rank among all the dates present.
+    * security_day_keys - Returns the integer (security, day) keys of some records, and of records to look up.
+    * match_security_days - Finds the keys of the same security on or after (or before) some keys, within a tolerance.
+    * build_event_table - Builds the table of events, pointing each event to its row in a sorted panel.
+    * split_panel_events - Splits the merged data into a panel with one row per security and date and an event table.
+    * event_windows - Returns the [-k, +k] trading-day windows of some columns around every event as a 3-D array.
+
+The (security, day) pairs of a panel are stored as integer keys, the security code times a span of days plus the day
+number, so that sorting the keys sorts the rows by security and day, and that the lookups of many (security, day) pairs
+are a single `np.searchsorted` that can never cross from one security to the next. The merge of the RepRisk records, the
+event table, the lagged columns of `misc_tools` and the rolling windows of `rolling_features` and `portfolio_sorts` all
+use these keys.
+
+In a panel sorted by security and date, the trading days of a security are consecutive rows, so the window of an event is
+a range of row offsets around the row of the event. The windows of all the events are gathered at once with fancy indexing
+on the values of the panel, positions falling outside of the rows of the security of the event being set to NaN.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import config
+except ModuleNotFoundError:
+    # Imported as `src.event_index` from the root of the project, without `src` on the path
+    from src import config
+
+LENDING_INDICATORS = config.LENDING_INDICATORS
+EVENT_ATTRIBUTES = ['story_id', 'severity', 'reach', 'novelty', 'environment', 'social', 'governance']
+
+
+def sort_panel(df, id_col='cusip', date_col='date'):
+    """
+    The `sort_panel` function sorts a panel by security and date, and resets its index so that the index of a row is its
+    offset in the panel.
+    """
+    return df.sort_values([id_col, date_col], kind='stable').reset_index(drop=True)
+
+
+def security_row_ranges(panel, id_col='cusip'):
+    """
+    The `security_row_ranges` function returns a DataFrame indexed by security with the `start` and `stop` (excluded) row
+    offsets of each security in a panel sorted by security and date.
+    """
+    ids = panel[id_col].to_numpy()
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.array([], dtype=np.int64)
+    stops = np.r_[starts[1:], len(ids)].astype(np.int64)
+    return pd.DataFrame({'start': starts, 'stop': stops}, index=pd.Index(ids[starts], name=id_col))
+
+
+def date_numbers(dates):
+    """
+    The `date_numbers` function returns the rank of every date of `dates` among all the distinct dates present.
+    """
+    dates = np.asarray(dates)
+    return np.searchsorted(np.unique(dates), dates).astype(np.int64)
+
+
+def security_day_keys(codes, day_numbers, pad=0, lookup_codes=None, lookup_days=None):
+    """
+    The `security_day_keys` function returns the integer keys `code * span + day - origin` of the (security code, day
+    number) pairs of `codes` and `day_numbers`, where the `span` of days leaves `pad` days of room on both sides of the
+    days, so that shifting a key by up to `pad` days never reaches the keys of another security.
+
+    With `lookup_codes` and `lookup_days`, the keys of other records to look up are computed in the same key space, the
+    span also covering their days, with -1 for the records with a negative code (e.g. an unknown security).
+
+    The function returns the keys, the lookup keys (None without lookups), the span and the origin, so that the day
+    number of a key is `key % span + origin`.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    day_numbers = np.asarray(day_numbers, dtype=np.int64)
+    days = day_numbers
+    if lookup_codes is not None:
+        lookup_codes = np.asarray(lookup_codes, dtype=np.int64)
+        lookup_days = np.asarray(lookup_days, dtype=np.int64)
+        days = np.r_[day_numbers, lookup_days[lookup_codes >= 0]]
+
+    if len(days) == 0:
+        origin, span = -pad, 1 + 2 * pad
+    else:
+        origin = days.min() - pad
+        span = days.max() - days.min() + 1 + 2 * pad
+    keys = codes * span + (day_numbers - origin)
+
+    lookup_keys = None
+    if lookup_codes is not None:
+        lookup_keys = np.where(lookup_codes >= 0, lookup_codes * span + (lookup_days - origin), -1)
+    return keys, lookup_keys, span, origin
+
+
+def match_security_days(sorted_keys, keys, span, direction='forward', tolerance=0):
+    """
+    The `match_security_days` function looks up `keys` (see `security_day_keys`) in the sorted array `sorted_keys` and
+    returns the positions of the first key of the same security on or after each key (`direction='forward'`), or of the
+    last key on or before it (`direction='backward'`), along with a boolean array of the keys found within `tolerance`
+    days. With the default tolerance of 0, only the exact keys are found. Positions of the keys not found are 0.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    n = len(sorted_keys)
+    if n == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+
+    if direction == 'forward':
+        positions = np.searchsorted(sorted_keys, keys, side='left')
+        found = positions < n
+        positions = np.minimum(positions, n - 1)
+        distance = sorted_keys[positions] - keys
+    elif direction == 'backward':
+        positions = np.searchsorted(sorted_keys, keys, side='right') - 1
+        found = positions >= 0
+        positions = np.maximum(positions, 0)
+        distance = keys - sorted_keys[positions]
+    else:
+        raise ValueError(f"direction must be 'forward' or 'backward', got {direction!r}")
+
+    found &= (keys >= 0) & (sorted_keys[positions] // span == keys // span) & (distance <= tolerance)
+    return np.where(found, positions, 0), found
+
+
+def build_event_table(panel, events, id_col='cusip', date_col='date', event_date_col='incident_date',
+                      attributes=EVENT_ATTRIBUTES, max_days_forward=3):
+    """
+    The `build_event_table` function has been designed to point each event of `events` to its row in `panel`, a panel sorted
+    by security and date (see `sort_panel`).
+
+    An event is pointed to the row of its security on its date, or, if the security has no row on that date (weekend,
+    holiday), to the next row of the security within `max_days_forward` calendar days. Events that cannot be pointed to a
+    row are dropped.
+
+    The function returns a DataFrame with the security, the event date, the `attributes` of the event, the `row` offset of the
+    event in the panel, and the `start` and `stop` row offsets of its security.
+    """
+    ranges = security_row_ranges(panel, id_col=id_col)
+    codes = np.repeat(np.arange(len(ranges)), (ranges['stop'] - ranges['start']).to_numpy())
+    days = panel[date_col].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+    event_codes = ranges.index.get_indexer(events[id_col])
+    event_dates = events[event_date_col].to_numpy().astype('datetime64[D]')
+    event_codes = np.where(np.isnat(event_dates), -1, event_codes)
+
+    # The keys of the panel, sorted by security and date, are already sorted
+    keys, event_keys, span, _ = security_day_keys(codes, days, lookup_codes=event_codes,
+                                                  lookup_days=event_dates.astype(np.int64))
+    rows, found = match_security_days(keys, event_keys, span, direction='forward', tolerance=max_days_forward)
+    rows = np.where(found, rows, -1)
+
+    attributes = [col for col in attributes if col in events.columns]
+    event_table = events[[id_col, event_date_col, *attributes]].rename(columns={event_date_col: 'event_date'})
+    event_table = event_table.assign(row=rows)
+    event_table = event_table[event_table['row'] >= 0].reset_index(drop=True)
+
+    event_codes = ranges.index.get_indexer(event_table[id_col])
+    event_table['start'] = ranges['start'].to_numpy()[event_codes]
+    event_table['stop'] = ranges['stop'].to_numpy()[event_codes]
+    return event_table
+
+
+def split_panel_events(df, id_col='cusip', date_col='date', event_date_col='incident_date', attributes=EVENT_ATTRIBUTES,
+                       event_columns=None):
+    """
+    The `split_panel_events` function has been designed to split the merged data (one row per Markit observation and
+    incident) into:
+        * a panel sorted by security and date with one row per security and date and without the incident columns,
+        * the event table of the incidents, pointing to the rows of that panel (see `build_event_table`).
+
+    `event_columns` are the columns dropped from the panel, by default `event_date_col` and `attributes` along with the
+    other RepRisk incident columns of the merged data.
+    """
+    if event_columns is None:
+        event_columns = [event_date_col, *attributes, 'unsharp_incident', 'related_countries', 'related_countries_codes']
+    event_columns = [col for col in event_columns if col in df.columns]
+
+    events = df.loc[df[event_date_col].notna(), [id_col, *event_columns]]
+    panel = df.drop(columns=event_columns).drop_duplicates(subset=[id_col, date_col])
+    panel = sort_panel(panel, id_col=id_col, date_col=date_col)
+
+    event_table = build_event_table(panel, events, id_col=id_col, date_col=date_col, event_date_col=event_date_col,
+                                    attributes=attributes, max_days_forward=0)
+    return panel, event_table
+
+
+def event_windows(panel, event_table, columns=LENDING_INDICATORS, k=5, values=None, return_mask=False):
+    """
+    The `event_windows` function returns the values of `columns` over the [-k, +k] trading-day window of every event of
+    `event_table` (see `build_event_table`) as a dense array of shape (number of events, 2k + 1, number of columns), the
+    event being at position k of the second axis.
+
+    Positions of a window falling before the first or after the last row of the security of the event are NaN. `values`
+    can be given as the float array of `panel[columns]` to avoid converting it again when calling the function on chunks
+    of events. With `return_mask=True`, the function also returns the boolean array of the positions inside the security.
+    """
+    if values is None:
+        values = panel[columns].to_numpy(dtype=np.float64)
+
+    offsets = np.arange(-k, k + 1)
+    positions = event_table['row'].to_numpy()[:, None] + offsets[None, :]
+    inside = (positions >= event_table['start'].to_numpy()[:, None]) & (positions < event_table['stop'].to_numpy()[:, None])
+
+    windows = values[np.where(inside, positions, 0)]
+    windows[~inside] = np.nan
+
+    if return_mask:
+        return windows, inside
+    return windows
@@ -0,0 +1,187 @@
+"""
+The `event_study.py` module has been designed to measure how the lending indicators of a security move around its
+RepRisk incidents: abnormal changes of the short interest, loan supply, utilisation and fee over a window around every
+incident, averaged over all the incidents and compared across their ESG attributes.
+
+The module contains the following functions:
+    * daily_cross_sectional_means - Returns the mean of some columns over all the securities of every date of a panel.
+    * abnormal_changes - Returns the abnormal changes of some columns over the event window of every event.
+    * average_abnormal_changes - Averages the abnormal changes of all the events at every offset of the window.
+    * abnormal_changes_by_attribute - Averages the abnormal changes over a window by value of an event attribute.
+    * run_event_study - Runs the event study on the merged data.
+
+The events are the rows of an event table of the `event_index` module, pointing to their row in a panel sorted by security
+and date. The windows of all the events are gathered at once with `event_index.event_windows`, so that the abnormal
+changes are array operations over (event, offset, indicator), computed by chunks of events to bound memory.
+
+The abnormal change of an indicator at offset t of the event window is its value at t minus its mean over the estimation
+window before the event (`benchmark='pre_window'`). With `benchmark='market'`, the cross-sectional mean of the indicator on
+the same date is first subtracted from the value, so that moves shared by all the securities are not attributed to the
+incident.
+"""
+
+import numpy as np
+import pandas as pd
+
+import config
+from event_index import event_windows, split_panel_events
+
+LENDING_INDICATORS = config.LENDING_INDICATORS
+EVENT_WINDOW = (-5, 10)
+ESTIMATION_WINDOW = (-30, -6)
+
+
+def daily_cross_sectional_means(panel, columns=LENDING_INDICATORS, date_col='date'):
+    """
+    The `daily_cross_sectional_means` function returns, for every row of `panel`, the mean of each column of `columns` over
+    all the securities with a value on the date of the row, as an array of shape (number of rows, number of columns).
+    """
+    date_codes, dates = pd.factorize(panel[date_col])
+    values = panel[columns].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    means = np.empty_like(values)
+    for k in range(len(columns)):
+        sums = np.bincount(date_codes[valid[:, k]], weights=values[valid[:, k], k], minlength=len(dates))
+        counts = np.bincount(date_codes[valid[:, k]], minlength=len(dates))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[:, k] = (sums / counts)[date_codes]
+    return means
+
+
+def abnormal_changes(panel, event_table, columns=LENDING_INDICATORS, event_window=EVENT_WINDOW,
+                     estimation_window=ESTIMATION_WINDOW, benchmark='pre_window', min_estimation_days=5,
+                     chunk_size=10_000, date_col='date'):
+    """
+    The `abnormal_changes` function has been designed to compute the abnormal changes of `columns` over the trading-day
+    window `event_window` (first and last offsets, included) of every event of `event_table`, against the mean over the
+    `estimation_window` before the event and, with `benchmark='market'`, net of the cross-sectional mean of each date.
+
+    Events with less than `min_estimation_days` values in the estimation window get NaN abnormal changes. The events are
+    processed by chunks of `chunk_size`.
+
+    The function returns the array of shape (number of events, number of offsets, number of columns) of the abnormal
+    changes, and the offsets of the event window.
+    """
+    if benchmark not in ('pre_window', 'market'):
+        raise ValueError(f"benchmark must be 'pre_window' or 'market', got {benchmark!r}")
+
+    values = panel[columns].to_numpy(dtype=np.float64)
+    if benchmark == 'market':
+        values = values - daily_cross_sectional_means(panel, columns=columns, date_col=date_col)
+
+    k = max(abs(offset) for offset in (*event_window, *estimation_window))
+    offsets = np.arange(event_window[0], event_window[1] + 1)
+    event_positions = offsets + k
+    estimation_positions = np.arange(estimation_window[0], estimation_window[1] + 1) + k
+
+    result = np.empty((len(event_table), len(offsets), len(columns)))
+    for start in range(0, len(event_table), chunk_size):
+        chunk = event_table.iloc[start:start + chunk_size]
+        windows = event_windows(panel, chunk, columns=columns, k=k, values=values)
+
+        estimation = windows[:, estimation_positions, :]
+        observed = ~np.isnan(estimation)
+        counts = observed.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            baseline = np.where(observed, estimation, 0.).sum(axis=1) / counts
+        baseline[counts < min_estimation_days] = np.nan
+
+        result[start:start + len(chunk)] = windows[:, event_positions, :] - baseline[:, None, :]
+    return result, offsets
+
+
+def _mean_and_se(values, axis=0):
+    """
+    Returns the mean, the standard error and the number of the non-missing values along an axis.
+    """
+    observed = ~np.isnan(values)
+    counts = observed.sum(axis=axis)
+    filled = np.where(observed, values, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=axis) / counts
+        deviations = np.where(observed, values - np.expand_dims(mean, axis), 0.)
+        se = np.sqrt((deviations ** 2).sum(axis=axis) / (counts - 1) / counts)
+    return mean, se, counts
+
+
+def average_abnormal_changes(abnormal, offsets, columns=LENDING_INDICATORS):
+    """
+    The `average_abnormal_changes` function returns the average abnormal change of every column at every offset of the
+    event window over all the events (see `abnormal_changes`), as a DataFrame indexed by (column, offset) with the `mean`,
+    its standard error `se`, the `t_stat` and the number of events `count`.
+    """
+    mean, se, counts = _mean_and_se(abnormal, axis=0)
+    index = pd.MultiIndex.from_product([columns, offsets], names=['column', 'offset'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            'mean': mean.T.ravel(),
+            'se': se.T.ravel(),
+            't_stat': (mean / se).T.ravel(),
+            'count': counts.T.ravel(),
+        }, index=index)
+
+
+def abnormal_changes_by_attribute(abnormal, offsets, event_table, attribute, columns=LENDING_INDICATORS, window=(0, 5)):
+    """
+    The `abnormal_changes_by_attribute` function has been designed to compare the responses of the events across the
+    values of an event `attribute` (e.g. `severity` or `environment`): the abnormal changes of every event are averaged
+    over the offsets of `window` (included), and these event averages are averaged by value of the attribute.
+
+    The function returns a DataFrame indexed by (attribute value, column) with the `mean`, `se`, `t_stat` and `count` of
+    the events.
+    """
+    in_window = (offsets >= window[0]) & (offsets <= window[1])
+    per_event, _, _ = _mean_and_se(abnormal[:, in_window, :], axis=1)
+
+    codes, uniques = pd.factorize(event_table[attribute], sort=True)
+    rows = np.flatnonzero(codes >= 0)
+    order = rows[np.argsort(codes[rows], kind='stable')]
+    bounds = np.r_[0, np.cumsum(np.bincount(codes[rows], minlength=len(uniques)))]
+
+    results = []
+    for i in range(len(uniques)):
+        mean, se, counts = _mean_and_se(per_event[order[bounds[i]:bounds[i + 1]]], axis=0)
+        results.append(pd.DataFrame({'mean': mean, 'se': se, 'count': counts}, index=columns))
+    result = pd.concat(results, keys=uniques.tolist(), names=[attribute, 'column'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result.insert(2, 't_stat', result['mean'] / result['se'])
+    return result
+
+
+def run_event_study(df, columns=LENDING_INDICATORS, attributes=['severity', 'novelty', 'reach', 'environment', 'social',
+                    'governance'], event_window=EVENT_WINDOW, estimation_window=ESTIMATION_WINDOW,
+                    benchmark='pre_window', window=(0, 5), chunk_size=10_000):
+    """
+    The `run_event_study` function runs the event study on the merged data (one row per Markit observation and incident,
+    see `merge_data`): the data is split into a panel and an event table with `event_index.split_panel_events`, and the
+    abnormal changes of every incident are averaged over all the incidents and by value of every attribute of `attributes`.
+
+    The function returns the DataFrame of `average_abnormal_changes` and a dictionary mapping every attribute to its
+    DataFrame of `abnormal_changes_by_attribute`.
+    """
+    panel, events = split_panel_events(df, attributes=attributes)
+    abnormal, offsets = abnormal_changes(panel, events, columns=columns, event_window=event_window,
+                                         estimation_window=estimation_window, benchmark=benchmark, chunk_size=chunk_size)
+
+    average = average_abnormal_changes(abnormal, offsets, columns=columns)
+    by_attribute = {
+        attribute: abnormal_changes_by_attribute(abnormal, offsets, events, attribute, columns=columns, window=window)
+        for attribute in attributes if attribute in events.columns
+    }
+    return average, by_attribute
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from compute_desc_stats import read_data
+
+    df = read_data("merged_data")
+    # Outside of the `stats` folder, whose tables are all converted to LaTeX
+    output_dir = Path(config.OUTPUT_DIR) / "event_study"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for benchmark in ['pre_window', 'market']:
+        average, by_attribute = run_event_study(df, benchmark=benchmark)
+        average.to_parquet(output_dir / f"event_study_{benchmark}.parquet")
+        for attribute, result in by_attribute.items():
+            result.to_parquet(output_dir / f"event_study_{benchmark}_{attribute}.parquet")
@@ -0,0 +1,200 @@
+"""
+The `grouped_kernels.py` module has been designed to compute grouped statistics without running Python code per group,
+for the grouped helpers of `misc_tools`.
+
+The module contains the following functions:
+    * group_codes - Returns the group code of every row and the index of the groups, as `groupby` sorts them.
+    * grouped_sum - Sum of the values of every group.
+    * grouped_weighted_mean - Weighted mean of every group.
+    * grouped_weighted_std - Weighted standard deviation of every group.
+    * grouped_weighted_quantile - Weighted quantiles of every group, as `misc_tools.weighted_quantile`.
+    * leave_one_out_sum - Sum of the other values of the group of every row.
+    * sort_by_group_and_value - Sorts the rows with a value by (group, value) and returns the bounds of every group.
+    * sorted_group_quantile - Unweighted quantile of every group from the values sorted by (group, value).
+
+Every kernel takes integer group codes (0 to n_groups - 1, and -1 for rows without a group) and reduces all the groups at
+once with `np.bincount`, or, for the quantiles, with one sort of all the rows by (group, value), cumulative weights and
+one sort locating the quantiles of all the groups among those cumulative weights.
+The results are arrays with one value per group (NaN for groups without values).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def group_codes(data, by_col):
+    """
+    The `group_codes` function returns the group code of every row of `data` grouped by `by_col` (a column or a list of
+    columns), -1 for rows with a missing group, and the index of the groups in the order of the codes, which is the
+    order of `data.groupby(by_col)`.
+    """
+    if isinstance(by_col, (list, tuple)) and len(by_col) == 1:
+        by_col = by_col[0]
+    if not isinstance(by_col, (list, tuple)):
+        codes, uniques = pd.factorize(data[by_col], sort=True)
+        return codes.astype(np.int64), pd.Index(uniques, name=by_col)
+
+    grouped = data.groupby(list(by_col), sort=True)
+    # Rows with a missing key are not in any group and get a NaN group number
+    codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    return codes, grouped.size().index
+
+
+def _valid(codes, *arrays):
+    """
+    Returns the rows with a group and no missing value in any of the arrays.
+    """
+    valid = codes >= 0
+    for array in arrays:
+        valid &= ~np.isnan(array)
+    return valid
+
+
+def grouped_sum(codes, values, n_groups):
+    """
+    Returns the sum of the values of every group, missing values being skipped (0 for groups without values).
+    """
+    valid = _valid(codes, values)
+    return np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+
+
+def grouped_weighted_mean(codes, values, weights, n_groups):
+    """
+    Returns the weighted mean of the values of every group, rows with a missing value or weight being skipped.
+    """
+    valid = _valid(codes, values, weights)
+    codes, values, weights = codes[valid], values[valid], weights[valid]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (np.bincount(codes, weights=values * weights, minlength=n_groups)
+                / np.bincount(codes, weights=weights, minlength=n_groups))
+
+
+def grouped_weighted_std(codes, values, weights, n_groups, ddof=1):
+    """
+    Returns the weighted standard deviation of every group, sqrt(sum w (x - mean)^2 / ((n - ddof) / n * sum w)) with n the
+    number of values of the group. As in `misc_tools.groupby_weighted_std`, a group with a missing value has a NaN
+    standard deviation.
+    """
+    in_group = codes >= 0
+    codes, values, weights = codes[in_group], values[in_group], weights[in_group]
+    counts = np.bincount(codes[~np.isnan(values)], minlength=n_groups)
+    sum_weights = np.bincount(codes, weights=weights, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes, weights=values * weights, minlength=n_groups) / sum_weights
+        numerator = np.bincount(codes, weights=weights * (values - mean[codes]) ** 2, minlength=n_groups)
+        return np.sqrt(numerator / ((counts - ddof) / counts * sum_weights))
+
+
+def grouped_weighted_quantile(codes, values, weights, n_groups, quantiles, old_style=False):
+    """
+    Returns the weighted quantiles of every group as an array of shape (n_groups, number of quantiles), with the
+    interpolation of `misc_tools.weighted_quantile` (see there for `old_style`). Rows with a missing value or weight are
+    skipped. `weights` can be None for equal weights.
+    """
+    quantiles = np.atleast_1d(np.asarray(quantiles, dtype=np.float64))
+    assert np.all(quantiles >= 0) and np.all(quantiles <= 1), 'quantiles should be in [0, 1]'
+    if weights is None:
+        weights = np.ones(len(values))
+
+    valid = _valid(codes, values, weights)
+    codes, values, weights = codes[valid], values[valid], weights[valid]
+    order = np.lexsort((values, codes))
+    codes, values, weights = codes[order], values[order], weights[order]
+
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    # Cumulative weights restarted at every group
+    cumulative_weights = np.cumsum(weights)
+    group_offsets = np.r_[0., cumulative_weights][starts]
+    positions = cumulative_weights - group_offsets[codes] - 0.5 * weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if old_style:
+            first = positions[np.minimum(starts, len(positions) - 1)] if len(positions) else np.zeros(n_groups)
+            positions = positions - first[codes]
+            positions = positions / positions[np.maximum(starts + counts - 1, 0)][codes]
+        else:
+            positions = positions / np.bincount(codes, weights=weights, minlength=n_groups)[codes]
+
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    if len(values) == 0:
+        return result
+
+    # Number of knots of the group at or below every quantile, from one sort of the knots and the quantiles of all the
+    # groups by (group, position), knots first on ties. The knots are already in that order, so it is also the index of
+    # the first knot above the quantile.
+    group_ids = np.repeat(np.arange(n_groups), len(quantiles))
+    target = np.tile(quantiles, n_groups)
+    is_target = np.r_[np.zeros(len(codes), dtype=bool), np.ones(len(target), dtype=bool)]
+    order = np.lexsort((is_target, np.r_[positions, target], np.r_[codes, group_ids]))
+    knots_before = np.cumsum(~is_target[order])
+    right = np.empty(len(target), dtype=np.int64)
+    right[order[is_target[order]] - len(codes)] = knots_before[is_target[order]]
+
+    first, last = starts[group_ids], starts[group_ids] + counts[group_ids] - 1
+    right = np.clip(right, first + 1, np.maximum(last, first + 1))
+    left = right - 1
+    right = np.minimum(right, last)
+
+    # Linear interpolation between the two knots around the quantile, clamped to the first and last values as `np.interp`
+    left, right = np.minimum(left, len(values) - 1), np.minimum(right, len(values) - 1)
+    x_left, x_right = positions[left], positions[right]
+    y_left, y_right = values[left], values[right]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interpolated = y_left + (target - x_left) * (y_right - y_left) / (x_right - x_left)
+    interpolated = np.where(target <= x_left, y_left, np.where(target >= x_right, y_right, interpolated))
+    # A single value is every quantile of its group
+    interpolated = np.where(counts[group_ids] == 1, y_left, interpolated)
+
+    has_values = counts[group_ids] > 0
+    result.ravel()[has_values] = interpolated[has_values]
+    return result
+
+
+def leave_one_out_sum(codes, values, n_groups):
+    """
+    Returns, for every row, the sum of the values of its group minus its own value (NaN for rows without a group, and for
+    rows whose value is missing).
+    """
+    sums = grouped_sum(codes, values, n_groups)
+    return np.where(codes >= 0, sums[np.maximum(codes, 0)] - values, np.nan)
+
+
+def sort_by_group_and_value(codes, values, n_groups, values_sorted=False):
+    """
+    Returns the rows with a group and a value sorted by (group, value), and the first row (in that order) and the number
+    of values of every group. If `values_sorted` is True, the values are already sorted in increasing order.
+
+    The rows are sorted by value, then by a stable sort of the group codes, which is a radix sort for the small integer
+    codes (cast to int16 when there are few groups).
+    """
+    rows = np.flatnonzero((codes >= 0) & ~np.isnan(values))
+    if not values_sorted:
+        rows = rows[np.argsort(values[rows])]
+    code_dtype = np.int16 if n_groups < np.iinfo(np.int16).max else np.int64
+    rows = rows[np.argsort(codes[rows].astype(code_dtype), kind='stable')]
+    counts = np.bincount(codes[rows], minlength=n_groups)
+    return rows, np.r_[0, np.cumsum(counts)[:-1]].astype(np.int64), counts
+
+
+def sorted_group_quantile(sorted_values, starts, counts, q):
+    """
+    Returns the `q` quantile of every group from the values sorted by (group, value) and the first position and number of
+    values of every group (see `sort_by_group_and_value`), with the linear interpolation of `numpy.percentile` (and of
+    `pandas`). NaN for groups without values.
+    """
+    has_values = counts > 0
+    safe_counts = np.where(has_values, counts, 1)
+    # Empty groups point to the padding NaN
+    padded = np.r_[sorted_values, np.nan]
+    first = np.where(has_values, starts, len(sorted_values))
+    last = np.where(has_values, starts + safe_counts - 1, len(sorted_values))
+
+    virtual_index = (safe_counts - 1) * q
+    previous_index = np.floor(virtual_index)
+    gamma = virtual_index - previous_index
+    previous_index = np.minimum(first + previous_index.astype(np.int64), last)
+    next_index = np.minimum(previous_index + 1, last)
+    below, above = padded[previous_index], padded[next_index]
+    difference = above - below
+    # As `numpy`, interpolated from the closest of the two values
+    return np.where(gamma >= 0.5, above - difference * (1 - gamma), below + difference * gamma)
@@ -4,10 +4,27 @@ dataframe with a Reprisk dataframe, based on shared 'cusip' and 'date' fields. I
 the merged data to enhance efficiency; if found, it loads this data to avoid reprocessing. If no cached data is available, it 
 proceeds with the merging process. The function allows for the newly merged dataset to be cached, saving it to a specified 
 directory, thereby facilitating faster future access.
+
+RepRisk records are dated on calendar days while Markit only has trading days, so incidents and metric updates dated on a 
+weekend or a holiday do not match any Markit row on an exact ('cusip', 'date') join. The `asof_align_dates` function moves 
+each RepRisk record to the next (or previous, or nearest) Markit trading day of the same security, within a tolerance, so 
+that `merge_data` can attach it without expanding either side to a daily grid.
+
+The RepRisk table has one row per incident, so a Markit observation is repeated once per incident of the day. The 
+`aggregate_daily_incidents` function collapses the incidents to one row per ('cusip', 'date') with a fixed set of 
+aggregates, so that the merged panel keeps exactly one row per Markit observation.
+
+The merged data is sorted by ('cusip', 'date') and cached with a security index (see `security_index`), so that the history
+of a security is a slice of the data, or a few row groups of the cached file.
+
+The `write_year_partitions` function splits the cached merged data into one file per year in a single read, each only
+rewritten when its rows changed, so that the yearly tasks of `dodo.py` are only run again for the years affected by a
+refresh of the data.
 """
 
 import os
 
+import numpy as np
 import pandas as pd
 import config
 from pathlib import Path
@@ -16,11 +33,131 @@ from load_crsp import load_CRSP
 from load_markit import load_Markit
 from load_reprisk import load_RepRisk
 from merge_markit_crsp import merge_markit_crsp
+from event_index import sort_panel, security_day_keys, match_security_days
+from security_index import write_sorted_parquet
 
 DATA_DIR = Path(config.DATA_DIR)
 START_DATE = config.START_DATE
 END_DATE = config.END_DATE
 
+# RepRisk columns that do not depend on the incident (one value per company and date)
+REPRISK_METRIC_COLUMNS = ['reprisk_id', 'company_name', 'primary_isin', 'current_rri', 'trend_rri', 'peak_rri',
+                          'peak_rri_date', 'reprisk_rating', 'country_sector_average']
+INCIDENT_SCORE_COLUMNS = ['severity', 'reach', 'novelty']
+INCIDENT_FLAG_COLUMNS = ['environment', 'social', 'governance']
+
+
+def asof_align_dates(
+    markit_crsp_df,
+    reprisk_df,
+    direction="forward",
+    tolerance="3D",
+    on="cusip",
+    date_col="date",
+):
+    """
+    This function aligns the dates of the RepRisk records on the Markit trading days of the same security.
+
+    Depending on `direction`, each RepRisk record is moved to the first Markit date on or after its date ("forward"), to the 
+    last Markit date on or before its date ("backward") or to the closest of the two ("nearest", ties going backward). A record 
+    is only moved if the Markit date is within `tolerance` of its date, otherwise its aligned date is NaT and it will not be 
+    attached to any Markit row. Records dated on a Markit trading day keep their date.
+
+    The Markit (security, date) pairs are stored as one sorted array of integer keys, the security code times the date span 
+    plus the day number (see `event_index.security_day_keys`), so that the lookups of all the RepRisk records are done at 
+    once with `np.searchsorted` and can never cross from one security to the next.
+
+    The function returns a copy of `reprisk_df` with the aligned date in `date_col` and the original date in `reprisk_date`. 
+    Note that several RepRisk records (e.g. Saturday, Sunday and Monday metrics) can be aligned on the same trading day.
+    """
+    if direction not in ("forward", "backward", "nearest"):
+        raise ValueError(f"direction must be 'forward', 'backward' or 'nearest', got {direction!r}")
+    tolerance_days = pd.Timedelta(tolerance).days
+
+    markit_keys = markit_crsp_df[[on, date_col]].dropna().drop_duplicates()
+    codes, securities = pd.factorize(markit_keys[on])
+    days = markit_keys[date_col].to_numpy().astype("datetime64[D]").astype(np.int64)
+
+    reprisk_codes = securities.get_indexer(reprisk_df[on])
+    reprisk_dates = reprisk_df[date_col].to_numpy().astype("datetime64[D]")
+    reprisk_codes = np.where(np.isnat(reprisk_dates), -1, reprisk_codes)
+
+    # Day numbers relative to the earliest date of both sides, so that the keys of a security never overlap the next one
+    keys, reprisk_keys, span, origin = security_day_keys(codes, days, lookup_codes=reprisk_codes,
+                                                         lookup_days=reprisk_dates.astype(np.int64))
+    keys = np.sort(keys)
+
+    # Candidate on or after the record date, and on or before it
+    forward_pos, forward_found = match_security_days(keys, reprisk_keys, span, "forward", tolerance_days)
+    backward_pos, backward_found = match_security_days(keys, reprisk_keys, span, "backward", tolerance_days)
+    forward_key, backward_key = keys[forward_pos], keys[backward_pos]
+
+    if direction == "forward":
+        found, matched_key = forward_found, forward_key
+    elif direction == "backward":
+        found, matched_key = backward_found, backward_key
+    else:
+        use_forward = forward_found & (~backward_found | (forward_key - reprisk_keys < reprisk_keys - backward_key))
+        found = forward_found | backward_found
+        matched_key = np.where(use_forward, forward_key, backward_key)
+
+    aligned_days = (matched_key % span + origin).astype("datetime64[D]")
+    aligned_dates = np.where(found, aligned_days, np.datetime64("NaT")).astype("datetime64[ns]")
+
+    df = reprisk_df.copy()
+    df["reprisk_date"] = df[date_col]
+    df[date_col] = aligned_dates
+    return df
+
+
+def _incident_flag(series):
+    """
+    Converts a RepRisk E/S/G column (booleans, or their string representation, with missing values) to a boolean Series.
+    """
+    return series.astype(str).str.lower().isin(["true", "t", "1", "1.0", "yes"])
+
+
+def aggregate_daily_incidents(reprisk_df, on=["cusip", "date"]):
+    """
+    This function collapses the RepRisk incidents to one row per ('cusip', 'date').
+
+    Each row keeps the RepRisk metrics of the day (the most recent ones if the dates have been aligned with 
+    `asof_align_dates`) and the following incident aggregates:
+        * incident_count - Number of incidents.
+        * severity_max, severity_mean, reach_max, reach_mean, novelty_max, novelty_mean - Max and mean of the incident scores.
+        * environment_any, social_any, governance_any - Whether at least one incident is flagged with the E/S/G issue.
+        * environment_count, social_count, governance_count - Number of incidents flagged with the E/S/G issue.
+
+    Days without incident have an `incident_count` of 0, NaN scores and False flags.
+    """
+    has_incident = reprisk_df["incident_date"].notna()
+
+    work = reprisk_df[on].copy()
+    work["incident"] = has_incident.astype(np.int64)
+    for col in INCIDENT_SCORE_COLUMNS:
+        work[col] = reprisk_df[col].where(has_incident)
+    for col in INCIDENT_FLAG_COLUMNS:
+        work[col] = (_incident_flag(reprisk_df[col]) & has_incident).astype(np.int64)
+
+    aggregations = {"incident_count": ("incident", "sum")}
+    for col in INCIDENT_SCORE_COLUMNS:
+        aggregations[f"{col}_max"] = (col, "max")
+        aggregations[f"{col}_mean"] = (col, "mean")
+    for col in INCIDENT_FLAG_COLUMNS:
+        aggregations[f"{col}_count"] = (col, "sum")
+    incidents = work.groupby(on, sort=False).agg(**aggregations)
+    for col in INCIDENT_FLAG_COLUMNS:
+        incidents[f"{col}_any"] = incidents[f"{col}_count"] > 0
+
+    # The metrics are the same for all the incidents of a company and date, keep the most recent record of the day
+    metric_columns = [col for col in REPRISK_METRIC_COLUMNS + ["reprisk_date"] if col in reprisk_df.columns]
+    metrics = reprisk_df[on + metric_columns]
+    if "reprisk_date" in metric_columns:
+        metrics = metrics.sort_values("reprisk_date", kind="stable")
+    metrics = metrics.drop_duplicates(subset=on, keep="last")
+
+    return metrics.merge(incidents.reset_index(), on=on, how="inner")
+
 
 def merge_data(
     markit_crsp_df,
@@ -28,15 +165,38 @@ def merge_data(
     data_dir=DATA_DIR,
     from_cache=True,
     save_cache=False,
+    date_alignment="exact",
+    direction="forward",
+    tolerance="3D",
+    aggregate_incidents=False,
 ):
     """
     This function is merging Markit + CRSP and the RepRisk table on CUSIP
+
+    With `date_alignment="exact"`, the RepRisk records are merged on their own date. With `date_alignment="asof"`, their 
+    dates are first aligned on the Markit trading days with `asof_align_dates`, using `direction` and `tolerance`, and the 
+    merged data is cached as `merged_data_asof.parquet`.
+
+    With `aggregate_incidents=True`, the incidents are collapsed to one row per ('cusip', 'date') with 
+    `aggregate_daily_incidents` before the merge, so that the merged data has exactly one row per Markit observation, and 
+    the merged data is cached with a `_daily` suffix (e.g. `merged_data_daily.parquet`).
+
+    The merged data is sorted by ('cusip', 'date') and cached along with its security index (see
+    `security_index.write_sorted_parquet`).
     """
+    if date_alignment not in ("exact", "asof"):
+        raise ValueError(f"date_alignment must be 'exact' or 'asof', got {date_alignment!r}")
+    file_name = "merged_data"
+    if date_alignment == "asof":
+        file_name += "_asof"
+    if aggregate_incidents:
+        file_name += "_daily"
+    file_name += ".parquet"
 
     flag = 1
     if from_cache:
         flag = 0
-        file_path = Path(data_dir) / "pulled" / "merged_data.parquet"
+        file_path = Path(data_dir) / "pulled" / file_name
         if os.path.exists(file_path):
             df = pd.read_parquet(file_path)
         else:
@@ -44,6 +204,12 @@ def merge_data(
 
     if flag:
 
+        if date_alignment == "asof":
+            reprisk_df = asof_align_dates(markit_crsp_df, reprisk_df, direction=direction, tolerance=tolerance)
+
+        if aggregate_incidents:
+            reprisk_df = aggregate_daily_incidents(reprisk_df)
+
         # Merge the two dataframes
         df = pd.merge(
             markit_crsp_df,
@@ -51,21 +217,58 @@ def merge_data(
             how="left",
             on=["cusip", "date"]
         )
+        df = sort_panel(df)
 
         if save_cache:
             file_dir = Path(data_dir) / "pulled"
             file_dir.mkdir(parents=True, exist_ok=True)
-            df.to_parquet(file_dir / 'merged_data.parquet')
+            _ = write_sorted_parquet(df, file_dir / file_name)
 
     return df
 
 
+def year_partition_path(year, file_name="merged_data", data_dir=DATA_DIR):
+    """
+    Returns the path of the partition of `year` of the cached merged data `file_name` (see `write_year_partitions`).
+    """
+    return Path(data_dir) / "derived" / f"{file_name}_by_year" / f"year={year}.parquet"
+
+
+def write_year_partitions(years, file_name="merged_data", data_dir=DATA_DIR, date_col="date"):
+    """
+    This function reads the cached merged data `file_name` once and writes the rows of each year of `years` to their own
+    partition (see `year_partition_path`). A year without any row gets an empty partition.
+
+    A partition is only replaced when its rows changed, so that a partition whose year was not affected by a refresh of the
+    merged data keeps its modification time and checksum, and the tasks depending on it are not run again. The function
+    returns the years whose partition was written.
+    """
+    df = pd.read_parquet(Path(data_dir) / "pulled" / f"{file_name}.parquet")
+    df_years = df[date_col].dt.year.to_numpy()
+
+    written = []
+    for year in years:
+        partition = df[df_years == year].reset_index(drop=True)
+        file_path = year_partition_path(year, file_name=file_name, data_dir=data_dir)
+        if file_path.exists() and pd.read_parquet(file_path).equals(partition):
+            continue
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = file_path.with_suffix(".tmp")
+        partition.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, file_path)
+        written.append(year)
+    return written
+
+
 if __name__ == "__main__":
 
     markit_df = load_Markit(start_date=START_DATE, end_date=END_DATE, data_dir=DATA_DIR, from_cache=True, save_cache=True)
     crsp_df = load_CRSP(start_date=START_DATE, end_date=END_DATE, data_dir=DATA_DIR, from_cache=True, save_cache=True)
     reprisk_df = load_RepRisk(start_date=START_DATE, end_date=END_DATE, data_dir=DATA_DIR, from_cache=True, save_cache=True)
-    markit_crsp_df = merge_markit_crsp(markit_df, crsp_df, data_dir=DATA_DIR, from_cache=True, save_cache=True)
+    # The merges are run again from the pulled data: this script is only run (by doit) when the pulled data changed
+    markit_crsp_df = merge_markit_crsp(markit_df, crsp_df, data_dir=DATA_DIR, from_cache=False, save_cache=True)
 
-    _ = merge_data(markit_crsp_df, reprisk_df, data_dir=DATA_DIR, from_cache=True, save_cache=True)
+    _ = merge_data(markit_crsp_df, reprisk_df, data_dir=DATA_DIR, from_cache=False, save_cache=True)
+    _ = merge_data(markit_crsp_df, reprisk_df, data_dir=DATA_DIR, from_cache=False, save_cache=True,
+                   aggregate_incidents=True)
 
@@ -7,12 +7,22 @@ from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 
 from dateutil.relativedelta import relativedelta
-from datetime import date
 import datetime 
 from pathlib import Path
 
 import pandas_market_calendars
 
+try:
+    import config
+    import grouped_kernels
+    from event_index import date_numbers, security_day_keys, match_security_days
+    from trading_calendar import load_trading_calendar
+except ModuleNotFoundError:
+    # Imported as `src.misc_tools` from the root of the project, without `src` on the path
+    from src import config, grouped_kernels
+    from src.event_index import date_numbers, security_day_keys, match_security_days
+    from src.trading_calendar import load_trading_calendar
+
 ########################################################################################
 ## Pandas Helpers
 ########################################################################################
@@ -90,10 +100,7 @@ def weighted_average(data_col=None, weight_col=None, data=None):
     >>> weighted_average(data_col='rate', weight_col='start_leg_amount', data=df_nccb)
     2.5
     """
-    weights_function = lambda row: data.loc[row.index, weight_col]
-    wm = lambda row: np.average(row, weights=weights_function(row))
-    result = wm(data[data_col])
-    return result
+    return np.average(data[data_col].to_numpy(), weights=data[weight_col].to_numpy())
 
 
 def groupby_weighted_average(data_col=None, weight_col=None, by_col=None, data=None, transform=False, new_column_name=''):
@@ -116,18 +123,21 @@ def groupby_weighted_average(data_col=None, weight_col=None, by_col=None, data=N
     RECEIVED     2.666667
     dtype: float64
     """
-    data['_data_times_weight'] = data[data_col] * data[weight_col]
-    data['_weight_where_notnull'] = data[weight_col] * pd.notnull(data[data_col])
-    g = data.groupby(by_col)
-    result = g['_data_times_weight'].sum() / g['_weight_where_notnull'].sum()
-    del data['_data_times_weight'], data['_weight_where_notnull']
+    codes, index = grouped_kernels.group_codes(data, by_col)
+    result = grouped_kernels.grouped_weighted_mean(codes, data[data_col].to_numpy(dtype=np.float64),
+                                                   data[weight_col].to_numpy(dtype=np.float64), len(index))
+    return _grouped_result(result, codes, index, data.index, transform, new_column_name)
 
-    if transform:
-        result.name = f'__{data_col}'
-        result = data.merge(result.reset_index(), how='left', on=by_col)[f'__{data_col}']
-        result.name = new_column_name
 
-    return result
+def _grouped_result(result, codes, index, row_index, transform=False, new_column_name=''):
+    """
+    Returns the per-group results of a grouped kernel as a Series indexed by group or, with `transform`, as a Series with
+    the result of the group of every row (NaN for rows without a group).
+    """
+    if transform:
+        return pd.Series(np.where(codes >= 0, result[np.maximum(codes, 0)], np.nan), index=row_index,
+                         name=new_column_name)
+    return pd.Series(result, index=index)
 
 
 def groupby_weighted_std(data_col=None, weight_col=None, by_col=None, data=None, ddof=1):
@@ -164,18 +174,10 @@ def groupby_weighted_std(data_col=None, weight_col=None, by_col=None, data=None,
     >>> np.std([2,2,2])
     0.0
     """
-    def weighted_sd(input_df):
-        weights = input_df[weight_col]
-        vals = input_df[data_col]
-
-        weighted_avg = np.average(vals, weights=weights)
-        
-        numer = np.sum(weights * (vals - weighted_avg)**2)
-        denom = ((vals.count()-ddof)/vals.count())*np.sum(weights)
-        
-        return np.sqrt(numer/denom)
-
-    return data.groupby(by_col).apply(weighted_sd)
+    codes, index = grouped_kernels.group_codes(data, by_col)
+    result = grouped_kernels.grouped_weighted_std(codes, data[data_col].to_numpy(dtype=np.float64),
+                                                  data[weight_col].to_numpy(dtype=np.float64), len(index), ddof=ddof)
+    return pd.Series(result, index=index)
 
 
 def weighted_quantile(values, quantiles, sample_weight=None, 
@@ -220,20 +222,30 @@ def weighted_quantile(values, quantiles, sample_weight=None,
     return np.interp(quantiles, weighted_quantiles, values)
 
 def groupby_weighted_quantile(data_col=None, weight_col=None, by_col=None, 
-                              data=None, transform=False, new_column_name=''):
+                              data=None, quantiles=0.5, old_style=False, transform=False, new_column_name=''):
     """
-    This can already be accomplished with weighted_quantile, as demonstrated above. 
-    This function is for convenience.
+    Grouped version of `weighted_quantile`, computed for all the groups at once. With a single quantile, it returns
+    the same as
+
+    >>> data.groupby(by_col).apply(lambda x: weighted_quantile(x[data_col], quantiles, sample_weight=x[weight_col]))
+
+    and, with a list of quantiles, a DataFrame with one column per quantile. Rows with a missing value or weight are
+    skipped. With `transform=True`, it returns the quantile of the group of every row (single quantile only).
     """
-    raise NotImplementedError
-    median_SD_spread = data.groupby('date').apply(
-        lambda x: weighted_quantile(x['rate_SD_spread'], 0.5, sample_weight=x['Volume']))
-    return None
+    codes, index = grouped_kernels.group_codes(data, by_col)
+    weights = None if weight_col is None else data[weight_col].to_numpy(dtype=np.float64)
+    result = grouped_kernels.grouped_weighted_quantile(codes, data[data_col].to_numpy(dtype=np.float64), weights,
+                                                       len(index), quantiles, old_style=old_style)
+    if np.ndim(quantiles) == 0:
+        return _grouped_result(result[:, 0], codes, index, data.index, transform, new_column_name)
+    return pd.DataFrame(result, index=index, columns=list(quantiles))
 
 def load_date_mapping(data_dir=None,
     add_remaining_days_in_year=True,
     add_estimated_historical_days=True, historical_start='2016-01-01',
-    add_estimated_future_dates=True, future_end='2092-01-01'):
+    add_estimated_future_dates=True, future_end=None, max_horizon=26):
+    # By default, the estimated future dates go `max_horizon` trading days (at most twice as many calendar days) past the
+    # end of the sample, instead of building the calendar for decades
     data_dir = Path(data_dir)
     df_dm = pd.read_csv(data_dir / 'derived' / 'all_dates_dvp.csv', header=None)
     df_dm = df_dm.rename(columns={0:'date'})
@@ -251,84 +263,45 @@ def load_date_mapping(data_dir=None,
     pbd = pd.DataFrame(bdate_range_dvp_data_bounds, columns=['date']).reset_index().rename(columns={0:'pbd_day_num'})
     # all dates in dvp data are pandas business days.
     # Not all pandas business days are in the dvp data
-    merge_stats = misc_tools.merge_stats(df_dm, pbd, on=['date'])
-    assert merge_stats["left-intersection"] == 0
+    merge_stats_ = merge_stats(df_dm, pbd, on=['date'])
+    assert merge_stats_["left-intersection"] == 0
 
-    END_OF_CURRENT_YEAR = '2022-12-31'
-    if add_remaining_days_in_year:
-        ## Get forward looking list of holidays so I can compute "day_num"
-        # for remaining days in year. I can do this, because DTCC publishes the days
-        # that are expected to be holidays for the remaining year. So, I have the
-        # 2022 holidays. They haven't yet published the expected 2023 holidays.
-        #
-        # DTCC Holidays for 2022: https://www.dtcc.com/-/media/Files/pdf/2021/11/22/16162-21.pdf
-        holidays = [
-            'jan-17-2022',
-            'feb-21-2022',
-            'apr-15-2022',
-            'may-30-2022',
-            'jun-20-2022',
-            'jul-04-2022',
-            'sep-05-2022',
-            'oct-10-2022',
-            'nov-11-2022',
-            'nov-24-2022',
-            'dec-26-2022'
-        ]
-        holidays = pd.to_datetime(holidays)
+    if future_end is None:
+        future_end = max(pd.Timestamp(config.END_DATE), pd.Timestamp(end_date.year, 12, 31)) + pd.DateOffset(days=2 * max_horizon)
+    # Built once per process and cached on disk (see `trading_calendar`)
+    market_calendar = load_trading_calendar('SIFMA_US', start_date=historical_start, end_date=future_end,
+                                            data_dir=data_dir)
+    calendar_days = market_calendar.date_mapping()['date']
+    end_of_current_year = pd.Timestamp(end_date.year, 12, 31)
 
-        today = pd.to_datetime(date.today())
-        BEGINNING_OF_NEXT_YEAR = pd.to_datetime('2023-01-01')
-        if today > BEGINNING_OF_NEXT_YEAR:
-            raise ValueError("Update this function to account for DTCC holidays in 2023")
-        bdate_remaining_year_range = pd.bdate_range(start=end_date, end=BEGINNING_OF_NEXT_YEAR)
-        bdate_remaining_year_range = bdate_remaining_year_range.drop(holidays, errors="ignore")
-        dates = pd.concat([dates, pd.Series(bdate_remaining_year_range)])
+    if add_remaining_days_in_year:
+        ## Trading days of the remaining days of the year of the last DVP date, from the SIFMA calendar instead of a
+        # hard-coded list of the DTCC holidays of one year
+        dates = pd.concat([dates, calendar_days[calendar_days.between(end_date, end_of_current_year)]])
 
     if add_estimated_historical_days:
 
         ## Check if the dvp holidays match with the SIFMA holidays for which
         # we have DVP data
-        # pandas_market_calendars.get_calendar_names()
-        market_calendar = pandas_market_calendars.get_calendar('SIFMA_US')
-        # holidays = market_calendar.holidays()
-
-        # The following doesn't fix the issue with 2021-04-02
-        # schedule = market_calendar.schedule(start_date=start_date, end_date=end_date)
-        # early_closes = market_calendar.early_closes(schedule).index
-        # valid_days.intersection(early_closes).symmetric_difference(dates)
-
-        valid_days = market_calendar.valid_days(start_date=start_date, end_date=end_date)
-        valid_days = valid_days.tz_localize(None) #.astype('datetime64[ns]')
+        valid_days = pd.DatetimeIndex(calendar_days[calendar_days.between(start_date, end_date)])
         # SIFMA recommended 2021-04-02 an early close for Good Friday. But there
         # was no trading in DTCC's FICC that day. I don't have a DTCC specific
         # calendar.
         valid_days = valid_days.drop('2021-04-02')
         mismatched_days = valid_days.symmetric_difference(dvp_data_dates)
-        # set(valid_days).difference(dates)
-        # set(dates).difference(valid_days)
-        # subdf = df.loc[df['day'] == '20210402', :]
         assert len(mismatched_days) == 0
 
         ## Now construct historical calendar
-        historical_start = pd.to_datetime(historical_start)
-        valid_days = market_calendar.valid_days(start_date=historical_start, end_date=start_date)
-        valid_days = valid_days.tz_localize(None) #.astype('datetime64[ns]')
-        valid_days = pd.to_datetime(pd.Series(valid_days))
+        valid_days = calendar_days[calendar_days.between(pd.to_datetime(historical_start), start_date)]
         dates = pd.concat([valid_days, dates])
 
     if add_estimated_future_dates:
 
         ## Construct future calendar
-        # pandas_market_calendars.get_calendar_names()
-        market_calendar = pandas_market_calendars.get_calendar('SIFMA_US')
-        future_end = pd.to_datetime(future_end)
-        valid_days = market_calendar.valid_days(start_date=END_OF_CURRENT_YEAR, end_date=future_end)
-        valid_days = valid_days.tz_localize(None) #.astype('datetime64[ns]')
-        valid_days = pd.to_datetime(pd.Series(valid_days))
+        valid_days = calendar_days[calendar_days.between(end_of_current_year, future_end)]
         dates = pd.concat([dates, valid_days])
 
-    df_dm = pd.DataFrame(list(set(dates)), columns=['date'])
+    df_dm = pd.DataFrame({'date': pd.to_datetime(dates).drop_duplicates()})
     df_dm = df_dm.sort_values(ascending=True, by='date')
     df_dm = df_dm.reset_index(drop=True)
     df_dm = df_dm.reset_index().rename(columns={'index':'day_num'})
@@ -427,6 +400,83 @@ def with_lagged_columns(data=None, columns_to_lag=None, id_columns=None, lags=1,
     return w_data_lag
 
 
+def with_multi_horizon_lagged_columns(data=None, columns_to_lag=None, id_columns=None, lags=[1],
+                                      date_col='date', prefix='L', day_numbers=None):
+    """
+    Faster, multi-horizon version of `with_lagged_columns`: adds the columns `{prefix}{lag}_{col}` for every lag of `lags`
+    and every column of `columns_to_lag` (negative lags are leads), without any merge.
+
+    As in `with_lagged_columns`, a lag of `h` takes the value of the same id `h` dates earlier, dates being numbered by
+    their rank among all the dates present in the data, and is NaN if the id has no row on that date. `day_numbers` can be
+    given instead (an integer day number for every row, e.g. `TradingCalendar.day_numbers` of the `trading_calendar`
+    module) to count lags in trading days.
+
+    The rows are sorted once by (id, day number) into an array of integer keys. For each lag, the row `h` positions
+    earlier in that array is the lagged row whenever its key is exactly `h` less (no gap in between, and same id); the
+    remaining rows are looked up with a binary search. The (id, date) pairs are expected to be unique: with duplicates,
+    the first row of the (id, date) is used, where `with_lagged_columns` would return every combination of duplicates.
+
+    >>> data_lag = with_multi_horizon_lagged_columns(data=data, columns_to_lag=['value'], id_columns=['id'], lags=[1, -1])
+    >>> data_lag
+
+        id	date	    value	L1_value	L-1_value
+    0	1	1990-01-01	1.0	    NaN	        2.0
+    1	1	1990-02-01	2.0	    1.0	        3.0
+    2	1	1990-03-01	3.0	    2.0	        NaN
+    3	2	1989-12-01	3.0	    NaN	        3.0
+    4	2	1990-01-01	3.0	    3.0	        4.0
+    5	2	1990-02-01	4.0	    3.0	        5.5
+    6	2	1990-03-01	5.5	    4.0	        5.0
+    7	2	1990-04-01	5.0	    5.5	        6.0
+    8	2	1990-06-01	6.0	    5.0	        NaN
+    """
+    if day_numbers is None:
+        day_numbers = date_numbers(data[date_col].to_numpy())
+
+    if len(id_columns) == 1:
+        codes = pd.factorize(data[id_columns[0]])[0]
+    else:
+        codes = data.groupby(id_columns, sort=False, dropna=False).ngroup().to_numpy()
+
+    max_lag = max(abs(lag) for lag in lags) if len(lags) else 0
+    # Leave room for the largest lag so that a shifted key never falls into the range of another id
+    keys, _, span, _ = security_day_keys(codes, day_numbers, pad=max_lag)
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sorted_values = [data[col].to_numpy()[order] for col in columns_to_lag]
+    n = len(sorted_keys)
+    positions = np.arange(n)
+
+    # Column-major block so that each lagged column is written in one contiguous pass
+    dtype = np.result_type(np.float64, *[values.dtype for values in sorted_values])
+    lagged = np.empty((n, len(lags) * len(columns_to_lag)), dtype=dtype, order='F')
+    new_columns = []
+    for i, lag in enumerate(lags):
+        # Positional shift: the row `lag` positions earlier is the lagged row when its key is `lag` less
+        shifted_keys = np.full(n, -1, dtype=np.int64)
+        shifted_rows = np.full(n, -1, dtype=np.int64)
+        if 0 <= lag < n:
+            shifted_keys[lag:], shifted_rows[lag:] = sorted_keys[:n - lag], positions[:n - lag]
+        elif -n < lag < 0:
+            shifted_keys[:n + lag], shifted_rows[:n + lag] = sorted_keys[-lag:], positions[-lag:]
+        target = sorted_keys - lag
+        found = shifted_keys == target
+        source = np.where(found, shifted_rows, 0)
+
+        # Binary search for the rows with gaps in their history
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            source[missing], found[missing] = match_security_days(sorted_keys, target[missing], span)
+
+        for j, col in enumerate(columns_to_lag):
+            # Computed in sorted order, stored back in the order of `data`
+            lagged[order, i * len(columns_to_lag) + j] = np.where(found, sorted_values[j][source], np.nan)
+            new_columns.append(f'{prefix}{lag}_{col}')
+
+    return pd.concat([data, pd.DataFrame(lagged, index=data.index, columns=new_columns)], axis=1)
+
+
 def leave_one_out_sums(df, groupby=[], summed_col=''):
     """
     Compute leave-one-out sums, x_i = \sum_{\ell'\neq\ell} w_{i, \ell'}
@@ -455,7 +505,11 @@ def leave_one_out_sums(df, groupby=[], summed_col=''):
         s,
         check_names=False)
     """
-    s = df.groupby(groupby)[summed_col].transform(lambda x: x.sum() - x)
+    codes, index = grouped_kernels.group_codes(df, groupby)
+    s = grouped_kernels.leave_one_out_sum(codes, df[summed_col].to_numpy(dtype=np.float64), len(index))
+    s = pd.Series(s, index=df.index, name=summed_col)
+    if pd.api.types.is_integer_dtype(df[summed_col]) and (codes >= 0).all():
+        s = s.astype(df[summed_col].dtype)
     return s
 
 
@@ -608,8 +662,11 @@ def plot_weighted_median_with_distribution_bars(data=None, variable_name=None,
         plt.clf();
         fig, ax = plt.subplots();
 
-    median_series = data.groupby(date_col).apply(
-        lambda x: weighted_quantile(x[variable_name], 0.5, sample_weight=x[weight_col]))
+    # The median and both bands of every date from a single sort of all the rows (see `groupby_weighted_quantile`)
+    quantiles = [0.5, *percentiles] if percentile_bars else [0.5]
+    bands = groupby_weighted_quantile(data_col=variable_name, weight_col=weight_col, by_col=date_col, data=data,
+                                      quantiles=quantiles)
+    median_series = bands.iloc[:, 0]
     if rolling:
         wavrs = median_series.rolling(rolling_window, min_periods=rolling_min_periods).mean();
     else:
@@ -617,8 +674,7 @@ def plot_weighted_median_with_distribution_bars(data=None, variable_name=None,
     (wavrs * rescale_factor).plot(ax=ax, label=label);
 
     if percentile_bars:
-        lower = data.groupby(date_col).apply(lambda x: weighted_quantile(x[variable_name], percentiles[0], sample_weight=x[weight_col]))
-        upper = data.groupby(date_col).apply(lambda x: weighted_quantile(x[variable_name], percentiles[1], sample_weight=x[weight_col]))
+        lower, upper = bands.iloc[:, 1], bands.iloc[:, 2]
         if rolling:
             lower = lower.rolling(rolling_window, min_periods=rolling_min_periods).mean()
             upper = upper.rolling(rolling_window, min_periods=rolling_min_periods).mean()
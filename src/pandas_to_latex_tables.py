@@ -16,7 +16,10 @@ YOUR LATEX TABLE CODE HERE
 \end{document}
 
 """
+import hashlib
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 import numpy as np
@@ -24,6 +27,7 @@ np.random.seed(100)
 
 import config
 from pathlib import Path
+from compute_desc_stats import STATS_DATASET, read_stats_dataset, stats_table
 DATA_DIR = Path(config.DATA_DIR)
 OUTPUT_DIR = Path(config.OUTPUT_DIR)
 
@@ -35,24 +39,137 @@ pd.set_option('display.float_format', lambda x: '%.4f' % x)
 float_format_func = lambda x: '{:.4f}'.format(x)
 
 
+# Manifest of the hashes of the sources of the LaTeX tables, in the output directory
+LATEX_MANIFEST = Path("stats_state") / "latex_manifest.json"
+# Part of every hash, so that changing the rendering of the tables renders them all again
+LATEX_RENDERING = f"to_latex float_format={float_format_func(1.23456789)}"
+
+
+def _latex_file_name(file_name):
+    """
+    Returns the name of the LaTeX table of a .parquet file of the stats folder.
+    """
+    return file_name.replace(" ", "_").replace(".parquet", ".tex")
+
+
+def _write_latex_table(df, output_dir, file_name):
+    """
+    Writes a DataFrame as the LaTeX table of the `tables` folder named after the .parquet file `file_name`, through a
+    temporary file so that the table is never left half written. Returns the path of the table.
+    """
+    latex_table_string = df.to_latex(float_format=float_format_func).replace("%", "\\%")
+    path = Path(output_dir) / "tables" / _latex_file_name(file_name)
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "w") as text_file:
+        text_file.write(latex_table_string)
+    os.replace(temporary_path, path)
+    return path
+
+
+def _stats_dataset_tables(output_dir, horizons):
+    """
+    Returns a dictionary mapping the name of the .parquet file of every table of the consolidated descriptive statistics
+    dataset (read in one scan) of the levels and of the changes at `horizons` to the table, and the names of the tables of
+    the other horizons left in the dataset by earlier runs.
+    """
+    if not (Path(output_dir) / STATS_DATASET).exists():
+        return {}, set()
+    long_stats = read_stats_dataset(output_dir)
+    tables, other_horizons = {}, set()
+    for (indicator, dimension, horizon), rows in long_stats.groupby(['indicator', 'dimension', 'horizon'], sort=False):
+        suffix = '' if horizon == 0 else f'_change_{horizon}'
+        file_name = f"{indicator + '_' + dimension + suffix}.parquet"
+        if horizon == 0 or horizon in horizons:
+            tables[file_name] = stats_table(rows, indicator, dimension, horizon)
+        else:
+            other_horizons.add(file_name)
+    return tables, other_horizons
+
+
+def _stats_files(output_dir):
+    """
+    Returns the paths of the .parquet files of the stats folder of the output directory.
+    """
+    return [Path(root) / file for root, dirs, files in os.walk(Path(output_dir) / "stats")
+            for file in sorted(files) if file.endswith(".parquet")]
+
+
+def _table_hash(df):
+    """
+    Returns the hash of the content of a table.
+    """
+    digest = hashlib.sha256(LATEX_RENDERING.encode())
+    digest.update(repr((list(df.columns), df.index.name)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _file_hash(path):
+    """
+    Returns the hash of the content of a file.
+    """
+    digest = hashlib.sha256(LATEX_RENDERING.encode())
+    digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
 def parquet_to_latex_table(output_dir=OUTPUT_DIR):
     """
     Read the .parquet file in the data directory and convert to LaTeX table
+
+    All the tables are rendered again (see `update_latex_tables`). Returns the paths of the tables written.
+    """
+    return update_latex_tables(output_dir=output_dir, force=True)
+
+
+def update_latex_tables(output_dir=OUTPUT_DIR, n_jobs=8, force=False, horizons=config.CHANGE_HORIZONS):
     """
-    file_names = []
-    for root, dirs, files in os.walk(OUTPUT_DIR / "stats"):
-        for file in files:
-            file_names.append(file)
+    Converts to LaTeX the tables of the consolidated descriptive statistics dataset and the other .parquet files of the
+    stats folder, rendering only the tables whose source changed since the last run. The descriptive statistics of the
+    changes at other horizons than `horizons`, left over by earlier runs, are not converted.
+
+    The hash of the source of every table (the content of the table for the dataset, the bytes of the file otherwise) is
+    kept in the `LATEX_MANIFEST` of the output directory. Tables with a new hash or without their .tex file, or all of them
+    with `force=True`, are rendered on a pool of `n_jobs` threads, each written atomically, and the manifest is updated with
+    the tables rendered successfully. Returns the paths of the tables written.
+    """
+    output_dir = Path(output_dir)
+    (output_dir / "tables").mkdir(parents=True, exist_ok=True)
+
+    # File name -> (hash of the source, function returning the table)
+    sources = {}
+    tables, other_horizons = _stats_dataset_tables(output_dir, horizons)
+    for file_name, df in tables.items():
+        sources[file_name] = (_table_hash(df), lambda df=df: df)
+    for path in _stats_files(output_dir):
+        if path.name not in sources and path.name not in other_horizons:
+            sources[path.name] = (_file_hash(path), lambda path=path: pd.read_parquet(path))
+
+    manifest_path = output_dir / LATEX_MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    stale = [file_name for file_name, (digest, _) in sources.items()
+             if force or manifest.get(file_name) != digest
+             or not (output_dir / "tables" / _latex_file_name(file_name)).exists()]
+    new_manifest = {file_name: digest for file_name, (digest, _) in sources.items() if file_name not in stale}
 
-    for file_name in file_names:
-        df = pd.read_parquet(OUTPUT_DIR / "stats" / file_name)
+    def render(file_name):
+        return _write_latex_table(sources[file_name][1](), output_dir, file_name)
 
-        latex_table_string = df.to_latex(float_format=float_format_func).replace("%", "\%")
-        path = output_dir / "tables" / f'{file_name.replace(" ","_").replace(".parquet", ".tex")}'
-        with open(path, "w") as text_file:
-            text_file.write(latex_table_string)
+    written = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(n_jobs, 1)) as executor:
+            futures = {executor.submit(render, file_name): file_name for file_name in stale}
+            for future in as_completed(futures):
+                written.append(future.result())
+                new_manifest[futures[future]] = sources[futures[future]][0]
+    finally:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = manifest_path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(dict(sorted(new_manifest.items())), indent=2))
+        os.replace(temporary_path, manifest_path)
+    return sorted(written)
 
 
 if __name__ == '__main__':
-    # Compute the descriptive statistics and store them in the data directory as .csv files
-    parquet_to_latex_table(output_dir=OUTPUT_DIR)
+    # Convert the tables of the stats that changed since the last run
+    _ = update_latex_tables(output_dir=OUTPUT_DIR)
@@ -0,0 +1,182 @@
+"""
+The `panel_cube.py` module has been designed to store the indicators of the merged data as dense (date, security) arrays
+on disk, so that cross-sectional and time-series slices are read without scanning and pivoting the long data again.
+
+The module contains the following:
+    * build_panel_cube - Writes one dense 2-D float32 `.npy` array per column, with the date and security axes.
+    * PanelCube - Memory-mapped access to a cube written by `build_panel_cube`, with date and security slicing.
+    * load_panel_cube - Opens the cube of a merged dataset of the data directory, building it if needed.
+
+A cube is a folder with `dates.npy`, `securities.npy`, one `{column}.npy` per column (spaces replaced by underscores) of
+shape (number of dates, number of securities), NaN where the security has no value, and a `manifest.json` written last.
+The arrays are opened with `np.load(..., mmap_mode='r')`: opening a cube reads only the axes, and the rows are dates, so
+the cross-section of a date is a contiguous row and the time series of a security a strided column of the same memory
+map, both views that do not copy anything.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import config
+
+DATA_DIR = Path(config.DATA_DIR)
+LENDING_INDICATORS = config.LENDING_INDICATORS
+CUBE_COLUMNS = [*LENDING_INDICATORS, 'current_rri', 'trend_rri']
+
+
+def _array_file_name(column):
+    """
+    Returns the name of the `.npy` file of a column of the cube.
+    """
+    return f"{column.replace(' ', '_').replace('/', '_')}.npy"
+
+
+def build_panel_cube(df, cube_dir, columns=CUBE_COLUMNS, id_col='cusip', date_col='date', dtype=np.float32):
+    """
+    The `build_panel_cube` function writes the `columns` of the long panel `df` as a cube in `cube_dir` (see the module
+    docstring). Dates and securities are sorted. With several rows per (security, date), as in the merged data with one
+    row per incident, the first row is used.
+
+    Every array is written to a temporary file and renamed, and the manifest is written last, so that an interrupted build
+    never leaves a cube that looks complete. The function returns the `PanelCube`.
+    """
+    cube_dir = Path(cube_dir)
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = cube_dir / "manifest.json"
+    manifest_path.unlink(missing_ok=True)
+
+    id_codes, securities = pd.factorize(df[id_col], sort=True)
+    date_codes, dates = pd.factorize(df[date_col], sort=True)
+    shape = (len(dates), len(securities))
+    # The first row of every (security, date) pair is written last, so that it is the one kept
+    rows = np.flatnonzero((id_codes >= 0) & (date_codes >= 0))[::-1]
+
+    np.save(cube_dir / "dates.npy", np.asarray(dates, dtype='datetime64[ns]'))
+    np.save(cube_dir / "securities.npy", np.asarray(securities, dtype=str))
+    files = {}
+    for column in columns:
+        files[column] = _array_file_name(column)
+        tmp_path = cube_dir / f"{files[column]}.tmp"
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+        array[:] = np.nan
+        array[date_codes[rows], id_codes[rows]] = df[column].to_numpy(dtype=np.float64)[rows]
+        array.flush()
+        del array
+        os.replace(tmp_path, cube_dir / files[column])
+
+    manifest = {'columns': files, 'shape': list(shape), 'dtype': np.dtype(dtype).name, 'id_col': id_col,
+                'date_col': date_col}
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return PanelCube(cube_dir)
+
+
+class PanelCube:
+    """
+    Memory-mapped (date, security) arrays of a cube written by `build_panel_cube`.
+
+    `cube[column]` is the whole memory-mapped array of a column, mapped on first use. `on_date` and `for_security` return
+    the cross-section of one date and the time series of one security as views of that array, `date_slice` the row range
+    of a period, and `cross_section` and `time_series` the same slices of several columns as DataFrames.
+    """
+
+    def __init__(self, cube_dir, mmap_mode='r'):
+        self.cube_dir = Path(cube_dir)
+        manifest_path = self.cube_dir / "manifest.json"
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"{manifest_path} not found")
+        self.manifest = json.loads(manifest_path.read_text())
+        self.mmap_mode = mmap_mode
+        self.dates = pd.DatetimeIndex(np.load(self.cube_dir / "dates.npy"), name=self.manifest['date_col'])
+        self.securities = pd.Index(np.load(self.cube_dir / "securities.npy"), name=self.manifest['id_col'])
+        self._arrays = {}
+
+    def __repr__(self):
+        return (f"PanelCube({len(self.dates)} dates x {len(self.securities)} securities, "
+                f"columns={self.columns})")
+
+    @property
+    def columns(self):
+        return list(self.manifest['columns'])
+
+    def __getitem__(self, column):
+        if column not in self._arrays:
+            if column not in self.manifest['columns']:
+                raise KeyError(column)
+            self._arrays[column] = np.load(self.cube_dir / self.manifest['columns'][column], mmap_mode=self.mmap_mode)
+        return self._arrays[column]
+
+    def date_position(self, date):
+        """
+        Returns the row of a date, raising a `KeyError` if the date is not in the cube.
+        """
+        return self.dates.get_loc(pd.Timestamp(date))
+
+    def security_position(self, security):
+        """
+        Returns the column of a security, raising a `KeyError` if the security is not in the cube.
+        """
+        return self.securities.get_loc(security)
+
+    def on_date(self, column, date):
+        """
+        Returns the values of `column` of all the securities on `date` (a contiguous view).
+        """
+        return self[column][self.date_position(date)]
+
+    def for_security(self, column, security):
+        """
+        Returns the values of `column` of `security` on all the dates (a strided view).
+        """
+        return self[column][:, self.security_position(security)]
+
+    def date_slice(self, start=None, end=None):
+        """
+        Returns the slice of the rows of the dates from `start` to `end` (both included), to index the arrays with.
+        """
+        return slice(*self.dates.slice_locs(start, end))
+
+    def cross_section(self, date, columns=None):
+        """
+        Returns a DataFrame indexed by security with the values of `columns` (by default all) on `date`.
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({column: self.on_date(column, date) for column in columns}, index=self.securities)
+
+    def time_series(self, security, columns=None, start=None, end=None):
+        """
+        Returns a DataFrame indexed by date with the values of `columns` (by default all) of `security` from `start` to
+        `end`.
+        """
+        columns = self.columns if columns is None else columns
+        rows = self.date_slice(start, end)
+        return pd.DataFrame({column: self.for_security(column, security)[rows] for column in columns},
+                            index=self.dates[rows])
+
+
+def load_panel_cube(file_name="merged_data", columns=CUBE_COLUMNS, data_dir=DATA_DIR, from_cache=True):
+    """
+    The `load_panel_cube` function returns the `PanelCube` of the `file_name` merged dataset of the `pulled` folder of the
+    data directory, stored in `derived/{file_name}_cube`.
+
+    The cube is opened from disk if it exists, has all the `columns` and is more recent than the dataset. Otherwise, it is
+    built with `build_panel_cube`.
+    """
+    source_path = Path(data_dir) / "pulled" / f"{file_name}.parquet"
+    cube_dir = Path(data_dir) / "derived" / f"{file_name}_cube"
+    manifest_path = cube_dir / "manifest.json"
+    if from_cache and manifest_path.exists():
+        up_to_date = not source_path.exists() or source_path.stat().st_mtime <= manifest_path.stat().st_mtime
+        cube = PanelCube(cube_dir)
+        if up_to_date and set(columns) <= set(cube.columns):
+            return cube
+
+    df = pd.read_parquet(source_path, columns=['cusip', 'date', *columns])
+    return build_panel_cube(df, cube_dir, columns=columns)
+
+
+if __name__ == "__main__":
+    _ = load_panel_cube("merged_data", data_dir=DATA_DIR, from_cache=False)
@@ -0,0 +1,271 @@
+"""
+The `panel_regression.py` module has been designed to run regressions of the lending indicators on the RepRisk incident
+variables with security and date fixed effects on the merged panel, without building any dummy matrix.
+
+The module contains the following functions:
+    * fixed_effect_codes - Returns the integer codes of the fixed effects of a DataFrame.
+    * drop_singletons - Drops the rows alone in their group of any fixed effect.
+    * demean - Absorbs the fixed effects of several columns by alternating projections.
+    * clustered_covariance - One- or multi-way clustered covariance matrix of OLS coefficients.
+    * fit_panel_ols - Fits an OLS regression with absorbed fixed effects and clustered standard errors.
+    * regress_lending_on_esg - Runs `fit_panel_ols` for every lending indicator on the daily incident variables.
+
+By the Frisch-Waugh-Lovell theorem, the coefficients of the regression with fixed effects are the ones of the regression
+of the outcome on the regressors after both are demeaned within every fixed effect. With several fixed effects, demeaning
+within one undoes part of the demeaning within the others, so the group means of every fixed effect are subtracted in turn
+(one `np.bincount` per fixed effect) until the columns stop changing (the method of alternating projections). Memory and
+time are linear in the number of rows, whatever the number of securities and dates.
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import config
+
+LENDING_INDICATORS = config.LENDING_INDICATORS
+# Incident variables of the merged data with the incidents aggregated per day (see `aggregate_daily_incidents`)
+ESG_DAILY = ['severity_max', 'novelty_max', 'reach_max', 'environment_any', 'social_any', 'governance_any']
+
+
+def fixed_effect_codes(df, fixed_effects):
+    """
+    The `fixed_effect_codes` function returns the list of the integer codes (0 to number of groups - 1) of every fixed
+    effect of `fixed_effects`, a fixed effect being a column or a tuple of columns (interacted fixed effect).
+    """
+    codes = []
+    for fixed_effect in fixed_effects:
+        if isinstance(fixed_effect, (list, tuple)):
+            codes.append(df.groupby(list(fixed_effect), sort=False).ngroup().to_numpy(dtype=np.int64))
+        else:
+            codes.append(pd.factorize(df[fixed_effect])[0].astype(np.int64))
+    return codes
+
+
+def drop_singletons(codes_list):
+    """
+    The `drop_singletons` function returns the boolean mask of the rows to keep after iteratively dropping the rows alone
+    in their group of any fixed effect (they are perfectly fitted by their fixed effect and would only bias the standard
+    errors).
+    """
+    keep = np.ones(len(codes_list[0]) if codes_list else 0, dtype=bool)
+    while True:
+        singletons = np.zeros_like(keep)
+        for codes in codes_list:
+            counts = np.bincount(codes[keep])
+            singletons[keep] |= counts[codes[keep]] == 1
+        if not singletons.any():
+            return keep
+        keep &= ~singletons
+
+
+def demean(X, codes_list, weights=None, tol=1e-10, max_iter=10_000):
+    """
+    The `demean` function has been designed to absorb the fixed effects of `codes_list` (a list of integer code arrays) from
+    every column of the 2-D array `X`, optionally with observation `weights`.
+
+    The (weighted) group means of every fixed effect are subtracted in turn until the largest change of a value over a full
+    sweep is below `tol` times the scale of its column. The function returns the demeaned array and the number of sweeps.
+    """
+    X = np.array(X, dtype=np.float64, order='F')
+    if X.ndim == 1:
+        X = X[:, None]
+    weights = np.ones(len(X)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if not codes_list:
+        return X, 0
+
+    group_weights = [np.bincount(codes, weights=weights) for codes in codes_list]
+    scale = np.maximum(np.abs(X).max(axis=0, initial=0.), 1e-300)
+    for iteration in range(1, max_iter + 1):
+        max_change = 0.
+        for codes, total_weights in zip(codes_list, group_weights):
+            for k in range(X.shape[1]):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means = np.bincount(codes, weights=weights * X[:, k], minlength=len(total_weights)) / total_weights
+                change = means[codes]
+                X[:, k] -= change
+                max_change = max(max_change, np.abs(change).max(initial=0.) / scale[k])
+        # A single fixed effect is absorbed in one sweep
+        if max_change < tol or len(codes_list) == 1:
+            return X, iteration
+    raise RuntimeError(f"Demeaning did not converge in {max_iter} sweeps")
+
+
+def clustered_covariance(X, residuals, clusters, bread=None, dof_correction=True, absorbed_dof=0):
+    """
+    The `clustered_covariance` function returns the covariance matrix of the OLS coefficients of the regressors `X` with
+    standard errors clustered on every array of `clusters` (one-way for a single array, Cameron-Gelbach-Miller multi-way
+    otherwise), and the smallest number of clusters.
+
+    With `dof_correction`, every term is scaled by G / (G - 1) * (N - 1) / (N - K), with G its number of clusters, N the
+    number of observations and K the number of regressors plus the `absorbed_dof` fixed-effect parameters.
+    """
+    n, k = X.shape
+    if bread is None:
+        bread = np.linalg.inv(X.T @ X)
+    scores = X * residuals[:, None]
+
+    covariance = np.zeros((k, k))
+    n_clusters = []
+    # Inclusion-exclusion over the intersections of the cluster dimensions
+    for size in range(1, len(clusters) + 1):
+        for subset in combinations(range(len(clusters)), size):
+            codes = pd.factorize(pd.MultiIndex.from_arrays([clusters[i] for i in subset])
+                                 if size > 1 else clusters[subset[0]])[0]
+            n_groups = codes.max() + 1
+            summed = np.column_stack([np.bincount(codes, weights=scores[:, j], minlength=n_groups) for j in range(k)])
+            meat = summed.T @ summed
+            if dof_correction:
+                meat *= n_groups / max(n_groups - 1, 1) * (n - 1) / max(n - k - absorbed_dof, 1)
+            covariance += (-1) ** (size + 1) * (bread @ meat @ bread)
+            if size == 1:
+                n_clusters.append(n_groups)
+
+    # A multi-way covariance matrix can have negative eigenvalues, which are set to zero
+    if len(clusters) > 1:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        covariance = (eigenvectors * np.maximum(eigenvalues, 0)) @ eigenvectors.T
+    return covariance, int(min(n_clusters))
+
+
+def _nested(codes, clusters):
+    """
+    Returns whether every group of `codes` lies within a single cluster of one of the `clusters` arrays.
+    """
+    for cluster in clusters:
+        cluster_codes = pd.factorize(cluster)[0]
+        first_cluster = np.full(codes.max() + 1, -1)
+        first_cluster[codes] = cluster_codes
+        if (first_cluster[codes] == cluster_codes).all():
+            return True
+    return False
+
+
+def fit_panel_ols(df, y, x, fixed_effects=['cusip', 'date'], cluster=['cusip'], weights=None, fillna=None,
+                  singletons=False, tol=1e-10):
+    """
+    The `fit_panel_ols` function has been designed to regress `y` on the columns of `x` with the fixed effects of
+    `fixed_effects` absorbed (columns or tuples of columns for interacted fixed effects), and standard errors clustered on
+    the columns of `cluster` (one or several, heteroskedasticity-robust if None).
+
+    Rows with a missing outcome, regressor, fixed effect or cluster are dropped; `fillna` fills the missing regressors
+    first (e.g. 0 for the incident variables of the days without incident). Rows alone in their fixed-effect group are
+    dropped unless `singletons` is True. Regressors constant within a fixed effect are collinear with it and get a NaN
+    coefficient.
+
+    The function returns a DataFrame indexed by regressor with the `coef`, `std_err`, `t_stat`, `p_value` and 95% confidence
+    interval (`ci_lower`, `ci_upper`), with the number of observations (`n_obs`), of clusters (`n_clusters`), of
+    fixed-effect groups (`n_groups`), the within R-squared (`r2_within`) and the number of sweeps of the demeaning
+    (`iterations`) as attributes. The p-values use a Student distribution with the number of clusters minus one degrees
+    of freedom (or N - K without clustering).
+    """
+    x = [x] if isinstance(x, str) else list(x)
+    cluster = [] if cluster is None else ([cluster] if isinstance(cluster, str) else list(cluster))
+    fe_columns = [col for fe in fixed_effects for col in (fe if isinstance(fe, (list, tuple)) else [fe])]
+
+    regressors = df[x].astype(np.float64)
+    if fillna is not None:
+        regressors = regressors.fillna(fillna)
+    keep = regressors.notna().all(axis=1).to_numpy() & df[y].notna().to_numpy()
+    keep &= df[list(dict.fromkeys(fe_columns + cluster))].notna().all(axis=1).to_numpy()
+    rows = np.flatnonzero(keep)
+    codes_list = fixed_effect_codes(df.iloc[rows], fixed_effects)
+    if not singletons and codes_list:
+        keep_rows = drop_singletons(codes_list)
+        rows, codes_list = rows[keep_rows], [pd.factorize(codes[keep_rows])[0] for codes in codes_list]
+    data = df.iloc[rows]
+    regressors = regressors.to_numpy()[rows]
+    w = None if weights is None else data[weights].to_numpy(dtype=np.float64)
+
+    Z, iterations = demean(np.column_stack([data[y].to_numpy(dtype=np.float64), regressors]), codes_list, weights=w,
+                           tol=tol)
+    y_tilde, X_tilde = Z[:, 0], Z[:, 1:]
+    if w is not None:
+        root_weights = np.sqrt(w)
+        y_tilde, X_tilde = y_tilde * root_weights, X_tilde * root_weights[:, None]
+
+    # Regressors absorbed by the fixed effects (no variation left) are dropped from the estimation
+    n = len(y_tilde)
+    scale = np.maximum(np.abs(regressors).max(axis=0, initial=0.), 1e-300) if n else np.ones(len(x))
+    identified = np.abs(X_tilde).max(axis=0, initial=0.) > 1e-8 * scale
+    X_id = X_tilde[:, identified]
+    k = X_id.shape[1]
+
+    bread = np.linalg.pinv(X_id.T @ X_id)
+    beta = bread @ (X_id.T @ y_tilde)
+    residuals = y_tilde - X_id @ beta
+
+    n_groups = [int(codes.max()) + 1 if len(codes) else 0 for codes in codes_list]
+    clusters = [data[col].to_numpy() for col in cluster]
+    # Fixed effects nested within a cluster do not use degrees of freedom of the clustered standard errors
+    absorbed_dof = sum(n_group for codes, n_group in zip(codes_list, n_groups)
+                       if not (clusters and _nested(codes, clusters)))
+    absorbed_dof = max(absorbed_dof - max(len(codes_list) - 1, 0), 0)
+
+    if clusters:
+        covariance, n_clusters = clustered_covariance(X_id, residuals, clusters, bread=bread, absorbed_dof=absorbed_dof)
+        dof = n_clusters - 1
+    else:
+        # Heteroskedasticity-robust (HC1) covariance
+        dof = max(n - k - absorbed_dof, 1)
+        covariance = bread @ ((X_id * residuals[:, None] ** 2).T @ X_id) @ bread * n / dof
+        n_clusters = np.nan
+
+    coef = np.full(len(x), np.nan)
+    std_err = np.full(len(x), np.nan)
+    coef[identified] = beta
+    std_err[identified] = np.sqrt(np.diag(covariance))
+    t_stat = coef / std_err
+    critical_value = stats.t.ppf(0.975, dof)
+
+    result = pd.DataFrame({
+        'coef': coef,
+        'std_err': std_err,
+        't_stat': t_stat,
+        'p_value': 2 * stats.t.sf(np.abs(t_stat), dof),
+        'ci_lower': coef - critical_value * std_err,
+        'ci_upper': coef + critical_value * std_err,
+    }, index=pd.Index(x, name='regressor'))
+
+    total_sum_of_squares = (y_tilde ** 2).sum()
+    # Plain Python values, as `to_parquet` stores the attributes as JSON
+    result.attrs = {
+        'y': y,
+        'n_obs': int(n),
+        'n_clusters': n_clusters,
+        'n_groups': [int(n_group) for n_group in n_groups],
+        'r2_within': float(1 - (residuals ** 2).sum() / total_sum_of_squares) if total_sum_of_squares > 0 else np.nan,
+        'iterations': int(iterations),
+    }
+    return result
+
+
+def regress_lending_on_esg(df, lending_indicators=LENDING_INDICATORS, esg=ESG_DAILY, fixed_effects=['cusip', 'date'],
+                           cluster=['cusip'], fillna=0):
+    """
+    The `regress_lending_on_esg` function runs `fit_panel_ols` of every lending indicator on the incident variables of
+    `esg`, by default on the merged data with the incidents aggregated per day (`merge_data(..., aggregate_incidents=True)`)
+    where the days without incident have missing incident variables, filled with `fillna`.
+
+    The function returns a dictionary mapping each lending indicator to its table of coefficients.
+    """
+    return {
+        j: fit_panel_ols(df, j, esg, fixed_effects=fixed_effects, cluster=cluster, fillna=fillna)
+        for j in lending_indicators
+    }
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from compute_desc_stats import read_data
+
+    df = read_data("merged_data_daily")
+    results = regress_lending_on_esg(df)
+    # Outside of the `stats` folder, whose tables are all converted to LaTeX without their standard error metadata (attrs)
+    output_dir = Path(config.OUTPUT_DIR) / "inference"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for j, result in results.items():
+        result.to_parquet(output_dir / f"{j}_panel_regression.parquet")
@@ -1,57 +1,146 @@
 '''
 This file plots apple's lending indicators and stores them in the output directory
+
+`render_lend_ind_charts` renders the same charts for many stocks at once (e.g. the whole universe): the stocks are split
+into chunks rendered on a pool of processes, each worker reading only the rows of its stocks from the merged data and
+drawing all of them on a single figure with the non-interactive Agg canvas, so that memory does not grow with the number
+of charts.
+
+Series longer than `max_points` (by default the `PLOT_MAX_POINTS` setting) are downsampled before being drawn, keeping
+their shape (see `downsampling`). With a trading calendar (see `trading_calendar`), the series are downsampled on their
+trading day numbers, so that weekends and holidays do not leave empty buckets.
 '''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib as mpl
+from matplotlib.figure import Figure
 from pathlib import Path
 import config
-import seaborn as sns
-from compute_desc_stats import read_data
+from downsampling import downsample
+from trading_calendar import load_trading_calendar
+from security_index import index_panel, get_securities, read_securities, load_security_index
 mpl.rcParams['font.family'] = 'Times New Roman'
 
+LENDING_INDICATORS = config.LENDING_INDICATORS
+# Title and y-axis label of the chart of each lending indicator
+PANELS = {
+    'short interest ratio': ('Short Interest Ratio', '%'),
+    'loan supply ratio': ('Loan Supply Ratio', '%'),
+    'loan utilisation ratio': ('Loan Utilisation Ratio', '%'),
+    'loan fee': ('Loan Fee', None),
+}
+CHUNK_SIZE = 200
 
-def plot_lend_ind(df, cusip_list, name_list, output_dir=config.OUTPUT_DIR):
+
+def _lend_ind_figure():
+    '''
+    Creates the figure of the lending indicators of a stock, with one empty line per indicator to be filled by
+    `_draw_lend_ind`. The figure is drawn on the Agg canvas of matplotlib, outside of `pyplot`, so that it is freed when it
+    is no longer referenced.
+    '''
+    fig = Figure(figsize=(15, 10))
+    ax = fig.subplots(2, 2)
+    lines = {}
+    for axis, (column, (title, ylabel)) in zip(ax.flat, PANELS.items()):
+        lines[column], = axis.plot(np.array([], dtype='datetime64[ns]'), [], linewidth=1)
+        axis.set_title(title)
+        if ylabel is not None:
+            axis.set_ylabel(ylabel)
+        axis.tick_params(axis='x', rotation=45)
+    return fig, lines
+
+
+def _draw_lend_ind(fig, lines, selected_stock, file_path, max_points=config.PLOT_MAX_POINTS, method='minmax',
+                   calendar=None):
+    '''
+    Draws the lending indicators of `selected_stock` on the lines of a figure of `_lend_ind_figure` and saves it. Series of
+    more than `max_points` points are downsampled with `method` (see `downsampling.downsample`), on the trading day
+    numbers of `calendar` if given (and covering the dates).
+    '''
+    dates = selected_stock['date'].to_numpy()
+    x = dates
+    if calendar is not None:
+        day_nums = calendar.to_day_num(dates, roll='backward')
+        x = dates if np.isnan(day_nums).any() else day_nums
+    for column, line in lines.items():
+        values = selected_stock[column].to_numpy(dtype=np.float64)
+        kept = downsample(x, values, max_points=max_points, method=method)
+        line.set_data(dates[kept], values[kept])
+        line.axes.relim()
+        line.axes.autoscale_view()
+    fig.tight_layout()
+    fig.savefig(file_path)
+
+
+def plot_lend_ind(df, cusip_list, name_list, output_dir=config.OUTPUT_DIR, max_points=config.PLOT_MAX_POINTS,
+                  method='minmax', calendar=None):
     '''
     This function plots lending indicators for previously selected Stocks and stores the plot as a .png file in the output directory
+
+    The rows of each stock are a slice of the data sorted by cusip and date (see `security_index.index_panel`), and all the
+    stocks are drawn on the same figure. Series of more than `max_points` points are downsampled with `method`, on the
+    trading days of `calendar` if given.
     '''
-    
+    df, index = index_panel(df)
+    fig, lines = _lend_ind_figure()
+
     for cusip, name in zip(cusip_list, name_list):
 
-        selected_stock = df[df['cusip'] == cusip]
+        selected_stock = get_securities(df, cusip, index)
 
-        fig, ax = plt.subplots(2, 2, figsize=(15, 10))
+        file_path = Path(output_dir) / f"{name}_lend_ind.png"
+        _draw_lend_ind(fig, lines, selected_stock, file_path, max_points=max_points, method=method, calendar=calendar)
 
-        ax[0, 0].plot(selected_stock['date'], selected_stock['short interest ratio'], linewidth=1)
-        ax[0, 0].set_ylabel('%')
-        ax[0, 0].set_title('Short Interest Ratio')
-        ax[0, 0].tick_params(axis='x', rotation=45)
 
-        ax[0, 1].plot(selected_stock['date'], selected_stock['loan supply ratio'], linewidth=1)
-        ax[0, 1].set_title('Loan Supply Ratio')
-        ax[0, 1].set_ylabel('%')
-        ax[0, 1].tick_params(axis='x', rotation=45)
+def _render_chunk(file_path, cusip_list, name_list, output_dir, max_points, method, calendar):
+    '''
+    Renders the charts of a chunk of stocks from the merged data file, reading only their rows. Returns the number of
+    charts.
+    '''
+    df = read_securities(file_path, cusip_list, columns=['cusip', 'date', *LENDING_INDICATORS])
+    # Several rows per stock and date in the merged data with one row per incident
+    df = df.drop_duplicates(subset=['cusip', 'date'])
+    plot_lend_ind(df, cusip_list, name_list, output_dir=output_dir, max_points=max_points, method=method,
+                  calendar=calendar)
+    return len(cusip_list)
 
-        ax[1, 0].plot(selected_stock['date'], selected_stock['loan utilisation ratio'], linewidth=1)
-        ax[1, 0].set_title('Loan Utilisation Ratio')
-        ax[1, 0].set_ylabel('%')
-        ax[1, 0].tick_params(axis='x', rotation=45)
 
-        ax[1, 1].plot(selected_stock['date'], selected_stock['loan fee'], linewidth=1)
-        ax[1, 1].set_title('Loan Fee')
-        ax[1, 1].tick_params(axis='x', rotation=45)
+def render_lend_ind_charts(file_path=Path(config.DATA_DIR) / "pulled" / "merged_data.parquet", cusip_list=None,
+                           name_list=None, output_dir=Path(config.OUTPUT_DIR) / "lend_ind_charts",
+                           chunk_size=CHUNK_SIZE, n_jobs=None, max_points=config.PLOT_MAX_POINTS, method='minmax',
+                           calendar=None):
+    '''
+    This function renders the charts of `plot_lend_ind` for many stocks of the merged data file `file_path` (sorted by
+    cusip, see `security_index.write_sorted_parquet`), by default all the stocks of the file, named by their cusip.
 
-        plt.tight_layout()
+    The stocks are rendered by chunks of `chunk_size` on `n_jobs` processes (by default the number of CPUs, no pool with
+    1), with the downsampling of `max_points`, `method` and `calendar`. Returns the number of charts rendered.
+    '''
+    if cusip_list is None:
+        cusip_list = load_security_index(file_path).index.tolist()
+    name_list = cusip_list if name_list is None else name_list
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    chunks = [(cusip_list[start:start + chunk_size], name_list[start:start + chunk_size])
+              for start in range(0, len(cusip_list), chunk_size)]
 
-        file_path = Path(output_dir) / f"{name}_lend_ind.png"
-        fig.savefig(file_path)
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    if n_jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as executor:
+            futures = [executor.submit(_render_chunk, file_path, cusips, names, output_dir, max_points, method,
+                                       calendar)
+                       for cusips, names in chunks]
+            return sum(future.result() for future in futures)
+    return sum(_render_chunk(file_path, cusips, names, output_dir, max_points, method, calendar) for cusips, names in chunks)
 
 
 if __name__ == '__main__':
-    df = read_data("merged_data")
-
     cusip_list = ['037833100', '36467W109','02209S103']
     name_list = ['Apple Inc', 'GameStop Corp', 'Altria Group Inc']
 
-    _ = plot_lend_ind(df, cusip_list, name_list)
+    # Only the row groups of the selected stocks are read, with one row per stock and date as in the batch rendering.
+    # Downsampled on the trading days of the shared calendar
+    _ = render_lend_ind_charts(cusip_list=cusip_list, name_list=name_list, output_dir=config.OUTPUT_DIR, n_jobs=1,
+                               calendar=load_trading_calendar())
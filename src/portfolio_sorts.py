@@ -0,0 +1,233 @@
+"""
+The `portfolio_sorts.py` module has been designed to compare the lending indicators of securities with different recent
+RepRisk exposures: every date, the securities are sorted into buckets (e.g. by their number of incidents or their maximum
+incident severity over the trailing days, or by `current_rri` terciles), and the lending indicators and their forward
+changes are averaged within every bucket, equal-weighted and weighted by shares outstanding.
+
+The module contains the following functions:
+    * trailing_exposure - Returns the sum or the max of a column over the trailing days of every security.
+    * assign_buckets - Assigns every row to a bucket of its date, by fixed breakpoints or cross-sectional quantiles.
+    * bucket_averages - Returns the average of some columns in every (date, bucket).
+    * portfolio_sort - Returns the table of the time-series averages of the bucket averages, with the high-minus-low spread.
+    * run_portfolio_sorts - Runs the sorts of `SORTS` on the daily merged data and saves the tables for LaTeX.
+
+Nothing loops over dates. The trailing sums are differences of cumulative sums along the rows sorted by (security, day)
+(see `event_index.security_day_keys`), and the trailing maxima are range-maximum queries on a sparse table of the maxima
+of 1, 2, 4, ... consecutive rows. Every row gets the group code `date * number of buckets + bucket`, so that the
+averages of all the (date, bucket) portfolios are two `np.bincount` calls per column.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import config
+import misc_tools
+from cross_section import cross_sectional_transforms
+from event_index import date_numbers, security_day_keys
+
+OUTPUT_DIR = Path(config.OUTPUT_DIR)
+LENDING_INDICATORS = config.LENDING_INDICATORS
+HORIZONS = [5]
+# Sorts of `run_portfolio_sorts`, on the merged data with the incidents aggregated per day (see `aggregate_daily_incidents`)
+SORTS = {
+    'incident_count_21': dict(column='incident_count', how='sum', window=21, breakpoints=[1, 2],
+                              labels=['0', '1', '2+']),
+    'severity_max_21': dict(column='severity_max', how='max', window=21, breakpoints=[1, 2, 3],
+                            labels=['none', '1', '2', '3']),
+    'current_rri': dict(column='current_rri', n_buckets=3, labels=['low', 'mid', 'high']),
+}
+
+
+def trailing_exposure(df, column, window=21, how='sum', id_col='cusip', date_col='date', day_numbers=None):
+    """
+    The `trailing_exposure` function returns, for every row of `df`, the sum (`how='sum'`) or the max (`how='max'`) of the
+    non-missing values of `column` of its security over the `window` days ending at the date of the row (included). NaN
+    when the security has no value in the window.
+
+    Days are numbered by their rank among all the dates present in the data, or by `day_numbers` (e.g.
+    `TradingCalendar.day_numbers` of the `trading_calendar` module). The (security, date) pairs are expected to be unique.
+    """
+    if how not in ('sum', 'max'):
+        raise ValueError(f"how must be 'sum' or 'max', got {how!r}")
+    n = len(df)
+    if n == 0:
+        return np.zeros(0)
+
+    if day_numbers is None:
+        day_numbers = date_numbers(df[date_col].to_numpy())
+    codes = pd.factorize(df[id_col])[0]
+    # Leave room for the window so that a window start never falls into the range of another security
+    keys, _, _, _ = security_day_keys(codes, day_numbers, pad=window)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    hi = np.arange(n)
+    lo = np.searchsorted(sorted_keys, sorted_keys - window + 1, side='left')
+
+    values = df[column].to_numpy(dtype=np.float64)[order]
+    valid = ~np.isnan(values)
+    if how == 'sum':
+        cumulative_sums = np.r_[0., np.cumsum(np.where(valid, values, 0.))]
+        cumulative_counts = np.r_[0, np.cumsum(valid)]
+        result = np.where(cumulative_counts[hi + 1] > cumulative_counts[lo],
+                          cumulative_sums[hi + 1] - cumulative_sums[lo], np.nan)
+    else:
+        # Sparse table: level k holds the max of the 2^k rows starting at every row
+        lengths = hi - lo + 1
+        table = [np.where(valid, values, -np.inf)]
+        for k in range(1, int(lengths.max()).bit_length()):
+            step = 1 << (k - 1)
+            table.append(np.maximum(table[-1], np.r_[table[-1][step:], np.full(step, -np.inf)]))
+        table = np.stack(table)
+        # Two overlapping blocks of 2^k rows cover the window
+        levels = np.array([int(length).bit_length() - 1 for length in range(lengths.max() + 1)])[lengths]
+        result = np.maximum(table[levels, lo], table[levels, hi - (1 << levels) + 1])
+        result[np.isneginf(result)] = np.nan
+
+    exposure = np.empty(n)
+    exposure[order] = result
+    return exposure
+
+
+def assign_buckets(date_codes, values, n_buckets=3, breakpoints=None):
+    """
+    The `assign_buckets` function returns the bucket (0 for the lowest values) of every value, -1 for missing values:
+        * With `breakpoints`, bucket i holds the values from `breakpoints[i - 1]` (included) to `breakpoints[i]`
+        (excluded), so that there are `len(breakpoints) + 1` buckets.
+        * Otherwise, the values of every date are split into `n_buckets` quantile buckets by their percentile rank within
+        the date (ties getting their average rank, so that equal values are in the same bucket).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if breakpoints is not None:
+        buckets = np.digitize(values, breakpoints)
+    else:
+        rank = cross_sectional_transforms(np.asarray(date_codes, dtype=np.int64), values, transforms=['rank'])['rank']
+        with np.errstate(invalid='ignore'):
+            # The tolerance keeps a rank of exactly i / n_buckets in bucket i - 1 despite rounding
+            buckets = np.clip(np.ceil(rank * n_buckets - 1e-9) - 1, 0, n_buckets - 1)
+    return np.where(np.isnan(values), -1, buckets).astype(np.int64)
+
+
+def bucket_averages(date_codes, buckets, values, n_dates, n_buckets, weights=None):
+    """
+    The `bucket_averages` function returns the arrays of shape (`n_dates`, `n_buckets`, number of columns) of the averages
+    of the columns of the 2-D array `values` over the rows of every (date, bucket), weighted by `weights` if given (rows
+    with a missing or non-positive weight being left out), and of the numbers of rows averaged. Averages are NaN for empty
+    portfolios.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(len(buckets), -1)
+    in_bucket = (date_codes >= 0) & (buckets >= 0)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            in_bucket &= weights > 0
+    groups = date_codes * n_buckets + buckets
+    size = n_dates * n_buckets
+
+    averages = np.empty((size, values.shape[1]))
+    counts = np.empty((size, values.shape[1]), dtype=np.int64)
+    for k in range(values.shape[1]):
+        rows = in_bucket & ~np.isnan(values[:, k])
+        row_weights = np.ones(rows.sum()) if weights is None else weights[rows]
+        totals = np.bincount(groups[rows], weights=row_weights * values[rows, k], minlength=size)
+        weight_sums = np.bincount(groups[rows], weights=row_weights, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            averages[:, k] = totals / weight_sums
+        counts[:, k] = np.bincount(groups[rows], minlength=size)
+    averages[counts == 0] = np.nan
+    shape = (n_dates, n_buckets, values.shape[1])
+    return averages.reshape(shape), counts.reshape(shape)
+
+
+def portfolio_sort(df, sort_col, columns=LENDING_INDICATORS, n_buckets=3, breakpoints=None, labels=None,
+                   weight_col=None, date_col='date'):
+    """
+    The `portfolio_sort` function has been designed to sort the rows of every date into buckets of `sort_col` (see
+    `assign_buckets`) and average each column of `columns` within every (date, bucket), equal-weighted or weighted by
+    `weight_col` (e.g. 'shrout').
+
+    The function returns a DataFrame with one row per bucket (named by `labels`) and one column per column of `columns`,
+    holding the mean over the dates of the bucket averages, then the rows `H-L` and `H-L t-stat` of the mean of the daily
+    difference between the highest and the lowest buckets and its t-statistic (dates with both buckets, no correction for
+    autocorrelation), and a column `n` of the average number of securities per date in the bucket.
+    """
+    date_codes, dates = pd.factorize(df[date_col], sort=True)
+    date_codes = date_codes.astype(np.int64)
+    if breakpoints is not None:
+        n_buckets = len(breakpoints) + 1
+    labels = [str(i + 1) for i in range(n_buckets)] if labels is None else list(labels)
+    if len(labels) != n_buckets:
+        raise ValueError(f"Expected {n_buckets} labels, got {len(labels)}")
+
+    buckets = assign_buckets(date_codes, df[sort_col].to_numpy(dtype=np.float64), n_buckets=n_buckets,
+                             breakpoints=breakpoints)
+    weights = None if weight_col is None else df[weight_col].to_numpy(dtype=np.float64)
+    averages, _ = bucket_averages(date_codes, buckets, df[columns].to_numpy(dtype=np.float64), len(dates), n_buckets,
+                                  weights=weights)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Means over the dates with a non-empty portfolio
+        observed = ~np.isnan(averages)
+        table = pd.DataFrame(np.where(observed, averages, 0.).sum(axis=0) / observed.sum(axis=0),
+                             index=pd.Index(labels, name=sort_col), columns=columns)
+        spread = averages[:, -1, :] - averages[:, 0, :]
+        observed = ~np.isnan(spread)
+        n_spread = observed.sum(axis=0)
+        mean_spread = np.where(observed, spread, 0.).sum(axis=0) / n_spread
+        se_spread = np.sqrt((np.where(observed, spread - mean_spread, 0.) ** 2).sum(axis=0) / (n_spread - 1) / n_spread)
+    table.loc['H-L'] = mean_spread
+    table.loc['H-L t-stat'] = mean_spread / se_spread
+
+    in_bucket = (buckets >= 0) & (date_codes >= 0)
+    counts = np.bincount(buckets[in_bucket], minlength=n_buckets)
+    table['n'] = np.r_[counts / max(len(dates), 1), np.nan, np.nan]
+    return table
+
+
+def run_portfolio_sorts(df, sorts=SORTS, columns=LENDING_INDICATORS, horizons=HORIZONS, weight_col='shrout',
+                        output_dir=OUTPUT_DIR, calendar=None):
+    """
+    The `run_portfolio_sorts` function runs every sort of `sorts` on the merged data with the incidents aggregated per day
+    (one row per security and date, see `aggregate_daily_incidents`), equal-weighted and weighted by `weight_col`, for
+    the lending indicators and their changes `{col}_change_{h}` over the next `h` days of every horizon of `horizons`.
+
+    A sort with a `window` buckets the securities by the trailing exposure of its `column` (see `trailing_exposure`),
+    days without incident counting as 0. The tables are saved as `portfolio_sort_{sort}_{ew|vw}.parquet` in the `stats`
+    folder of the output directory, to be converted to LaTeX with the other statistics. With a `calendar`, days are the
+    trading days of that calendar.
+
+    The function returns a dictionary mapping every (sort, weighting) to its table.
+    """
+    day_numbers = None if calendar is None else calendar.day_numbers(df['date'])
+    df = misc_tools.with_multi_horizon_lagged_columns(data=df, columns_to_lag=columns, id_columns=['cusip'],
+                                                      lags=[-h for h in horizons], date_col='date', prefix='L',
+                                                      day_numbers=day_numbers)
+    change_columns = []
+    for h in horizons:
+        for col in columns:
+            df[f'{col}_change_{h}'] = df[f'L-{h}_{col}'] - df[col]
+            change_columns.append(f'{col}_change_{h}')
+
+    results = {}
+    for name, sort in sorts.items():
+        if 'window' in sort:
+            exposure = trailing_exposure(df.assign(**{sort['column']: df[sort['column']].fillna(0)}), sort['column'],
+                                         window=sort['window'], how=sort.get('how', 'sum'), day_numbers=day_numbers)
+            df[name] = exposure
+        else:
+            df[name] = df[sort['column']]
+
+        for weighting, weights in [('ew', None), ('vw', weight_col)]:
+            table = portfolio_sort(df, name, columns=[*columns, *change_columns], n_buckets=sort.get('n_buckets', 3),
+                                   breakpoints=sort.get('breakpoints'), labels=sort.get('labels'), weight_col=weights)
+            table.to_parquet(Path(output_dir) / "stats" / f"portfolio_sort_{name}_{weighting}.parquet")
+            results[(name, weighting)] = table
+    return results
+
+
+if __name__ == "__main__":
+    from compute_desc_stats import read_data
+
+    df = read_data("merged_data_daily")
+    _ = run_portfolio_sorts(df)
@@ -0,0 +1,206 @@
+"""
+The `resampling.py` module has been designed to add resampling inference to the statistics of the lending indicators by
+ESG bucket (e.g. by `severity` or `environment`): cluster bootstrap confidence intervals of the bucket means and
+permutation tests of the differences between buckets.
+
+The module contains the following functions:
+    * cluster_bootstrap_means - Cluster (security) bootstrap of the mean of a column in every bucket.
+    * permutation_test - Permutation test of the differences between the means of the buckets.
+    * resample_by_groups - Runs both for every ESG dimension and lending indicator.
+
+The data are first reduced to small arrays: the sum and the count of every (security, bucket) pair for the bootstrap, and
+the bucket code and value of every row for the permutation test. The replications are then computed by batches: a
+bootstrap batch is a matrix of resampling weights (how many times each security is drawn in each replication), and the
+bucket sums and counts of all the replications of the batch are two matrix products; a permutation batch shuffles the
+bucket codes of all the replications at once and sums the values of every (replication, bucket) pair with one
+`np.bincount`, each replication having its own range of codes. Batches can be run on several processes; every batch has
+its own random stream derived from `seed`, so that the results do not depend on the number of processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import config
+
+LENDING_INDICATORS = config.LENDING_INDICATORS
+ESG = ['severity', 'novelty', 'reach', 'environment', 'social', 'governance']
+
+
+def _bucket_codes(df, group_col, value_col):
+    """
+    Returns the rows with a bucket and a value, their bucket codes and the index of the buckets (sorted as in `groupby`).
+    """
+    codes, uniques = pd.factorize(df[group_col], sort=True)
+    values = df[value_col].to_numpy(dtype=np.float64)
+    rows = np.flatnonzero((codes >= 0) & ~np.isnan(values))
+    return rows, codes[rows], values[rows], pd.Index(uniques.tolist(), name=group_col)
+
+
+def _batches(n_replications, batch_size, seed):
+    """
+    Returns the size and the random seed of every batch of replications.
+    """
+    sizes = [min(batch_size, n_replications - start) for start in range(0, n_replications, batch_size)]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _run_batches(function, arguments, batches, n_jobs):
+    """
+    Runs `function(*arguments, size, seed)` for every batch, on `n_jobs` processes if `n_jobs` > 1, and stacks the results.
+    """
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(function, *arguments, size, seed) for size, seed in batches]
+            results = [future.result() for future in futures]
+    else:
+        results = [function(*arguments, size, seed) for size, seed in batches]
+    return np.concatenate(results)
+
+
+def _bootstrap_batch(cluster_sums, cluster_counts, size, seed):
+    """
+    Returns the bucket means of `size` bootstrap replications, drawing the clusters with replacement.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = len(cluster_sums)
+    # Number of times each cluster is drawn in each replication
+    weights = rng.multinomial(n_clusters, np.full(n_clusters, 1 / n_clusters), size=size).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (weights @ cluster_sums) / (weights @ cluster_counts)
+
+
+def cluster_bootstrap_means(df, group_col, value_col, cluster_col='cusip', n_boot=1000, confidence=0.95, batch_size=250,
+                            n_jobs=1, seed=0, return_replications=False):
+    """
+    The `cluster_bootstrap_means` function has been designed to estimate the uncertainty of the mean of `value_col` in every
+    bucket of `group_col`, resampling whole securities (`cluster_col`) with replacement so that the dependence between the
+    rows of a security is preserved.
+
+    The function returns a DataFrame indexed by bucket with the `mean`, the bootstrap standard error `se` and the percentile
+    confidence interval (`ci_lower`, `ci_upper`) at the `confidence` level. With `return_replications=True`, it also returns
+    the (n_boot, number of buckets) array of the bootstrap means.
+    """
+    rows, codes, values, index = _bucket_codes(df, group_col, value_col)
+    clusters = pd.factorize(df[cluster_col].to_numpy()[rows])[0]
+    n_clusters, n_groups = clusters.max() + 1 if len(clusters) else 0, len(index)
+
+    # Sum and count of every (cluster, bucket) pair
+    pairs = clusters * n_groups + codes
+    cluster_sums = np.bincount(pairs, weights=values, minlength=n_clusters * n_groups).reshape(n_clusters, n_groups)
+    cluster_counts = np.bincount(pairs, minlength=n_clusters * n_groups).reshape(n_clusters, n_groups).astype(np.float64)
+
+    replications = _run_batches(_bootstrap_batch, (cluster_sums, cluster_counts), _batches(n_boot, batch_size, seed),
+                                n_jobs)
+
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = cluster_sums.sum(axis=0) / cluster_counts.sum(axis=0)
+    result = pd.DataFrame({
+        'mean': mean,
+        'se': np.nanstd(replications, axis=0, ddof=1),
+        'ci_lower': np.nanquantile(replications, alpha, axis=0),
+        'ci_upper': np.nanquantile(replications, 1 - alpha, axis=0),
+    }, index=index)
+
+    if return_replications:
+        return result, replications
+    return result
+
+
+def _permutation_batch(codes, values, counts, size, seed):
+    """
+    Returns the bucket means of `size` replications with the bucket codes shuffled among the rows.
+    """
+    rng = np.random.default_rng(seed)
+    n_groups = len(counts)
+    shuffled = rng.permuted(np.broadcast_to(codes, (size, len(codes))), axis=1)
+    # Every replication has its own range of codes, so that one bincount sums all the (replication, bucket) pairs
+    shuffled = shuffled + (np.arange(size) * n_groups)[:, None]
+    sums = np.bincount(shuffled.ravel(), weights=np.tile(values, size), minlength=size * n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums.reshape(size, n_groups) / counts
+
+
+def permutation_test(df, group_col, value_col, n_perm=1000, reference=None, batch_size=100, n_jobs=1, seed=0):
+    """
+    The `permutation_test` function has been designed to test whether the mean of `value_col` differs across the buckets of
+    `group_col`, by shuffling the buckets among the rows.
+
+    Two statistics are tested: the difference between the mean of every bucket and the mean of the `reference` bucket (by
+    default the first one, e.g. the lowest severity), and the between-bucket sum of squares of all the buckets, sum over the
+    buckets of n_b (mean_b - mean)^2. The p-values are the share of the `n_perm` permutations with a statistic at least as
+    extreme as the observed one (two-sided for the differences), counting the observed data as one permutation.
+
+    The function returns a DataFrame indexed by bucket with the `mean`, the `count`, the `difference` with the reference
+    bucket and its `p_value`, and the p-value of the between-bucket sum of squares as the `p_value_all` attribute.
+    Rows are assumed exchangeable under the null hypothesis; use `cluster_bootstrap_means` to account for the dependence
+    between the rows of a security.
+    """
+    rows, codes, values, index = _bucket_codes(df, group_col, value_col)
+    n_groups = len(index)
+    counts = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    reference = 0 if reference is None else index.get_loc(reference)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / counts
+    overall_mean = values.mean() if len(values) else np.nan
+
+    def statistics(means):
+        differences = means - means[..., [reference]]
+        between = np.nansum(counts * (means - overall_mean) ** 2, axis=-1)
+        return differences, between
+
+    permuted = _run_batches(_permutation_batch, (codes, values, counts), _batches(n_perm, batch_size, seed), n_jobs)
+    differences, between = statistics(mean)
+    permuted_differences, permuted_between = statistics(permuted)
+
+    tolerance = 1e-12 * max(1., np.nanmax(np.abs(values)) if len(values) else 1.)
+    extreme = np.abs(permuted_differences) >= np.abs(differences) - tolerance
+    result = pd.DataFrame({
+        'mean': mean,
+        'count': counts,
+        'difference': differences,
+        'p_value': (1 + extreme.sum(axis=0)) / (1 + n_perm),
+    }, index=index)
+    result.loc[index[reference], 'p_value'] = np.nan
+    result.attrs['p_value_all'] = (1 + (permuted_between >= between - tolerance).sum()) / (1 + n_perm)
+    return result
+
+
+def resample_by_groups(df, by=ESG, columns=LENDING_INDICATORS, cluster_col='cusip', n_boot=1000, n_perm=1000,
+                       confidence=0.95, n_jobs=1, seed=0):
+    """
+    The `resample_by_groups` function runs `cluster_bootstrap_means` and `permutation_test` for every ESG dimension of `by`
+    and lending indicator of `columns`.
+
+    The function returns a dictionary mapping each (ESG dimension, lending indicator) pair to a DataFrame indexed by bucket
+    with the mean, the bootstrap standard error and confidence interval, and the difference with the first bucket with its
+    permutation p-value (the p-value of all the buckets being in the `p_value_all` attribute).
+    """
+    results = {}
+    for i in by:
+        for j in columns:
+            bootstrap = cluster_bootstrap_means(df, i, j, cluster_col=cluster_col, n_boot=n_boot, confidence=confidence,
+                                                n_jobs=n_jobs, seed=seed)
+            permutation = permutation_test(df, i, j, n_perm=n_perm, n_jobs=n_jobs, seed=seed)
+            result = bootstrap.join(permutation[['count', 'difference', 'p_value']])
+            result.attrs['p_value_all'] = permutation.attrs['p_value_all']
+            results[(i, j)] = result
+    return results
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from compute_desc_stats import read_data
+
+    df = read_data("merged_data")
+    results = resample_by_groups(df, n_jobs=4)
+    # Outside of the `stats` folder, whose tables are all converted to LaTeX
+    output_dir = Path(config.OUTPUT_DIR) / "inference"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for (i, j), result in results.items():
+        file_path = output_dir / f"{j + '_' + i}_resampling.parquet"
+        result.to_parquet(file_path)
@@ -0,0 +1,134 @@
+"""
+The `rolling_features.py` module has been designed to add rolling-window features of the lending indicators to the merged
+data: rolling means, volatilities (standard deviations), z-scores and changes per security, over several window lengths
+at once.
+
+The module contains the following functions:
+    * with_rolling_features - Adds the rolling features of some columns, for every window length, as new columns.
+    * add_rolling_features - Adds the rolling features to a merged dataset saved in the data directory.
+
+The panel is sorted once by (security, day) into an array of integer keys (see `event_index.security_day_keys`). For
+every column, the cumulative sums of the non-missing values, of their squares and of their number are computed once; the
+sum, the sum of squares and the count of any window are then the difference of two cumulative sums, so that every window
+length costs one binary search of the window starts and a few array operations, whatever its length. The values are
+centered on the mean of their security before the cumulative sums, to limit the loss of precision of the differences.
+
+Windows count rows of the security by default, as `df.groupby('cusip')[col].rolling(window)` does. With `day_numbers`
+(e.g. `TradingCalendar.day_numbers` of the `trading_calendar` module), a window of w covers the last w trading days, days
+without a row of the security counting as missing values.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import config
+from event_index import security_day_keys, match_security_days
+
+DATA_DIR = Path(config.DATA_DIR)
+ROLLING_COLUMNS = ['loan fee', 'loan utilisation ratio', 'short interest ratio']
+ROLLING_WINDOWS = [5, 21, 63]
+ROLLING_FEATURES = ['mean', 'std', 'zscore', 'change']
+
+
+def with_rolling_features(df, columns=ROLLING_COLUMNS, windows=ROLLING_WINDOWS, features=ROLLING_FEATURES,
+                          id_col='cusip', date_col='date', min_periods=None, day_numbers=None):
+    """
+    The `with_rolling_features` function returns `df` with the columns `{col}_{feature}_{window}` for every column of
+    `columns`, feature of `features` and window length of `windows`:
+        * mean - Mean of the non-missing values of the window.
+        * std - Standard deviation (ddof=1) of the non-missing values of the window.
+        * zscore - Value minus the rolling mean, divided by the rolling standard deviation.
+        * change - Value minus the value `window` rows (or days) earlier.
+
+    A window ends at the row itself and covers the `window` previous rows of the security, or days with `day_numbers`.
+    Rolling statistics are NaN when the window has less than `min_periods` non-missing values (by default the window
+    length, as in `pandas`). The (security, date) pairs are expected to be unique.
+    """
+    codes = pd.factorize(df[id_col])[0].astype(np.int64)
+    if day_numbers is None:
+        # Rank of every row within its security
+        order = np.lexsort((df[date_col].to_numpy(), codes))
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.array([0])
+        day_numbers = np.empty(len(df), dtype=np.int64)
+        day_numbers[order] = np.arange(len(df)) - np.repeat(starts, np.diff(np.r_[starts, len(df)]))
+
+    # Leave room for the longest window so that a window start never falls into the range of another security
+    keys, _, span, _ = security_day_keys(codes, day_numbers, pad=max(windows))
+    order = np.argsort(keys, kind='stable')
+    sorted_keys, sorted_codes = keys[order], codes[order]
+    n = len(sorted_keys)
+    positions = np.arange(n)
+
+    window_starts = {w: np.searchsorted(sorted_keys, sorted_keys - w + 1, side='left') for w in windows}
+    if 'change' in features:
+        previous = {w: match_security_days(sorted_keys, sorted_keys - w, span) for w in windows}
+
+    combinations = [(col, feature, w) for col in columns for feature in features for w in windows]
+    new_columns = [f'{col}_{feature}_{w}' for col, feature, w in combinations]
+    column_numbers = {combination: k for k, combination in enumerate(combinations)}
+    block = np.empty((n, len(new_columns)), dtype=np.float64, order='F')
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64)[order]
+        valid = ~np.isnan(values)
+        # Values centered on the mean of their security
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centers = (np.bincount(sorted_codes[valid], weights=values[valid], minlength=codes.max() + 1 if n else 0)
+                       / np.bincount(sorted_codes[valid], minlength=codes.max() + 1 if n else 0))
+        centered = np.where(valid, values - centers[sorted_codes], 0.)
+        cumulative_sums = np.r_[0., np.cumsum(centered)]
+        cumulative_squares = np.r_[0., np.cumsum(centered ** 2)]
+        cumulative_counts = np.r_[0, np.cumsum(valid)]
+
+        for w in windows:
+            lo, hi = window_starts[w], positions + 1
+            counts = cumulative_counts[hi] - cumulative_counts[lo]
+            enough = counts >= (w if min_periods is None else min_periods)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sums = cumulative_sums[hi] - cumulative_sums[lo]
+                mean = sums / counts
+                if 'std' in features or 'zscore' in features:
+                    variance = np.maximum(cumulative_squares[hi] - cumulative_squares[lo] - sums * mean, 0.)
+                    std = np.where(enough, np.sqrt(variance / (counts - 1)), np.nan)
+
+                for feature in features:
+                    if feature == 'mean':
+                        result = np.where(enough, mean + centers[sorted_codes], np.nan)
+                    elif feature == 'std':
+                        result = std
+                    elif feature == 'zscore':
+                        result = np.where(valid, (centered - mean) / std, np.nan)
+                    elif feature == 'change':
+                        source, found = previous[w]
+                        result = np.where(found & valid, values - values[source], np.nan)
+                    else:
+                        raise ValueError(f"Unknown rolling feature {feature!r}")
+                    block[order, column_numbers[(col, feature, w)]] = result
+
+    return pd.concat([df, pd.DataFrame(block, index=df.index, columns=new_columns)], axis=1)
+
+
+def add_rolling_features(file_name="merged_data", data_dir=DATA_DIR, calendar=None, **kwargs):
+    """
+    The `add_rolling_features` function reads the `file_name` merged dataset of the `pulled` folder of the data
+    directory, adds its rolling features with `with_rolling_features` and saves it as `{file_name}_features.parquet`.
+
+    The merged data has one row per Markit observation and incident, so the features are computed on one row per security
+    and date and then merged back. With a `calendar`, windows count trading days of that calendar.
+    """
+    df = pd.read_parquet(Path(data_dir) / "pulled" / f"{file_name}.parquet")
+    columns = kwargs.get('columns', ROLLING_COLUMNS)
+
+    panel = df[['cusip', 'date', *columns]].drop_duplicates(subset=['cusip', 'date'])
+    day_numbers = None if calendar is None else calendar.day_numbers(panel['date'])
+    panel = with_rolling_features(panel, day_numbers=day_numbers, **kwargs).drop(columns=columns)
+
+    df = df.merge(panel, on=['cusip', 'date'], how='left')
+    df.to_parquet(Path(data_dir) / "pulled" / f"{file_name}_features.parquet")
+    return df
+
+
+if __name__ == "__main__":
+    _ = add_rolling_features("merged_data", data_dir=DATA_DIR)
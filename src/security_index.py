@@ -0,0 +1,174 @@
+"""
+The `security_index.py` module has been designed to fetch the history of one or a few securities from the merged data by
+slicing, instead of scanning the whole panel with `df[df['cusip'] == cusip]`.
+
+The module contains the following functions:
+    * is_sorted_by_security - Returns whether a panel is sorted by security and date.
+    * write_sorted_parquet - Writes a panel sorted by security and date to parquet, with its security index.
+    * build_security_index - Builds the index of a sorted panel, with the row groups of its parquet file if any.
+    * load_security_index - Reads the security index of a parquet file, rebuilding it if it is missing or stale.
+    * read_securities - Reads the rows of some securities from a sorted parquet file, reading only their row groups.
+    * index_panel - Sorts an in-memory panel if needed and returns it with its security index.
+    * get_securities - Returns the rows of some securities of an indexed in-memory panel.
+
+In a panel sorted by security and date, the rows of a security are a contiguous range. The security index stores, for
+every security, the `start` and `stop` (excluded) rows of that range and, for a parquet file, the `first_row_group` and
+`last_row_group` holding it. It is saved next to the data as `{file name}_security_index.parquet`, along with the number of
+rows of the data to detect an index that no longer matches its file.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from event_index import sort_panel, security_row_ranges
+
+ROW_GROUP_SIZE = 100_000
+
+
+def is_sorted_by_security(df, id_col='cusip', date_col='date'):
+    """
+    The `is_sorted_by_security` function returns whether the rows of `df` are sorted by `id_col` and then `date_col` (only
+    by `id_col` if `date_col` is None). Missing ids are compared as greater than any id, as `sort_panel` puts them last.
+    """
+    if len(df) < 2:
+        return True
+    codes, uniques = pd.factorize(df[id_col], sort=True)
+    codes = np.where(codes < 0, len(uniques), codes)
+    same_id = codes[1:] == codes[:-1]
+    if not np.all(codes[1:] >= codes[:-1]):
+        return False
+    if date_col is None:
+        return True
+    dates = df[date_col].to_numpy()
+    return bool(np.all(~same_id | (dates[1:] >= dates[:-1])))
+
+
+def _index_path(file_path):
+    """
+    Returns the path of the security index of a parquet file.
+    """
+    file_path = Path(file_path)
+    return file_path.with_name(f"{file_path.stem}_security_index.parquet")
+
+
+def build_security_index(df, id_col='cusip', row_group_sizes=None):
+    """
+    The `build_security_index` function returns the security index of a panel sorted by security and date: a DataFrame
+    indexed by security with the `start` and `stop` (excluded) rows of each security and, given the numbers of rows of the
+    row groups of its parquet file in `row_group_sizes`, the `first_row_group` and `last_row_group` of each security.
+    """
+    if not is_sorted_by_security(df, id_col=id_col, date_col=None):
+        raise ValueError(f"The panel must be sorted by {id_col!r} to be indexed")
+    index = security_row_ranges(df, id_col=id_col)
+    if row_group_sizes is not None:
+        row_group_starts = np.r_[0, np.cumsum(row_group_sizes)[:-1]]
+        index['first_row_group'] = np.searchsorted(row_group_starts, index['start'].to_numpy(), side='right') - 1
+        index['last_row_group'] = np.searchsorted(row_group_starts, index['stop'].to_numpy() - 1, side='right') - 1
+    return index
+
+
+def write_sorted_parquet(df, file_path, id_col='cusip', date_col='date', row_group_size=ROW_GROUP_SIZE):
+    """
+    The `write_sorted_parquet` function sorts `df` by security and date (if it is not already), writes it to `file_path`
+    in row groups of `row_group_size` rows, and saves its security index next to it.
+
+    The function returns the sorted DataFrame and its security index.
+    """
+    if not is_sorted_by_security(df, id_col=id_col, date_col=date_col):
+        df = sort_panel(df, id_col=id_col, date_col=date_col)
+    df.to_parquet(file_path, index=False, row_group_size=row_group_size)
+
+    metadata = pq.ParquetFile(file_path).metadata
+    row_group_sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    index = build_security_index(df, id_col=id_col, row_group_sizes=row_group_sizes)
+    index.assign(num_rows=len(df)).to_parquet(_index_path(file_path))
+    return df, index
+
+
+def load_security_index(file_path, id_col='cusip'):
+    """
+    The `load_security_index` function returns the security index of the parquet file `file_path`, read from its sidecar
+    file if it exists and matches the file (same number of rows, written after it). Otherwise, the index is rebuilt from
+    the `id_col` column of the file, which must be sorted by security, and saved.
+    """
+    file_path, index_path = Path(file_path), _index_path(file_path)
+    metadata = pq.ParquetFile(file_path).metadata
+    if index_path.exists() and index_path.stat().st_mtime >= file_path.stat().st_mtime:
+        index = pd.read_parquet(index_path)
+        if len(index) == 0 or index['num_rows'].iloc[0] == metadata.num_rows:
+            return index.drop(columns=['num_rows'])
+
+    ids = pd.read_parquet(file_path, columns=[id_col])
+    row_group_sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    index = build_security_index(ids, id_col=id_col, row_group_sizes=row_group_sizes)
+    index.assign(num_rows=metadata.num_rows).to_parquet(index_path)
+    return index
+
+
+def _security_rows(index, securities):
+    """
+    Returns the index of the `securities` found in a security index, in the order of the panel.
+    """
+    positions = index.index.get_indexer(pd.unique(pd.Series(securities)))
+    return index.iloc[np.sort(positions[positions >= 0])]
+
+
+def read_securities(file_path, securities, columns=None, index=None, id_col='cusip'):
+    """
+    The `read_securities` function returns the rows of the `securities` (a list of ids) of the parquet file `file_path`
+    written by `write_sorted_parquet`, sorted by security and date. Only the `columns` (by default all) of the row groups
+    holding these securities are read. Securities that are not in the file are ignored.
+    """
+    index = load_security_index(file_path, id_col=id_col) if index is None else index
+    selected = _security_rows(index, securities)
+    parquet_file = pq.ParquetFile(file_path)
+    if len(selected) == 0:
+        return parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names).to_pandas()
+
+    first_groups = selected['first_row_group'].to_numpy()
+    last_groups = selected['last_row_group'].to_numpy()
+    groups = np.unique(np.concatenate([np.arange(first, last + 1) for first, last in zip(first_groups, last_groups)]))
+    metadata = parquet_file.metadata
+    group_sizes = np.array([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+    file_starts = np.r_[0, np.cumsum(group_sizes)[:-1]]
+    # Offset of the first row of every row group read in the table that is read
+    table_starts = np.zeros(len(group_sizes), dtype=np.int64)
+    table_starts[groups] = np.r_[0, np.cumsum(group_sizes[groups])[:-1]]
+
+    starts = table_starts[first_groups] + selected['start'].to_numpy() - file_starts[first_groups]
+    lengths = (selected['stop'] - selected['start']).to_numpy()
+    rows = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+
+    table = parquet_file.read_row_groups(groups.tolist(), columns=columns)
+    return table.take(pa.array(rows)).to_pandas()
+
+
+def index_panel(df, id_col='cusip', date_col='date'):
+    """
+    The `index_panel` function returns `df` sorted by security and date (unchanged if it already is) and its security
+    index, to fetch the rows of securities with `get_securities`.
+    """
+    if not is_sorted_by_security(df, id_col=id_col, date_col=date_col):
+        df = sort_panel(df, id_col=id_col, date_col=date_col)
+    return df, build_security_index(df, id_col=id_col)
+
+
+def get_securities(df, securities, index):
+    """
+    The `get_securities` function returns the rows of the `securities` (one id or a list of ids) of the panel `df` indexed
+    by `index_panel`, sorted by security and date. A single security is a slice of `df`.
+    """
+    if np.isscalar(securities):
+        if securities not in index.index:
+            return df.iloc[0:0]
+        start, stop = index.loc[securities, ['start', 'stop']]
+        return df.iloc[start:stop]
+    selected = _security_rows(index, securities)
+    lengths = (selected['stop'] - selected['start']).to_numpy()
+    starts = selected['start'].to_numpy()
+    rows = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+    return df.iloc[rows]
@@ -0,0 +1,241 @@
+"""
+The `sketches.py` module has been designed to compute descriptive statistics partition by partition (e.g. one year of the
+merged data at a time) with bounded memory: each partition is summarized by small mergeable aggregates, and the aggregates
+of all the partitions are merged into the statistics of the whole history.
+
+The module contains the following:
+    * MomentAccumulator - Mergeable count, mean, std, min and max.
+    * QuantileSketch - Mergeable KLL-style quantile sketch with a tracked rank error bound.
+    * sketch_by_groups - Builds the aggregates of every column grouped by every group column of a DataFrame.
+    * merge_group_sketches - Merges the aggregates of two partitions.
+    * describe_from_sketches - Turns the aggregates into the tables of `compute_desc_stats.describe_by_groups`.
+
+The moments are merged exactly (Chan et al. parallel update of the mean and of the sum of squared deviations). The
+quantile sketch keeps, at each level h, at most `k` values standing for 2^h values each. A full level is sorted and every
+other value is promoted to the next level, which moves the rank of any value by at most 2^h. The sketch adds up these
+worst cases: `QuantileSketch.rank_error` is a guaranteed bound on the error of the rank of any returned quantile, as a
+fraction of the number of values (in practice, the errors of successive compactions partly cancel and the actual error is
+well below the bound). A sketch that never compacted (at most `k` values) returns the exact percentiles of `numpy`.
+"""
+
+import numpy as np
+import pandas as pd
+
+SKETCH_SIZE = 200
+
+
+class MomentAccumulator:
+    """
+    Mergeable count, mean, standard deviation (ddof=1), minimum and maximum of a set of values.
+    """
+
+    def __init__(self, count=0, mean=0., m2=0., min=np.inf, max=-np.inf):
+        self.count = count
+        self.mean = mean
+        # Sum of the squared deviations from the mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Returns the accumulator of an array of values, missing values being ignored.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        return cls(len(values), mean, ((values - mean) ** 2).sum(), values.min(), values.max())
+
+    def update(self, values):
+        """
+        Adds an array of values to the accumulator.
+        """
+        return self.merge(MomentAccumulator.from_values(values))
+
+    def merge(self, other):
+        """
+        Merges another accumulator into this one and returns it.
+        """
+        count = self.count + other.count
+        if other.count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def to_dict(self):
+        """
+        Returns the count, mean, std, min and max (NaN for an empty accumulator).
+        """
+        if self.count == 0:
+            return {'count': 0., 'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan}
+        return {'count': float(self.count), 'mean': self.mean, 'std': self.std, 'min': self.min, 'max': self.max}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch keeping at most `k` values per level, the values of level h standing for 2^h values each.
+
+    Values are added by arrays with `update`, sketches are combined with `merge` and quantiles are read with `quantile`.
+    `rank_error` is a guaranteed bound on the rank error of the quantiles, as a fraction of the number of values: it is
+    at most log2(n / k) / k for n values added one array at a time, and usually much lower as every compaction of a level
+    counts once whatever the number of values it compacts. `seed` makes the compactions reproducible.
+    """
+
+    def __init__(self, k=SKETCH_SIZE, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._error = 0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """
+        Adds an array of values to the sketch, missing values being ignored.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compact()
+        return self
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one and returns it.
+        """
+        for h, values in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], values])
+        self.n += other.n
+        self._error += other._error
+        self._compact()
+        return self
+
+    def _compact(self):
+        """
+        Halves every level holding more than `k` values, promoting every other sorted value to the next level.
+        """
+        h = 0
+        while h < len(self.levels):
+            values = self.levels[h]
+            if len(values) > self.k:
+                values = np.sort(values)
+                # An odd value out stays at its level, so the total weight is unchanged
+                kept, values = values[len(values) - len(values) % 2:], values[:len(values) - len(values) % 2]
+                promoted = values[self._rng.integers(2)::2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                self.levels[h] = kept
+                self._error += 2 ** h
+            h += 1
+
+    @property
+    def rank_error(self):
+        """
+        Guaranteed bound on the rank error of the quantiles, as a fraction of the number of values.
+        """
+        return self._error / self.n if self.n else 0.
+
+    def __len__(self):
+        return sum(len(values) for values in self.levels)
+
+    def quantile(self, q):
+        """
+        Returns the quantiles `q` (a float or an array of floats in [0, 1]) of the values added to the sketch.
+
+        The quantiles are the exact linear interpolation of `numpy.percentile` as long as the sketch never compacted,
+        and otherwise the retained value whose weighted rank is the first to reach q * n.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        if self._error == 0 and len(self.levels) == 1:
+            return np.percentile(self.levels[0], q * 100)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2. ** h) for h, values in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cumulative_weights = values[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative_weights, q * cumulative_weights[-1], side='left')
+        return values[np.minimum(positions, len(values) - 1)]
+
+
+def sketch_by_groups(df, by, columns, k=SKETCH_SIZE, seed=0):
+    """
+    The `sketch_by_groups` function has been designed to summarize a DataFrame (typically one partition of the data) by the
+    `MomentAccumulator` and the `QuantileSketch` of every column of `columns` for every group of every column of `by`.
+
+    The function returns a dictionary mapping each (group column, column) pair to a dictionary mapping each group to its
+    (MomentAccumulator, QuantileSketch) pair. Rows with a missing group are dropped, as in `groupby`.
+    """
+    sketches = {}
+    for group_col in by:
+        codes, uniques = pd.factorize(df[group_col], sort=True)
+        rows = np.flatnonzero(codes >= 0)
+        order = rows[np.argsort(codes[rows], kind='stable')]
+        bounds = np.r_[0, np.cumsum(np.bincount(codes[rows], minlength=len(uniques)))]
+
+        for column in columns:
+            values = df[column].to_numpy(dtype=np.float64)[order]
+            sketches[(group_col, column)] = {
+                group: (MomentAccumulator.from_values(values[bounds[i]:bounds[i + 1]]),
+                        QuantileSketch(k=k, seed=seed).update(values[bounds[i]:bounds[i + 1]]))
+                for i, group in enumerate(uniques.tolist())
+            }
+    return sketches
+
+
+def merge_group_sketches(left, right):
+    """
+    The `merge_group_sketches` function merges the aggregates of `right` into the ones of `left` (two outputs of
+    `sketch_by_groups`) and returns `left`.
+    """
+    for key, groups in right.items():
+        merged = left.setdefault(key, {})
+        for group, (moments, sketch) in groups.items():
+            if group in merged:
+                merged[group][0].merge(moments)
+                merged[group][1].merge(sketch)
+            else:
+                merged[group] = (moments, sketch)
+    return left
+
+
+def describe_from_sketches(sketches, percentiles):
+    """
+    The `describe_from_sketches` function turns the aggregates of `sketch_by_groups` into a dictionary mapping each
+    (group column, column) pair to a DataFrame with the count, mean, std, min, percentiles and max of each group, as
+    `compute_desc_stats.describe_by_groups` does, plus the `rank_error` bound of the percentiles of each group.
+    """
+    percentiles = sorted(percentiles)
+    labels = [f"{q * 100:g}%" for q in percentiles]
+
+    results = {}
+    for (group_col, column), groups in sketches.items():
+        index = pd.Index(sorted(groups), name=group_col)
+        rows = []
+        for group in index:
+            moments, sketch = groups[group]
+            stats = moments.to_dict()
+            row = {key: stats[key] for key in ['count', 'mean', 'std', 'min']}
+            row.update(zip(labels, sketch.quantile(percentiles)))
+            row['max'] = stats['max']
+            row['rank_error'] = sketch.rank_error
+            rows.append(row)
+        results[(group_col, column)] = pd.DataFrame(rows, index=index,
+                                                    columns=['count', 'mean', 'std', 'min', *labels, 'max', 'rank_error'])
+    return results
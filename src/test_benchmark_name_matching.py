@@ -0,0 +1,67 @@
+"""
+The module `test_benchmark_name_matching.py` is designed to test the name matching benchmark harness on a small set of
+companies, checking that the labeled pairs are built from the ISIN-confirmed matches and that precision and recall are
+computed as expected.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from benchmark_name_matching import build_labeled_pairs, build_master_data, score_matches, run_benchmark, cheapest_config
+
+
+reprisk_company = pd.DataFrame({
+    'reprisk_id': ['1', '2', '3', '4', '5', '6'],
+    'company_name': ['Apple Inc.', 'Microsoft Corporation', 'Alphabet Inc.', 'Amazon.com, Inc.',
+                     'Meta Platforms, Inc.', 'Tesla, Inc.'],
+    'primary_isin': ['US0378331005', 'US5949181045', 'US02079K3059', 'US0231351067', None, 'US88160R1014'],
+})
+markit_company = pd.DataFrame({
+    'isin': ['US0378331005', 'US5949181045', 'US02079K3059', 'US0231351067', 'US30303M1027', None],
+    'instrumentname': ['APPLE INC', 'MICROSOFT CORP', 'ALPHABET INC', 'AMAZON COM INC', 'META PLATFORMS INC', 'TESLA INC'],
+})
+
+
+def test_build_labeled_pairs():
+    """
+    Tests that only the Markit instruments whose ISIN is the primary ISIN of a RepRisk company are labeled, with the
+    `reprisk_id` of that company.
+    """
+    pairs = build_labeled_pairs(markit_company, reprisk_company)
+
+    assert list(pairs.columns) == ['isin', 'instrumentname', 'reprisk_id', 'cleaned_name']
+    assert dict(zip(pairs['isin'], pairs['reprisk_id'])) == {
+        'US0378331005': '1', 'US5949181045': '2', 'US02079K3059': '3', 'US0231351067': '4'}
+    pass
+
+
+def test_score_matches():
+    """
+    Tests the precision and recall computation: rejected matches (NaN) lower the recall but not the precision.
+    """
+    pairs = pd.DataFrame({'reprisk_id': ['1', '2', '3', '4']})
+    scores = score_matches(pairs, ['1', '3', np.nan, '4'])
+
+    assert scores == {'pairs': 4, 'accepted': 3, 'correct': 2, 'precision': 2 / 3, 'recall': 0.5}
+    pass
+
+
+def test_run_benchmark():
+    """
+    Tests that the benchmark reports accuracy and throughput for each configuration and picks the fastest configuration
+    meeting the recall target.
+    """
+    pairs = build_labeled_pairs(markit_company, reprisk_company)
+    master = build_master_data(reprisk_company)
+    configs = {'notebook': {}, 'fast': {'ngrams': (2, 3), 'top_n': 3}}
+
+    results = run_benchmark(pairs, master, configs=configs, recall_target=0.75)
+
+    assert set(results.index) == {'notebook', 'fast'}
+    assert (results['precision'] == 1).all()
+    assert (results['recall'] >= 0.75).all()
+    assert (results['names_per_second'] > 0).all()
+    assert cheapest_config(results, recall_target=0.75) == results['names_per_second'].idxmax()
+    assert cheapest_config(results, recall_target=1.1) is None
+    pass
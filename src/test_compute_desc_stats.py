@@ -0,0 +1,162 @@
+"""
+The module `test_compute_desc_stats.py` is designed to test the fused descriptive statistics engine used by
+`compute_desc_stats`, checking that it produces the same tables as the `groupby(...).describe(...)` calls it replaces.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from trading_calendar import TradingCalendar
+from compute_desc_stats import (describe_by_groups, compute_desc_stats, compute_desc_stats_incremental,
+                                compute_des_stats_change_horizons, compute_des_stats_change_days_ahead,
+                                read_stats_dataset, stats_table, sketch_year_partition,
+                                compute_desc_stats_from_year_sketches, LENDING_INDICATORS,
+                                ESG, PERCENTILES)
+
+
+def _merged_data(n=5000, missing_esg=0.9, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col: rng.lognormal(size=n) for col in LENDING_INDICATORS})
+    for col in LENDING_INDICATORS:
+        df.loc[rng.random(n) < 0.2, col] = np.nan
+    for col in ['severity', 'novelty', 'reach']:
+        values = rng.integers(1, 4, n).astype(float)
+        values[rng.random(n) < missing_esg] = np.nan
+        df[col] = values
+    for col in ['environment', 'social', 'governance']:
+        values = (rng.random(n) < 0.5).astype(object)
+        values[rng.random(n) < missing_esg] = None
+        df[col] = values
+    # A group with a single value and a group without any value
+    df.loc[0, 'severity'], df.loc[0, 'loan fee'] = 5., 1.
+    df.loc[1, 'severity'], df.loc[1, LENDING_INDICATORS] = 7., np.nan
+    return df
+
+
+@pytest.mark.parametrize("missing_esg", [0.9, 0.])
+def test_describe_by_groups(missing_esg):
+    """
+    Tests that the fused engine returns, for every ESG dimension and lending indicator, the table of
+    `df.groupby(i)[j].describe(percentiles=...)`, for sparse and dense ESG columns, with one or several threads.
+    """
+    df = _merged_data(missing_esg=missing_esg)
+
+    for n_jobs in [1, 3]:
+        stats = describe_by_groups(df, by=ESG, columns=LENDING_INDICATORS, percentiles=PERCENTILES, n_jobs=n_jobs)
+        assert len(stats) == len(ESG) * len(LENDING_INDICATORS)
+
+        for i in ESG:
+            for j in LENDING_INDICATORS:
+                expected = df.groupby(i)[j].describe(percentiles=PERCENTILES)
+                pd.testing.assert_frame_equal(stats[(i, j)], expected, check_exact=False, rtol=1e-12)
+    pass
+
+
+def test_compute_desc_stats_incremental(tmp_path):
+    """
+    Tests that the incremental mode only folds in the rows dated after the saved watermark, only rewrites the outputs with
+    new values, and keeps the moments of the full recomputation.
+    """
+    (tmp_path / "stats").mkdir()
+    df = _merged_data(n=4000, missing_esg=0.5)
+    df['date'] = pd.Timestamp('2023-01-02') + pd.to_timedelta(np.arange(len(df)) // 400, unit='D')
+    first_days = df[df['date'] < pd.Timestamp('2023-01-11')]
+
+    written = compute_desc_stats_incremental(first_days, output_dir=tmp_path)
+    assert len(written) == len(ESG) * len(LENDING_INDICATORS)
+    assert compute_desc_stats_incremental(first_days, output_dir=tmp_path) == []
+
+    # The new day only has incidents with a severity
+    new_day = df[df['date'] == pd.Timestamp('2023-01-11')].copy()
+    new_day[[col for col in ESG if col != 'severity']] = None
+    written = compute_desc_stats_incremental(pd.concat([first_days, new_day]), output_dir=tmp_path)
+    assert sorted(path.name for path in written) == sorted(f"{j}_severity.parquet" for j in LENDING_INDICATORS)
+
+    expected = pd.concat([first_days, new_day]).groupby('severity')['loan fee'].describe(percentiles=PERCENTILES)
+    stats = pd.read_parquet(tmp_path / "stats" / "loan fee_severity.parquet")
+    moments = ['count', 'mean', 'std', 'min', 'max']
+    pd.testing.assert_frame_equal(stats[moments], expected[moments], check_exact=False, rtol=1e-9)
+    pass
+
+
+def test_stats_dataset(tmp_path):
+    """
+    Tests that the consolidated dataset holds the tables of the .parquet files of every horizon, read in one scan, and that
+    an incremental refresh replaces the rows of the updated tables only.
+    """
+    (tmp_path / "stats").mkdir()
+    df = _merged_data(n=2000, missing_esg=0.5)
+    df['cusip'] = np.arange(len(df)) % 50
+    df['date'] = pd.Timestamp('2023-01-02') + pd.to_timedelta(np.arange(len(df)) // 50, unit='D')
+    _ = compute_desc_stats(df, output_dir=tmp_path)
+    _ = compute_des_stats_change_horizons(df, horizons=[5], output_dir=tmp_path)
+    _ = compute_des_stats_change_days_ahead(df, days=7, output_dir=tmp_path)
+
+    long_stats = read_stats_dataset(tmp_path)
+    assert sorted(long_stats['horizon'].unique()) == [0, 5, 7]
+    for i, j, suffix, horizon in [('severity', 'loan fee', '', 0), ('social', 'loan supply ratio', '_change_5', 5)]:
+        expected = pd.read_parquet(tmp_path / "stats" / f"{j}_{i}{suffix}.parquet")
+        table = stats_table(long_stats, j, i, horizon)
+        pd.testing.assert_index_equal(table.index, expected.index)
+        np.testing.assert_allclose(table.to_numpy(dtype=float), expected.to_numpy(dtype=float))
+
+    assert len(read_stats_dataset(tmp_path, horizons=[5], indicators=['loan fee'])) == len(
+        long_stats[(long_stats['horizon'] == 5) & (long_stats['indicator'] == 'loan fee')])
+
+    # The incremental mode updates the partition of the levels in place
+    first_days = df[df['date'] < pd.Timestamp('2023-01-30')]
+    _ = compute_desc_stats_incremental(first_days, output_dir=tmp_path)
+    new_day = df[df['date'] == pd.Timestamp('2023-01-30')].copy()
+    new_day[[col for col in ESG if col != 'severity']] = None
+    _ = compute_desc_stats_incremental(pd.concat([first_days, new_day]), output_dir=tmp_path)
+    refreshed = read_stats_dataset(tmp_path, horizons=[0])
+    assert len(refreshed.groupby(['indicator', 'dimension'])) == len(ESG) * len(LENDING_INDICATORS)
+    expected = pd.read_parquet(tmp_path / "stats" / "loan fee_severity.parquet")
+    np.testing.assert_allclose(stats_table(refreshed, 'loan fee', 'severity').to_numpy(dtype=float),
+                               expected.to_numpy(dtype=float))
+    pass
+
+
+def test_change_horizons_calendar(tmp_path):
+    """
+    Tests that, with a trading calendar, the horizons are counted in trading days and the rows dated on other days (a
+    weekend, or after the end of the calendar) are left out instead of raising an error.
+    """
+    (tmp_path / "stats").mkdir()
+    df = _merged_data(n=2000, missing_esg=0.5)
+    df['cusip'] = np.arange(len(df)) % 50
+    df['date'] = pd.Timestamp('2023-01-02') + pd.to_timedelta(np.arange(len(df)) // 50, unit='D')
+    calendar = TradingCalendar(pd.bdate_range('2023-01-02', '2023-02-03'))
+    _ = compute_des_stats_change_horizons(df, horizons=[5], output_dir=tmp_path, calendar=calendar)
+
+    rows = df[calendar.is_trading_day(df['date'])].sort_values(['cusip', 'date'])
+    change = rows.groupby('cusip')['loan fee'].shift(-5) - rows['loan fee']
+    expected = change.groupby(rows['severity']).describe(percentiles=PERCENTILES)
+    stats = pd.read_parquet(tmp_path / "stats" / "loan fee_severity_change_5.parquet")
+    np.testing.assert_allclose(stats.to_numpy(dtype=float), expected.to_numpy(dtype=float))
+    pass
+
+
+def test_compute_desc_stats_from_year_sketches(tmp_path):
+    """
+    Tests that the statistics merged from the aggregates of the yearly partitions, one of them empty, are those of
+    `describe_by_groups` on all the rows (exact percentiles with sketches holding all the values of a group).
+    """
+    (tmp_path / "stats").mkdir()
+    df = _merged_data(n=2000, missing_esg=0.5)
+    years = np.where(np.arange(len(df)) < 1200, 2022, 2023)
+    for year in [2022, 2023, 2024]:
+        df[years == year].to_parquet(tmp_path / f"year={year}.parquet")
+        _ = sketch_year_partition(tmp_path / f"year={year}.parquet", year, output_dir=tmp_path, k=10_000)
+
+    _ = compute_desc_stats_from_year_sketches([2022, 2023, 2024], output_dir=tmp_path, k=10_000)
+    expected = describe_by_groups(df)[('reach', 'loan fee')]
+    stats = pd.read_parquet(tmp_path / "stats" / "loan fee_reach.parquet")
+    np.testing.assert_allclose(stats.to_numpy(dtype=float), expected.to_numpy(dtype=float))
+    table = stats_table(read_stats_dataset(tmp_path), 'loan fee', 'reach')
+    np.testing.assert_allclose(table.to_numpy(dtype=float), expected.to_numpy(dtype=float))
+
+    with pytest.raises(ValueError):
+        compute_desc_stats_from_year_sketches([2022, 2023, 2024], esg=['severity'], output_dir=tmp_path, k=10_000)
+    pass
@@ -0,0 +1,73 @@
+"""
+The module `test_cross_correlation.py` is designed to test the batched lead-lag cross-correlation engine on simulated
+series, checking the correlations of every lag and the rolling correlations against direct per-security computations.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from cross_correlation import pack_series, cross_correlation_table, rolling_correlation
+
+
+def _panel(n_ids=20, n_dates=120, lead=3, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2023-01-02', periods=n_dates)
+    rri = rng.normal(size=(n_ids, n_dates + lead)).cumsum(axis=1)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(dates, n_ids),
+        'current_rri': rri[:, lead:].ravel() + 50,
+        # The fee follows the changes of the RRI `lead` days later
+        'loan fee': np.diff(rri, axis=1, prepend=0)[:, :n_dates].ravel() + rng.normal(size=n_ids * n_dates) * 0.5,
+    })
+    df.loc[rng.random(len(df)) < 0.1, 'loan fee'] = np.nan
+    return df[rng.random(len(df)) < 0.9].sample(frac=1, random_state=seed)
+
+
+def _direct_correlation(df, cusip, lag):
+    """
+    Correlation of the RRI at t and the fee at t + lag for one security, with the dates of the panel.
+    """
+    dates = pd.Index(np.sort(df['date'].unique()))
+    security = df[df['cusip'] == cusip].set_index('date').reindex(dates)
+    x, y = security['current_rri'], security['loan fee'].shift(-lag)
+    return x.corr(y), int((x.notna() & y.notna()).sum())
+
+
+def test_cross_correlation_table():
+    """
+    Tests the correlations of every lag against `Series.corr` and that the lead of the RRI changes on the fee is found.
+    """
+    df = _panel().sort_values(['cusip', 'date'])
+    df['current_rri'] = df.groupby('cusip')['current_rri'].diff()
+    table = cross_correlation_table(df, x_columns=['current_rri'], y_columns=['loan fee'], max_lag=5, min_periods=10)
+
+    assert len(table) == df['cusip'].nunique() * 11
+    for cusip in df['cusip'].unique()[:3]:
+        for lag in [-5, -1, 0, 2, 5]:
+            row = table[(table['cusip'] == cusip) & (table['lag'] == lag)].iloc[0]
+            expected, n = _direct_correlation(df, cusip, lag)
+            assert row['n'] == n
+            np.testing.assert_allclose(row['corr'], expected, rtol=1e-8)
+
+    best_lags = table.loc[table.groupby('cusip')['corr'].idxmax(), 'lag']
+    assert (best_lags == 3).mean() > 0.8
+    pass
+
+
+def test_rolling_correlation():
+    """
+    Tests the rolling correlations against `rolling(...).corr(...)` on the dates of the panel.
+    """
+    df = _panel()
+    result = rolling_correlation(df, 'current_rri', 'loan fee', window=20, min_periods=10)
+
+    ids, dates, _, _ = pack_series(df, ['current_rri'])
+    for cusip in ids[:3]:
+        security = df[df['cusip'] == cusip].set_index('date').reindex(dates)
+        both = security['current_rri'].notna() & security['loan fee'].notna()
+        expected = security['current_rri'].where(both).rolling(20, min_periods=10).corr(security['loan fee'].where(both))
+        rows = df['cusip'] == cusip
+        np.testing.assert_allclose(result[rows].to_numpy(), expected.loc[df.loc[rows, 'date']].to_numpy(), rtol=1e-7)
+    pass
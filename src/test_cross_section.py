@@ -0,0 +1,47 @@
+"""
+The module `test_cross_section.py` is designed to test the cross-sectional normalization engine on a small panel, checking
+the per-date ranks, z-scores and winsorized values against the `groupby('date')` computations they replace.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from cross_section import with_cross_sectional_features
+
+
+def _panel(n_ids=80, n_dates=50, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_dates), n_ids),
+        'loan fee': rng.lognormal(size=n_ids * n_dates),
+        # Many ties
+        'loan utilisation ratio': rng.integers(0, 10, n_ids * n_dates).astype(float),
+    })
+    df.loc[rng.random(len(df)) < 0.1, 'loan fee'] = np.nan
+    # A date with a single value
+    df.loc[(df['date'] == df['date'].iloc[0]) & (df['cusip'] != df['cusip'].iloc[0]), 'loan fee'] = np.nan
+    return df.sample(frac=1, random_state=seed)
+
+
+def test_with_cross_sectional_features():
+    """
+    Tests the ranks, z-scores and winsorized values of every date against `groupby('date')`.
+    """
+    df = _panel()
+    columns = ['loan fee', 'loan utilisation ratio']
+    result = with_cross_sectional_features(df, columns=columns, limits=(0.05, 0.9))
+
+    assert result.index.equals(df.index)
+    grouped = df.groupby('date')
+    for col in columns:
+        pd.testing.assert_series_equal(result[f'{col}_rank'], grouped[col].rank(pct=True), check_names=False)
+
+        zscore = (df[col] - grouped[col].transform('mean')) / grouped[col].transform('std')
+        pd.testing.assert_series_equal(result[f'{col}_zscore'], zscore, check_names=False, rtol=1e-10)
+
+        lower = grouped[col].transform(lambda x: x.quantile(0.05))
+        upper = grouped[col].transform(lambda x: x.quantile(0.9))
+        pd.testing.assert_series_equal(result[f'{col}_winsor'], df[col].clip(lower, upper), check_names=False)
+    pass
@@ -0,0 +1,72 @@
+"""
+The module `test_downsampling.py` is designed to test the downsampling of long series before plotting, checking that the
+points kept preserve the extremes and the shape of simulated series.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from downsampling import minmax_downsample, lttb_downsample, downsample
+
+
+def _series(n=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = pd.bdate_range('1990-01-01', periods=n).to_numpy()
+    y = rng.normal(size=n).cumsum()
+    # A one-day spike
+    y[n // 3] += 100
+    return x, y
+
+
+def test_minmax_downsample():
+    """
+    Tests that the min and max of every bucket, and the endpoints, are kept within the budget.
+    """
+    x, y = _series()
+    kept = minmax_downsample(x, y, 500)
+    assert len(kept) <= 2 * 500 + 2
+    assert np.all(np.diff(kept) > 0) and kept[0] == 0 and kept[-1] == len(y) - 1
+    assert len(y) // 3 in kept and np.argmin(y) in kept
+
+    # Every bucket of the x axis has its extremes among the points kept
+    days = x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    buckets = np.minimum(((days - days[0]) / (days[-1] - days[0]) * 500).astype(int), 499)
+    extremes = pd.Series(y).groupby(buckets).agg(['idxmin', 'idxmax'])
+    assert set(extremes.to_numpy().ravel()) <= set(kept)
+    np.testing.assert_array_equal(minmax_downsample(x[:100], y[:100], 500), np.arange(100))
+    pass
+
+
+def test_lttb_downsample():
+    """
+    Tests that LTTB keeps the requested number of points, one per bucket, the endpoints and the spike.
+    """
+    x, y = _series()
+    kept = lttb_downsample(x, y, 1000)
+    assert len(kept) == 1000
+    assert np.all(np.diff(kept) > 0) and kept[0] == 0 and kept[-1] == len(y) - 1
+    assert len(y) // 3 in kept
+
+    edges = np.floor(np.linspace(1, len(y) - 1, 999)).astype(int)
+    np.testing.assert_array_equal(np.searchsorted(edges, kept[1:-1], side='right') - 1, np.arange(998))
+    # Points on a line: any choice keeps the line
+    line = lttb_downsample(np.arange(50.), 2 * np.arange(50.), 10)
+    assert len(line) == 10
+    pass
+
+
+def test_downsample():
+    """
+    Tests the point budget, and that short series are kept whole with their missing values.
+    """
+    x, y = _series()
+    y[::10] = np.nan
+    for method in ['minmax', 'lttb']:
+        kept = downsample(x, y, max_points=2000, method=method)
+        assert len(kept) <= 2000 and np.isfinite(y[kept]).all()
+        assert len(y) // 3 in kept
+    np.testing.assert_array_equal(downsample(x[:500], y[:500], max_points=2000), np.arange(500))
+    with pytest.raises(ValueError):
+        downsample(x, y, method='every_other')
+    pass
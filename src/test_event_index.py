@@ -0,0 +1,76 @@
+"""
+The module `test_event_index.py` is designed to test the sparse event table and the event-window slicing engine on a small
+panel, checking that events point to the right rows and that windows never cross from one security to another.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from event_index import split_panel_events, build_event_table, event_windows
+
+
+def _merged_data():
+    dates = pd.to_datetime(['2023-01-03', '2023-01-04', '2023-01-05', '2023-01-06', '2023-01-09'])
+    df = pd.DataFrame({
+        'cusip': ['B'] * 5 + ['A'] * 5,
+        'date': list(dates) * 2,
+        'loan fee': np.arange(10, dtype=float),
+        'loan utilisation ratio': np.arange(10, dtype=float) * 10,
+    })
+    df['incident_date'] = pd.NaT
+    df['severity'] = np.nan
+    df.loc[1, ['incident_date', 'severity']] = [pd.Timestamp('2023-01-04'), 2.]
+    df.loc[8, ['incident_date', 'severity']] = [pd.Timestamp('2023-01-06'), 1.]
+    # A second incident on the same day duplicates the Markit row
+    extra = df.loc[[8]].assign(severity=3.)
+    return pd.concat([df, extra], ignore_index=True)
+
+
+def test_split_panel_events():
+    """
+    Tests that the merged data is split into a panel with one row per security and date, sorted by security and date, and
+    an event table pointing each incident to its row.
+    """
+    panel, events = split_panel_events(_merged_data(), attributes=['severity'])
+
+    assert panel.shape == (10, 4)
+    assert panel['cusip'].tolist() == ['A'] * 5 + ['B'] * 5
+    assert 'severity' not in panel.columns
+
+    assert events.shape[0] == 3
+    assert (panel.loc[events['row'], 'date'].to_numpy() == events['event_date'].to_numpy()).all()
+    assert (panel.loc[events['row'], 'cusip'].to_numpy() == events['cusip'].to_numpy()).all()
+    pass
+
+
+def test_event_windows():
+    """
+    Tests the shape of the event windows and that positions outside of the rows of the security of the event are NaN.
+    """
+    panel, events = split_panel_events(_merged_data(), attributes=['severity'])
+    windows = event_windows(panel, events, columns=['loan fee'], k=2)
+
+    assert windows.shape == (3, 5, 1)
+    b_event = events.index[events['cusip'] == 'B'][0]
+    np.testing.assert_array_equal(windows[b_event, :, 0], [np.nan, 0., 1., 2., 3.])
+    a_event = events.index[events['cusip'] == 'A'][0]
+    np.testing.assert_array_equal(windows[a_event, :, 0], [6., 7., 8., 9., np.nan])
+    pass
+
+
+def test_build_event_table_next_trading_day():
+    """
+    Tests that an event dated on a weekend is pointed to the next trading day of its security, and dropped when there is no
+    such day within the tolerance.
+    """
+    panel, _ = split_panel_events(_merged_data())
+    events = pd.DataFrame({
+        'cusip': ['A', 'A', 'C'],
+        'incident_date': pd.to_datetime(['2023-01-07', '2023-01-10', '2023-01-04']),
+    })
+    table = build_event_table(panel, events, attributes=[], max_days_forward=3)
+
+    assert table.shape[0] == 1
+    assert panel.loc[table.loc[0, 'row'], 'date'] == pd.Timestamp('2023-01-09')
+    pass
@@ -0,0 +1,72 @@
+"""
+The module `test_event_study.py` is designed to test the event-study engine on a simulated panel where the loan fee of a
+security jumps after its high-severity incidents, checking the abnormal changes against a per-event computation.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from event_index import split_panel_events
+from event_study import abnormal_changes, average_abnormal_changes, abnormal_changes_by_attribute, run_event_study
+
+
+def _merged_data(n_securities=40, n_days=80, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2023-01-02', periods=n_days)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_securities)], n_days),
+        'date': np.tile(dates, n_securities),
+    })
+    # A market-wide trend on every security
+    df['loan fee'] = rng.normal(size=len(df)) * 0.1 + np.tile(np.arange(n_days) * 0.01, n_securities)
+    df['loan supply ratio'] = rng.normal(size=len(df)) * 0.1 + np.tile(np.arange(n_days) * 0.01, n_securities)
+    df['incident_date'] = pd.NaT
+    df['severity'] = np.nan
+
+    # One incident per security on day 40, the fee jumping by 1 after the high-severity ones
+    event_rows = np.arange(n_securities) * n_days + 40
+    df.loc[event_rows, 'incident_date'] = df.loc[event_rows, 'date']
+    df.loc[event_rows, 'severity'] = np.where(np.arange(n_securities) % 2 == 0, 3., 1.)
+    security_day = np.arange(len(df)) % n_days
+    high = np.repeat(np.arange(n_securities) % 2 == 0, n_days)
+    df.loc[high & (security_day >= 40), 'loan fee'] += 1.
+    return df
+
+
+def test_abnormal_changes():
+    """
+    Tests the abnormal changes against a per-event computation, with both benchmarks.
+    """
+    panel, events = split_panel_events(_merged_data(), attributes=['severity'])
+    columns = ['loan fee', 'loan supply ratio']
+
+    abnormal, offsets = abnormal_changes(panel, events, columns=columns, event_window=(-2, 3),
+                                         estimation_window=(-20, -6), chunk_size=7)
+    assert abnormal.shape == (len(events), 6, 2)
+    np.testing.assert_array_equal(offsets, np.arange(-2, 4))
+    for e, event in events.iterrows():
+        values = panel.loc[event['start']:event['stop'] - 1, columns].to_numpy()
+        row = event['row'] - event['start']
+        expected = values[row - 2:row + 4] - values[row - 20:row - 5].mean(axis=0)
+        np.testing.assert_allclose(abnormal[e], expected)
+
+    # The market-wide trend is removed by the market benchmark
+    market, _ = abnormal_changes(panel, events, columns=['loan supply ratio'], benchmark='market')
+    pre_window, _ = abnormal_changes(panel, events, columns=['loan supply ratio'])
+    assert np.abs(np.nanmean(market)) < 0.05 < 0.1 < np.nanmean(pre_window)
+    pass
+
+
+def test_event_study_summaries():
+    """
+    Tests that the average response jumps at the event and that the high-severity incidents drive it.
+    """
+    average, by_attribute = run_event_study(_merged_data(), columns=['loan fee'], attributes=['severity'], window=(0, 5))
+
+    assert average.loc[('loan fee', 0), 'count'] == 40
+    assert average.loc[('loan fee', 5), 'mean'] - average.loc[('loan fee', -1), 'mean'] > 0.4
+    severity = by_attribute['severity']
+    assert abs(severity.loc[(3., 'loan fee'), 'mean'] - severity.loc[(1., 'loan fee'), 'mean'] - 1) < 0.1
+    assert list(severity.columns) == ['mean', 'se', 't_stat', 'count']
+    pass
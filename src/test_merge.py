@@ -7,6 +7,9 @@ significant data loss or mismatch.
 The mdule contains the following functions:
     * test_merge
     * test_merge_crsp_markit_validity
+    * test_asof_align_dates
+    * test_aggregate_daily_incidents
+    * test_write_year_partitions
 """
 import pandas as pd
 import numpy as np
@@ -18,7 +21,8 @@ from load_crsp import load_CRSP
 from load_markit import load_Markit
 from load_reprisk import load_RepRisk
 from merge_markit_crsp import merge_markit_crsp
-from merge_markit_crsp_reprisk import merge_data
+from merge_markit_crsp_reprisk import (merge_data, asof_align_dates, aggregate_daily_incidents, write_year_partitions,
+                                      year_partition_path)
 
 DATA_DIR = config.DATA_DIR
 START_DATE = config.START_DATE
@@ -180,3 +184,103 @@ def test_merge_crsp_markit_validity():
                    'loan fee': 0.1153239415143936}
     assert dict(df_sampled[['short interest ratio','loan supply ratio','loan utilisation ratio','loan fee']].mean()) == ratio_means
     pass
+
+
+def test_asof_align_dates():
+    """
+    Tests the as-of alignment of RepRisk records on the Markit trading days of the same security.
+
+    The function ensures:
+        * A record dated on a weekend is moved to the next trading day (forward) or to the previous one (backward).
+        * A record dated on a trading day keeps its date and a record too far from any trading day is not aligned.
+        * A record is never aligned on a trading day of another security.
+    """
+    markit_crsp_df = pd.DataFrame({
+        'cusip': ['A', 'A', 'A', 'B'],
+        'date': pd.to_datetime(['2023-01-05', '2023-01-06', '2023-01-09', '2023-01-20']),
+    })
+    reprisk_df = pd.DataFrame({
+        'cusip': ['A', 'A', 'A', 'B', 'C'],
+        'date': pd.to_datetime(['2023-01-07', '2023-01-06', '2023-01-14', '2023-01-09', '2023-01-09']),
+        'severity': [1., 2., 3., 1., 2.],
+    })
+
+    forward = asof_align_dates(markit_crsp_df, reprisk_df, direction='forward', tolerance='3D')
+    expected = pd.to_datetime(['2023-01-09', '2023-01-06', None, None, None])
+    pd.testing.assert_series_equal(forward['date'], pd.Series(expected, name='date'))
+    pd.testing.assert_series_equal(forward['reprisk_date'], reprisk_df['date'].rename('reprisk_date'))
+
+    backward = asof_align_dates(markit_crsp_df, reprisk_df, direction='backward', tolerance='7D')
+    expected = pd.to_datetime(['2023-01-06', '2023-01-06', '2023-01-09', None, None])
+    pd.testing.assert_series_equal(backward['date'], pd.Series(expected, name='date'))
+
+    df = merge_data(markit_crsp_df, forward, from_cache=False, save_cache=False)
+    assert df.shape[0] == 4
+    assert df['severity'].fillna(0).tolist() == [0., 2., 1., 0.]
+    pass
+
+
+def test_aggregate_daily_incidents():
+    """
+    Tests that the RepRisk incidents are collapsed to one row per ('cusip', 'date') with the expected aggregates, and that
+    the merged data then has exactly one row per Markit observation.
+    """
+    markit_crsp_df = pd.DataFrame({
+        'cusip': ['A', 'A', 'B'],
+        'date': pd.to_datetime(['2023-01-05', '2023-01-06', '2023-01-05']),
+        'loan fee': [0.1, 0.2, 0.3],
+    })
+    reprisk_df = pd.DataFrame({
+        'cusip': ['A', 'A', 'A', 'B'],
+        'date': pd.to_datetime(['2023-01-05', '2023-01-05', '2023-01-06', '2023-01-05']),
+        'current_rri': [30., 30., 31., 10.],
+        'incident_date': pd.to_datetime(['2023-01-05', '2023-01-05', None, '2023-01-05']),
+        'severity': [1., 3., np.nan, 2.],
+        'reach': [2., 2., np.nan, 1.],
+        'novelty': [1., 2., np.nan, 1.],
+        'environment': [True, False, None, False],
+        'social': [True, True, None, False],
+        'governance': [False, False, None, True],
+    })
+
+    daily = aggregate_daily_incidents(reprisk_df).set_index(['cusip', 'date'])
+    assert daily.shape[0] == 3
+    row = daily.loc[('A', pd.Timestamp('2023-01-05'))]
+    assert row['incident_count'] == 2 and row['current_rri'] == 30.
+    assert row['severity_max'] == 3. and row['severity_mean'] == 2. and row['novelty_mean'] == 1.5
+    assert row['environment_count'] == 1 and row['social_count'] == 2 and not row['governance_any']
+    row = daily.loc[('A', pd.Timestamp('2023-01-06'))]
+    assert row['incident_count'] == 0 and np.isnan(row['severity_max']) and not row['environment_any']
+
+    df = merge_data(markit_crsp_df, reprisk_df, from_cache=False, save_cache=False, aggregate_incidents=True)
+    assert df.shape[0] == markit_crsp_df.shape[0]
+    assert df['incident_count'].tolist() == [2, 0, 1]
+    pass
+
+
+def test_write_year_partitions(tmp_path):
+    """
+    Tests that the yearly partitions hold the rows of their year, and that a partition is only rewritten when its rows
+    changed.
+    """
+    (tmp_path / "pulled").mkdir()
+    df = pd.DataFrame({
+        'cusip': np.repeat(['000000001', '000000002'], 600),
+        'date': np.tile(pd.date_range('2022-06-01', periods=600), 2),
+        'loan fee': np.arange(1200, dtype=float),
+    })
+    df.to_parquet(tmp_path / "pulled" / "merged_data.parquet", index=False)
+
+    years = [2022, 2023, 2024, 2025]
+    assert write_year_partitions(years, data_dir=tmp_path) == years
+    for year in years:
+        partition = pd.read_parquet(year_partition_path(year, data_dir=tmp_path))
+        pd.testing.assert_frame_equal(partition, df[df['date'].dt.year == year].reset_index(drop=True))
+    assert pd.read_parquet(year_partition_path(2025, data_dir=tmp_path)).empty
+
+    # Only the partitions of the years with new values are written again
+    df.loc[df['date'] >= pd.Timestamp('2023-06-01'), 'loan fee'] += 1
+    df.to_parquet(tmp_path / "pulled" / "merged_data.parquet", index=False)
+    assert write_year_partitions(years, data_dir=tmp_path) == [2023, 2024]
+    assert not list(year_partition_path(2023, data_dir=tmp_path).parent.glob("*.tmp"))
+    pass
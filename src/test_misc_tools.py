@@ -0,0 +1,146 @@
+"""
+The module `test_misc_tools.py` is designed to test the panel helpers of `misc_tools`, checking that the faster
+implementations return the same results as the original ones.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+import misc_tools
+import grouped_kernels
+
+
+def _panel(n_ids=50, n_dates=120, fill=0.9, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2023-01-02', periods=n_dates)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(dates, n_ids),
+    })
+    # Missing days and shuffled rows
+    df = df[rng.random(len(df)) < fill].sample(frac=1, random_state=seed).reset_index(drop=True)
+    df['loan fee'] = rng.lognormal(size=len(df))
+    df['loan utilisation ratio'] = rng.uniform(0, 100, size=len(df))
+    return df
+
+
+def test_with_multi_horizon_lagged_columns():
+    """
+    Tests that the multi-horizon lag engine returns, for every lag and lead, the same columns as `with_lagged_columns`.
+    """
+    df = _panel()
+    columns = ['loan fee', 'loan utilisation ratio']
+    lags = [1, 5, -1, -5, -26]
+
+    result = misc_tools.with_multi_horizon_lagged_columns(data=df, columns_to_lag=columns, id_columns=['cusip'], lags=lags)
+
+    for lag in lags:
+        expected = misc_tools.with_lagged_columns(data=df, columns_to_lag=columns, id_columns=['cusip'], lags=lag)
+        for col in columns:
+            pd.testing.assert_series_equal(result[f'L{lag}_{col}'], expected[f'L{lag}_{col}'])
+    pd.testing.assert_frame_equal(result[df.columns], df)
+    pass
+
+
+def _weighted_groups(n=3000, n_groups=400, seed=1):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'date': rng.integers(0, n_groups, n),
+        'rate': rng.normal(size=n),
+        'volume': rng.uniform(0.1, 10, n),
+    })
+    # Groups with a single row
+    return pd.concat([df, pd.DataFrame({'date': [n_groups, n_groups + 1], 'rate': [1., 2.], 'volume': [1., 3.]})],
+                     ignore_index=True)
+
+
+def test_grouped_weighted_statistics():
+    """
+    Tests that the grouped weighted average, std, quantiles and leave-one-out sums return the results of the per-group
+    computations they replace.
+    """
+    df = _weighted_groups()
+    grouped = df.groupby('date')
+
+    expected = grouped.apply(lambda x: np.average(x['rate'], weights=x['volume']), include_groups=False)
+    pd.testing.assert_series_equal(
+        misc_tools.groupby_weighted_average(data_col='rate', weight_col='volume', by_col='date', data=df),
+        expected, check_exact=False, rtol=1e-12)
+
+    def weighted_sd(x, ddof):
+        average = np.average(x['rate'], weights=x['volume'])
+        return np.sqrt(np.sum(x['volume'] * (x['rate'] - average) ** 2)
+                       / ((x['rate'].count() - ddof) / x['rate'].count() * np.sum(x['volume'])))
+
+    for ddof in [0, 1]:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            expected = grouped.apply(weighted_sd, ddof=ddof, include_groups=False)
+        pd.testing.assert_series_equal(
+            misc_tools.groupby_weighted_std(data_col='rate', weight_col='volume', by_col='date', data=df, ddof=ddof),
+            expected, check_exact=False, rtol=1e-10)
+
+    for old_style in [False, True]:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            expected = grouped.apply(lambda x: pd.Series(misc_tools.weighted_quantile(
+                x['rate'], [0, .1, .5, .9, 1], sample_weight=x['volume'], old_style=old_style)), include_groups=False)
+        result = misc_tools.groupby_weighted_quantile(data_col='rate', weight_col='volume', by_col='date', data=df,
+                                                      quantiles=[0, .1, .5, .9, 1], old_style=old_style)
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-8, atol=1e-8)
+
+    median = misc_tools.groupby_weighted_quantile(data_col='rate', weight_col='volume', by_col='date', data=df,
+                                                  transform=True, new_column_name='median')
+    assert median.name == 'median' and median.index.equals(df.index)
+    expected = misc_tools.groupby_weighted_quantile(data_col='rate', weight_col='volume', by_col='date', data=df)
+    np.testing.assert_allclose(median.to_numpy(), expected.to_numpy()[pd.factorize(df['date'], sort=True)[0]])
+
+    df['rate_int'] = (df['rate'] * 100).round().astype(int)
+    pd.testing.assert_series_equal(
+        misc_tools.leave_one_out_sums(df, groupby=['date'], summed_col='rate_int'),
+        df.groupby(['date'])['rate_int'].transform(lambda x: x.sum() - x), check_names=False)
+    pass
+
+
+def test_group_codes_missing_keys():
+    """
+    Tests that rows with a missing key in any of several group columns get the code -1, the other rows the codes of the
+    groups of `groupby`.
+    """
+    df = _weighted_groups(n=500, n_groups=20)
+    df['desk'] = np.where(np.arange(len(df)) % 3 == 0, 'a', 'b')
+    df.loc[df.index[::7], 'desk'] = None
+    df.loc[df.index[::11], 'date'] = np.nan
+
+    with np.errstate(all='raise'):
+        codes, index = grouped_kernels.group_codes(df, ['date', 'desk'])
+    missing = df['date'].isna() | df['desk'].isna()
+    assert (codes[missing.to_numpy()] == -1).all() and (codes[~missing.to_numpy()] >= 0).all()
+    assert index.equals(df.groupby(['date', 'desk']).size().index)
+    pd.testing.assert_series_equal(
+        misc_tools.groupby_weighted_average(data_col='rate', weight_col='volume', by_col=['date', 'desk'], data=df),
+        df.groupby(['date', 'desk']).apply(lambda x: np.average(x['rate'], weights=x['volume']), include_groups=False),
+        check_exact=False, rtol=1e-12)
+    pass
+
+
+def test_plot_weighted_median_with_distribution_bars():
+    """
+    Tests that the plotted median and bands are the weighted quantiles of every date.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+
+    df = _weighted_groups(n=2000, n_groups=100)
+    df['date'] = pd.Timestamp('2023-01-02') + pd.to_timedelta(df['date'], unit='D')
+    fig, ax = plt.subplots()
+    ax = misc_tools.plot_weighted_median_with_distribution_bars(data=df, variable_name='rate', weight_col='volume',
+                                                                percentiles=[0.25, 0.75], ax=ax, add_quarter_lines=False)
+
+    grouped = df.groupby('date')
+    for line, q in zip(ax.get_lines(), [0.5, 0.25, 0.75]):
+        expected = grouped.apply(lambda x: misc_tools.weighted_quantile(x['rate'], q, sample_weight=x['volume']),
+                                 include_groups=False)
+        np.testing.assert_allclose(line.get_ydata(), expected.to_numpy(), rtol=1e-8, atol=1e-8)
+    plt.close(fig)
+    pass
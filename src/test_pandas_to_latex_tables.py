@@ -0,0 +1,83 @@
+"""
+The module `test_pandas_to_latex_tables.py` is designed to test the conversion of the stats to LaTeX tables, checking that
+only the tables whose source changed are rendered again.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from compute_desc_stats import compute_desc_stats, compute_des_stats_change_days_ahead, ESG, LENDING_INDICATORS
+from pandas_to_latex_tables import update_latex_tables, parquet_to_latex_table
+
+
+def _output_dir(tmp_path, seed=0):
+    rng = np.random.default_rng(seed)
+    (tmp_path / "stats").mkdir()
+    df = pd.DataFrame({col: rng.lognormal(size=500) for col in LENDING_INDICATORS})
+    for col in ESG:
+        df[col] = rng.integers(1, 4, 500).astype(float)
+    _ = compute_desc_stats(df, output_dir=tmp_path)
+    pd.DataFrame({'mean': [1., 2.]}, index=['low', 'high']).to_parquet(tmp_path / "stats" / "portfolio_sort.parquet")
+    return tmp_path
+
+
+def test_update_latex_tables(tmp_path):
+    """
+    Tests that the tables are all rendered on the first run, then only when their source changes or their .tex file is
+    missing, in the `tables` folder of the given output directory.
+    """
+    output_dir = _output_dir(tmp_path)
+    written = update_latex_tables(output_dir, n_jobs=4)
+    assert len(written) == len(ESG) * len(LENDING_INDICATORS) + 1
+    assert all(path.parent == output_dir / "tables" for path in written)
+    assert "1.0000" in (output_dir / "tables" / "portfolio_sort.tex").read_text()
+    assert not list((output_dir / "tables").glob("*.tmp"))
+
+    assert update_latex_tables(output_dir) == []
+
+    pd.DataFrame({'mean': [1., 3.]}, index=['low', 'high']).to_parquet(output_dir / "stats" / "portfolio_sort.parquet")
+    (output_dir / "tables" / "loan_fee_severity.tex").unlink()
+    written = update_latex_tables(output_dir)
+    assert sorted(path.name for path in written) == ["loan_fee_severity.tex", "portfolio_sort.tex"]
+    assert "3.0000" in (output_dir / "tables" / "portfolio_sort.tex").read_text()
+
+    assert len(update_latex_tables(output_dir, force=True)) == len(ESG) * len(LENDING_INDICATORS) + 1
+    pass
+
+
+def test_update_latex_tables_horizons(tmp_path):
+    """
+    Tests that the descriptive statistics of the changes are only converted for the configured horizons, those of other
+    horizons left in the stats folder and the dataset by earlier runs being skipped.
+    """
+    output_dir = _output_dir(tmp_path)
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({col: rng.lognormal(size=500) for col in LENDING_INDICATORS})
+    for col in ESG:
+        df[col] = rng.integers(1, 4, 500).astype(float)
+    df['cusip'] = np.arange(500) % 10
+    df['date'] = pd.Timestamp('2023-01-02') + pd.to_timedelta(np.arange(500) // 10, unit='D')
+    _ = compute_des_stats_change_days_ahead(df, days=7, output_dir=output_dir)
+
+    written = update_latex_tables(output_dir, horizons=[5, 26])
+    assert len(written) == len(ESG) * len(LENDING_INDICATORS) + 1
+    assert not (output_dir / "tables" / "loan_fee_severity_change_7.tex").exists()
+    written = update_latex_tables(output_dir, horizons=[7])
+    assert len(written) == len(ESG) * len(LENDING_INDICATORS)
+    assert (output_dir / "tables" / "loan_fee_severity_change_7.tex").exists()
+    pass
+
+
+def test_parquet_to_latex_table(tmp_path):
+    """
+    Tests that the .parquet files of the stats folder of the given output directory are converted.
+    """
+    output_dir = _output_dir(tmp_path)
+    (output_dir / "tables").mkdir()
+    written = parquet_to_latex_table(output_dir=output_dir)
+    assert len(written) == len(ESG) * len(LENDING_INDICATORS) + 1
+    assert len(parquet_to_latex_table(output_dir=output_dir)) == len(written)
+    assert (output_dir / "tables" / "loan_fee_severity.tex").exists()
+    assert (output_dir / "tables" / "portfolio_sort.tex").exists()
+    pass
@@ -0,0 +1,73 @@
+"""
+The module `test_panel_cube.py` is designed to test the memory-mapped panel cube on a small long panel, checking the slices
+of the cube against the pivoted panel.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from panel_cube import build_panel_cube, load_panel_cube, PanelCube
+
+
+def _panel(n_ids=30, n_dates=40, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_dates), n_ids),
+        'loan fee': rng.lognormal(size=n_ids * n_dates),
+        'current_rri': rng.integers(0, 60, n_ids * n_dates).astype(float),
+    })
+    df.loc[rng.random(len(df)) < 0.1, 'loan fee'] = np.nan
+    return df[rng.random(len(df)) < 0.9].sample(frac=1, random_state=seed)
+
+
+def test_panel_cube(tmp_path):
+    """
+    Tests the arrays, the date and security slices and the frames of the cube against `pivot`.
+    """
+    df = _panel()
+    columns = ['loan fee', 'current_rri']
+    _ = build_panel_cube(df, tmp_path / 'cube', columns=columns)
+    cube = PanelCube(tmp_path / 'cube')
+
+    for column in columns:
+        wide = df.pivot(index='date', columns='cusip', values=column).astype(np.float32)
+        assert isinstance(cube[column], np.memmap)
+        np.testing.assert_array_equal(cube[column], wide.to_numpy())
+
+        date, security = wide.index[7], wide.columns[3]
+        view = cube.on_date(column, date)
+        assert np.shares_memory(view, cube[column])
+        np.testing.assert_array_equal(view, wide.loc[date].to_numpy())
+        view = cube.for_security(column, security)
+        assert np.shares_memory(view, cube[column])
+        np.testing.assert_array_equal(view, wide[security].to_numpy())
+
+    rows = cube.date_slice('2023-01-10', '2023-01-20')
+    assert cube.dates[rows].equals(pd.bdate_range('2023-01-10', '2023-01-20'))
+    series = cube.time_series(wide.columns[3], start='2023-01-10', end='2023-01-20')
+    assert list(series.columns) == columns and len(series) == 9
+    assert cube.cross_section(wide.index[7]).index.equals(cube.securities)
+    with pytest.raises(KeyError):
+        cube.on_date('loan fee', '2022-01-03')
+    pass
+
+
+def test_load_panel_cube(tmp_path):
+    """
+    Tests that the cube of a dataset is built, then opened from disk, and rebuilt when a column is missing.
+    """
+    (tmp_path / 'pulled').mkdir()
+    df = _panel()
+    # One row per incident: the first row of every (security, date) is used
+    duplicated = pd.concat([df, df.assign(**{'loan fee': -1.})])
+    duplicated.to_parquet(tmp_path / 'pulled' / 'merged_data.parquet')
+
+    cube = load_panel_cube(columns=['loan fee'], data_dir=tmp_path)
+    assert np.nanmin(cube['loan fee']) > 0
+    manifest_time = (tmp_path / 'derived' / 'merged_data_cube' / 'manifest.json').stat().st_mtime_ns
+    assert load_panel_cube(columns=['loan fee'], data_dir=tmp_path).columns == ['loan fee']
+    assert (tmp_path / 'derived' / 'merged_data_cube' / 'manifest.json').stat().st_mtime_ns == manifest_time
+    assert load_panel_cube(columns=['loan fee', 'current_rri'], data_dir=tmp_path).columns == ['loan fee', 'current_rri']
+    pass
@@ -0,0 +1,113 @@
+"""
+The module `test_panel_regression.py` is designed to test the fixed-effects regression engine on a simulated panel,
+checking the coefficients and clustered standard errors against the regression with dummy variables.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from panel_regression import demean, drop_singletons, fit_panel_ols
+
+
+def _panel(n_securities=60, n_days=40, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_securities)], n_days),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_days), n_securities),
+    })
+    # Unbalanced panel
+    df = df[rng.random(len(df)) < 0.8].reset_index(drop=True)
+    security_effect = pd.factorize(df['cusip'])[0] * 0.1
+    date_effect = pd.factorize(df['date'])[0] * 0.05
+    df['severity_max'] = rng.integers(1, 4, len(df)) + security_effect
+    df['environment_any'] = rng.random(len(df)) < 0.3
+    df['loan fee'] = (0.5 * df['severity_max'] - 0.3 * df['environment_any'] + security_effect + date_effect
+                      + rng.normal(size=len(df)))
+    return df
+
+
+def _dummy_ols(df, y, x, fixed_effects):
+    """
+    OLS with one dummy per fixed-effect group, returning the coefficients of `x`, the design matrix and the residuals.
+    """
+    dummies = [pd.get_dummies(df[fe], drop_first=i > 0).to_numpy(dtype=float) for i, fe in enumerate(fixed_effects)]
+    X = np.column_stack([df[x].to_numpy(dtype=float), *dummies])
+    beta = np.linalg.lstsq(X, df[y].to_numpy(), rcond=None)[0]
+    return beta[:len(x)], X, df[y].to_numpy() - X @ beta
+
+
+def test_demean():
+    """
+    Tests that the demeaned columns have zero mean within every group of every fixed effect.
+    """
+    df = _panel()
+    codes_list = [pd.factorize(df['cusip'])[0], pd.factorize(df['date'])[0]]
+    X, iterations = demean(df[['loan fee', 'severity_max']].to_numpy(), codes_list, tol=1e-12)
+
+    assert iterations > 1
+    for codes in codes_list:
+        np.testing.assert_allclose(np.bincount(codes, weights=X[:, 0]), 0, atol=1e-8)
+    np.testing.assert_array_equal(drop_singletons([np.array([0, 0, 1, 2, 2]), np.array([0, 1, 1, 0, 0])]),
+                                  [False, False, False, True, True])
+    pass
+
+
+def test_fit_panel_ols():
+    """
+    Tests the coefficients against the regression with security and date dummies, and the clustered standard errors
+    against the ones of the dummy regression with date dummies.
+    """
+    df = _panel()
+    x = ['severity_max', 'environment_any']
+
+    result = fit_panel_ols(df, 'loan fee', x, fixed_effects=['cusip', 'date'], cluster=['cusip'])
+    expected, _, _ = _dummy_ols(df, 'loan fee', x, ['cusip', 'date'])
+    np.testing.assert_allclose(result['coef'], expected, rtol=1e-7)
+    assert result.attrs['n_obs'] == len(df) and result.attrs['n_clusters'] == df['cusip'].nunique()
+    assert result.loc['severity_max', 'ci_lower'] < 0.5 < result.loc['severity_max', 'ci_upper']
+
+    # With date fixed effects only, the clustered covariance is the one of the dummy regression (CR1)
+    result = fit_panel_ols(df, 'loan fee', x, fixed_effects=['date'], cluster=['cusip'])
+    coef, X, residuals = _dummy_ols(df, 'loan fee', x, ['date'])
+    n, k = X.shape
+    bread = np.linalg.inv(X.T @ X)
+    scores = pd.DataFrame(X * residuals[:, None]).groupby(df['cusip'].to_numpy()).sum().to_numpy()
+    n_clusters = len(scores)
+    covariance = bread @ scores.T @ scores @ bread * n_clusters / (n_clusters - 1) * (n - 1) / (n - k)
+    np.testing.assert_allclose(result['coef'], coef, rtol=1e-7)
+    np.testing.assert_allclose(result['std_err'], np.sqrt(np.diag(covariance))[:len(x)], rtol=1e-6)
+    pass
+
+
+def test_fit_panel_ols_options():
+    """
+    Tests the filling of missing regressors, two-way clustering and regressors absorbed by the fixed effects.
+    """
+    df = _panel()
+    df['security_level'] = pd.factorize(df['cusip'])[0].astype(float)
+    df.loc[df['environment_any'], 'severity_max'] = np.nan
+
+    dropped = fit_panel_ols(df, 'loan fee', ['severity_max'], cluster=['cusip', 'date'])
+    filled = fit_panel_ols(df, 'loan fee', ['severity_max'], cluster=['cusip', 'date'], fillna=0)
+    assert dropped.attrs['n_obs'] == df['severity_max'].notna().sum()
+    assert filled.attrs['n_obs'] == len(df)
+    assert (filled['std_err'] > 0).all()
+
+    absorbed = fit_panel_ols(df, 'loan fee', ['severity_max', 'security_level'], fillna=0, cluster=None)
+    assert np.isnan(absorbed.loc['security_level', 'coef'])
+    np.testing.assert_allclose(absorbed.loc['severity_max', 'coef'], filled.loc['severity_max', 'coef'])
+    pass
+
+
+def test_fit_panel_ols_to_parquet(tmp_path):
+    """
+    Tests that a fitted table, with its attributes, is saved to and read back from a .parquet file.
+    """
+    df = _panel()
+    result = fit_panel_ols(df, 'loan fee', ['severity_max', 'environment_any'], cluster=['cusip'])
+    result.to_parquet(tmp_path / 'loan fee_panel_regression.parquet')
+    read = pd.read_parquet(tmp_path / 'loan fee_panel_regression.parquet')
+    pd.testing.assert_frame_equal(read, result)
+    assert read.attrs == result.attrs
+    pass
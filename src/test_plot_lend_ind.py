@@ -0,0 +1,71 @@
+"""
+The module `test_plot_lend_ind.py` is designed to test the rendering of the lending-indicator charts, one stock at a time
+and by chunks of stocks on a pool of processes.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from plot_lend_ind import plot_lend_ind, render_lend_ind_charts, _lend_ind_figure, _draw_lend_ind
+from security_index import write_sorted_parquet
+from trading_calendar import TradingCalendar
+
+
+def _panel(n_ids=7, n_dates=20, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_ids * n_dates
+    return pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_dates), n_ids),
+        'short interest ratio': rng.uniform(0, 10, n),
+        'loan supply ratio': rng.uniform(10, 30, n),
+        'loan utilisation ratio': rng.uniform(0, 100, n),
+        'loan fee': rng.lognormal(size=n),
+    }).sample(frac=1, random_state=seed)
+
+
+def test_draw_lend_ind(tmp_path):
+    """
+    Tests that a reused figure is rescaled to the data of every stock.
+    """
+    df = _panel()
+    fig, lines = _lend_ind_figure()
+    for cusip, scale in [('000000001', 1.), ('000000002', 1000.)]:
+        selected_stock = df[df['cusip'] == cusip].sort_values('date')
+        selected_stock = selected_stock.assign(**{'loan fee': selected_stock['loan fee'] * scale})
+        _draw_lend_ind(fig, lines, selected_stock, tmp_path / f'{cusip}.png')
+        assert lines['loan fee'].axes.get_ylim()[1] >= selected_stock['loan fee'].max()
+        assert lines['loan fee'].axes.get_ylim()[1] < selected_stock['loan fee'].max() * 2
+    assert (tmp_path / '000000002.png').exists()
+
+    # Long series are downsampled
+    selected_stock = pd.DataFrame({'date': pd.bdate_range('1990-01-01', periods=10_000)})
+    for column in lines:
+        selected_stock[column] = np.random.default_rng(0).normal(size=10_000).cumsum()
+    _draw_lend_ind(fig, lines, selected_stock, tmp_path / 'long.png', max_points=500)
+    assert all(len(line.get_xdata()) <= 500 for line in lines.values())
+
+    # On the trading days of a calendar
+    calendar = TradingCalendar(selected_stock['date'])
+    _draw_lend_ind(fig, lines, selected_stock, tmp_path / 'long.png', max_points=500, calendar=calendar)
+    assert all(0 < len(line.get_xdata()) <= 500 for line in lines.values())
+    pass
+
+
+def test_render_lend_ind_charts(tmp_path):
+    """
+    Tests that the charts of every stock of a sorted parquet file are rendered on a pool of processes, and that
+    `plot_lend_ind` saves the charts of the selected stocks under their names.
+    """
+    df = _panel()
+    file_path = tmp_path / 'merged_data.parquet'
+    _ = write_sorted_parquet(df, file_path, row_group_size=30)
+
+    n_charts = render_lend_ind_charts(file_path, output_dir=tmp_path / 'charts', chunk_size=3, n_jobs=2)
+    assert n_charts == 7
+    assert sorted(path.name for path in (tmp_path / 'charts').iterdir()) == [f'{i:09d}_lend_ind.png' for i in range(7)]
+
+    plot_lend_ind(df, ['000000003'], ['Stock 3'], output_dir=tmp_path)
+    assert (tmp_path / 'Stock 3_lend_ind.png').exists()
+    pass
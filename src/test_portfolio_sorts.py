@@ -0,0 +1,107 @@
+"""
+The module `test_portfolio_sorts.py` is designed to test the portfolio sort engine on a simulated daily panel, checking the
+trailing exposures, the buckets and the bucket averages against straightforward `pandas` computations.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from portfolio_sorts import trailing_exposure, assign_buckets, portfolio_sort, run_portfolio_sorts
+
+
+def _panel(n_ids=40, n_dates=60, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_dates), n_ids),
+        'incident_count': rng.poisson(0.05, n_ids * n_dates),
+        'current_rri': rng.integers(0, 60, n_ids * n_dates).astype(float),
+        'shrout': rng.lognormal(15, 1, n_ids * n_dates),
+        'loan fee': rng.lognormal(size=n_ids * n_dates),
+        'loan utilisation ratio': rng.uniform(0, 100, n_ids * n_dates),
+    })
+    df['severity_max'] = np.where(df['incident_count'] > 0, rng.integers(1, 4, len(df)), np.nan)
+    df.loc[rng.random(len(df)) < 0.05, 'loan fee'] = np.nan
+    df.loc[rng.random(len(df)) < 0.05, 'current_rri'] = np.nan
+    # Securities missing some dates
+    return df[rng.random(len(df)) < 0.9].sample(frac=1, random_state=seed)
+
+
+def test_trailing_exposure():
+    """
+    Tests the trailing sums and maxima against a rolling window over the dates of the panel.
+    """
+    df = _panel()
+    dates = pd.Index(np.sort(df['date'].unique()), name='date')
+    for how in ['sum', 'max']:
+        column = 'incident_count' if how == 'sum' else 'severity_max'
+        result = pd.Series(trailing_exposure(df, column, window=7, how=how), index=df.index)
+
+        wide = df.pivot(index='date', columns='cusip', values=column).reindex(dates)
+        expected = getattr(wide.rolling(7, min_periods=1), how)()
+        expected = expected.stack(future_stack=True).rename('expected').reset_index()
+        expected = df[['cusip', 'date']].merge(expected, on=['cusip', 'date'], how='left')['expected']
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy())
+    pass
+
+
+def test_assign_buckets():
+    """
+    Tests the quantile buckets against the percentile ranks of every date, and the breakpoints.
+    """
+    df = _panel()
+    date_codes = pd.factorize(df['date'])[0]
+    buckets = assign_buckets(date_codes, df['current_rri'].to_numpy(), n_buckets=3)
+    ranks = df.groupby('date')['current_rri'].rank(pct=True)
+    expected = np.ceil(ranks * 3 - 1e-9).fillna(0).to_numpy() - 1
+    np.testing.assert_array_equal(buckets, expected)
+    # Equal values are in the same bucket
+    assert df.assign(b=buckets).groupby(['date', 'current_rri'])['b'].nunique().max() == 1
+
+    buckets = assign_buckets(date_codes, np.array([0, 1, 2, 5, np.nan] * (len(df) // 5))[:len(df)], breakpoints=[1, 2])
+    assert set(np.unique(buckets)) == {-1, 0, 1, 2}
+    pass
+
+
+def test_portfolio_sort():
+    """
+    Tests the equal-weighted and share-weighted bucket averages against a loop over the dates.
+    """
+    df = _panel()
+    columns = ['loan fee', 'loan utilisation ratio']
+    date_codes = pd.factorize(df['date'])[0]
+    df['bucket'] = assign_buckets(date_codes, df['current_rri'].to_numpy(), n_buckets=3)
+
+    for weight_col in [None, 'shrout']:
+        table = portfolio_sort(df, 'current_rri', columns=columns, n_buckets=3, labels=['low', 'mid', 'high'],
+                               weight_col=weight_col)
+        daily = {}
+        for (date, bucket), group in df[df['bucket'] >= 0].groupby(['date', 'bucket']):
+            weights = np.ones(len(group)) if weight_col is None else group[weight_col].to_numpy()
+            daily[(date, bucket)] = {col: np.ma.average(np.ma.masked_invalid(group[col].to_numpy()), weights=weights)
+                                     for col in columns}
+        daily = pd.DataFrame(daily).T.astype(float)
+        expected = daily.groupby(level=1).mean()
+        np.testing.assert_allclose(table.loc[['low', 'mid', 'high'], columns].to_numpy(), expected.to_numpy())
+
+        spread = daily.xs(2, level=1) - daily.xs(0, level=1)
+        np.testing.assert_allclose(table.loc['H-L', columns].to_numpy(), spread.mean().to_numpy())
+        np.testing.assert_allclose(table.loc['H-L t-stat', columns].to_numpy(),
+                                   (spread.mean() / spread.sem()).to_numpy())
+    pass
+
+
+def test_run_portfolio_sorts(tmp_path):
+    """
+    Tests that every sort is saved equal-weighted and share-weighted, with the forward changes.
+    """
+    (tmp_path / 'stats').mkdir()
+    df = _panel()
+    results = run_portfolio_sorts(df, columns=['loan fee'], horizons=[5], output_dir=tmp_path)
+
+    assert len(results) == 6
+    table = pd.read_parquet(tmp_path / 'stats' / 'portfolio_sort_severity_max_21_vw.parquet')
+    assert list(table.index) == ['none', '1', '2', '3', 'H-L', 'H-L t-stat']
+    assert list(table.columns) == ['loan fee', 'loan fee_change_5', 'n']
+    pass
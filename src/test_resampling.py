@@ -0,0 +1,73 @@
+"""
+The module `test_resampling.py` is designed to test the resampling engine on a simulated panel, checking the bootstrap
+intervals and the permutation p-values, and that the results do not depend on the number of processes.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from resampling import cluster_bootstrap_means, permutation_test, resample_by_groups
+
+
+def _panel(n_securities=200, n_days=20, effect=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    security_effect = rng.normal(size=n_securities)
+    df = pd.DataFrame({
+        'cusip': np.repeat(np.arange(n_securities), n_days),
+        'severity': rng.integers(1, 4, n_securities * n_days).astype(float),
+        'environment': rng.random(n_securities * n_days) < 0.5,
+    })
+    df['loan fee'] = (np.repeat(security_effect, n_days) + effect * (df['severity'] == 3)
+                      + rng.normal(size=len(df)))
+    df.loc[rng.random(len(df)) < 0.1, 'severity'] = np.nan
+    return df
+
+
+def test_cluster_bootstrap_means():
+    """
+    Tests that the bootstrap intervals cover the bucket means and that the standard errors account for the clustering.
+    """
+    df = _panel()
+    result, replications = cluster_bootstrap_means(df, 'severity', 'loan fee', n_boot=400, return_replications=True)
+
+    pd.testing.assert_series_equal(result['mean'], df.groupby('severity')['loan fee'].mean(), check_names=False)
+    assert replications.shape == (400, 3)
+    assert ((result['ci_lower'] < result['mean']) & (result['mean'] < result['ci_upper'])).all()
+    # The security effect makes the clustered standard errors much larger than the i.i.d. ones
+    iid_se = df.groupby('severity')['loan fee'].sem()
+    assert (result['se'] > 1.5 * iid_se).all()
+
+    pd.testing.assert_frame_equal(cluster_bootstrap_means(df, 'severity', 'loan fee', n_boot=400, n_jobs=2),
+                                  result)
+    pass
+
+
+def test_permutation_test():
+    """
+    Tests that the permutation test finds the difference of the highest severity and not the one of the environment flag.
+    """
+    df = _panel()
+    result = permutation_test(df, 'severity', 'loan fee', n_perm=500)
+
+    assert result.loc[3., 'p_value'] < 0.01
+    assert result.loc[2., 'p_value'] > 0.01
+    assert np.isnan(result.loc[1., 'p_value'])
+    assert result.attrs['p_value_all'] < 0.01
+    assert permutation_test(df, 'environment', 'loan fee', n_perm=500).attrs['p_value_all'] > 0.01
+
+    parallel = permutation_test(df, 'severity', 'loan fee', n_perm=500, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel, result)
+    pass
+
+
+def test_resample_by_groups():
+    """
+    Tests that every ESG dimension and lending indicator gets its table.
+    """
+    results = resample_by_groups(_panel(), by=['severity', 'environment'], columns=['loan fee'], n_boot=50, n_perm=50)
+
+    assert set(results) == {('severity', 'loan fee'), ('environment', 'loan fee')}
+    assert list(results[('environment', 'loan fee')].columns) == ['mean', 'se', 'ci_lower', 'ci_upper', 'count',
+                                                                  'difference', 'p_value']
+    pass
@@ -0,0 +1,65 @@
+"""
+The module `test_rolling_features.py` is designed to test the rolling-window feature engine on a small panel, checking the
+features against `groupby(...).rolling(...)` and the handling of missing trading days.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from rolling_features import with_rolling_features
+
+
+def _panel(n_ids=30, n_dates=100, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_dates), n_ids),
+    })
+    df = df[rng.random(len(df)) < 0.9].sample(frac=1, random_state=seed).reset_index(drop=True)
+    df['loan fee'] = rng.lognormal(size=len(df)) + 1000
+    df.loc[rng.random(len(df)) < 0.1, 'loan fee'] = np.nan
+    return df
+
+
+def test_with_rolling_features():
+    """
+    Tests the rolling mean, std, z-score and change against `groupby('cusip').rolling(window)` on the rows of every
+    security.
+    """
+    df = _panel()
+    result = with_rolling_features(df, columns=['loan fee'], windows=[3, 10])
+
+    assert result.index.equals(df.index)
+    ordered = df.sort_values(['cusip', 'date'])
+    grouped = ordered.groupby('cusip')['loan fee']
+    for w in [3, 10]:
+        rolling = grouped.rolling(w)
+        mean = rolling.mean().reset_index(level=0, drop=True)
+        std = rolling.std().reset_index(level=0, drop=True)
+        pd.testing.assert_series_equal(result[f'loan fee_mean_{w}'], mean.reindex(df.index), check_names=False,
+                                       rtol=1e-9)
+        pd.testing.assert_series_equal(result[f'loan fee_std_{w}'], std.reindex(df.index), check_names=False, rtol=1e-6)
+        zscore = (df['loan fee'] - mean.reindex(df.index)) / std.reindex(df.index)
+        pd.testing.assert_series_equal(result[f'loan fee_zscore_{w}'], zscore, check_names=False, rtol=1e-6)
+        change = (ordered['loan fee'] - grouped.shift(w)).reindex(df.index)
+        pd.testing.assert_series_equal(result[f'loan fee_change_{w}'], change, check_names=False, rtol=1e-9)
+    pass
+
+
+def test_with_rolling_features_day_numbers():
+    """
+    Tests that, with day numbers, windows cover trading days and missing days count as missing values.
+    """
+    df = pd.DataFrame({
+        'cusip': ['A'] * 4 + ['B'] * 2,
+        'date': pd.to_datetime(['2023-01-02', '2023-01-03', '2023-01-05', '2023-01-06', '2023-01-02', '2023-01-03']),
+        'loan fee': [1., 2., 4., 8., 10., 20.],
+    })
+    day_numbers = [0, 1, 3, 4, 0, 1]
+    result = with_rolling_features(df, columns=['loan fee'], windows=[2], features=['mean', 'change'], min_periods=1,
+                                   day_numbers=day_numbers)
+
+    np.testing.assert_array_equal(result['loan fee_mean_2'], [1., 1.5, 4., 6., 10., 15.])
+    np.testing.assert_array_equal(result['loan fee_change_2'], [np.nan, np.nan, 2., np.nan, np.nan, np.nan])
+    pass
@@ -0,0 +1,101 @@
+"""
+The module `test_security_index.py` is designed to test the security index of the merged data, checking that the rows of
+some securities read from parquet or sliced from memory are those of a boolean filter of the panel.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from security_index import (is_sorted_by_security, write_sorted_parquet, load_security_index, read_securities,
+                            index_panel, get_securities)
+
+
+def _panel(n_ids=50, n_dates=30, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cusip': np.repeat([f'{i:09d}' for i in range(n_ids)], n_dates),
+        'date': np.tile(pd.bdate_range('2023-01-02', periods=n_dates), n_ids),
+        'loan fee': rng.lognormal(size=n_ids * n_dates),
+    })
+    df = df[rng.random(len(df)) < 0.8]
+    # Several rows on some dates, as in the merged data with one row per incident
+    df = pd.concat([df, df.sample(frac=0.1, random_state=seed).assign(severity=2.)])
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def _expected(df, securities):
+    expected = df[df['cusip'].isin(securities)].sort_values(['cusip', 'date'], kind='stable')
+    return expected.reset_index(drop=True)
+
+
+def test_read_securities(tmp_path):
+    """
+    Tests that the rows of some securities read from the sorted parquet file match a boolean filter of the panel, whether
+    their rows span one or several row groups.
+    """
+    df = _panel()
+    file_path = tmp_path / 'merged_data.parquet'
+    sorted_df, index = write_sorted_parquet(df, file_path, row_group_size=70)
+    assert is_sorted_by_security(sorted_df) and not is_sorted_by_security(df)
+    assert (tmp_path / 'merged_data_security_index.parquet').exists()
+    assert (index['last_row_group'] > index['first_row_group']).any()
+
+    for securities in [['000000003'], ['000000040', '000000001', 'missing', '000000001'], list(df['cusip'].unique())]:
+        result = read_securities(file_path, securities)
+        pd.testing.assert_frame_equal(result, _expected(sorted_df, securities))
+
+    result = read_securities(file_path, ['missing'], columns=['cusip', 'loan fee'])
+    assert result.empty and list(result.columns) == ['cusip', 'loan fee']
+    pass
+
+
+def test_load_security_index(tmp_path):
+    """
+    Tests that a missing or stale security index is rebuilt from the file.
+    """
+    df = _panel()
+    file_path = tmp_path / 'merged_data.parquet'
+    _, index = write_sorted_parquet(df, file_path, row_group_size=70)
+    pd.testing.assert_frame_equal(load_security_index(file_path), index)
+
+    (tmp_path / 'merged_data_security_index.parquet').unlink()
+    pd.testing.assert_frame_equal(load_security_index(file_path), index)
+
+    # The file is rewritten with less rows after its index
+    sorted_df = index_panel(df)[0]
+    sorted_df.iloc[:100].to_parquet(file_path, index=False, row_group_size=70)
+    assert load_security_index(file_path)['stop'].max() == 100
+    pass
+
+
+def test_get_securities():
+    """
+    Tests the in-memory slices of one or several securities.
+    """
+    df = _panel()
+    sorted_df, index = index_panel(df)
+    selected = get_securities(sorted_df, '000000007', index)
+    pd.testing.assert_frame_equal(selected.reset_index(drop=True), _expected(df, ['000000007']))
+    assert get_securities(sorted_df, 'missing', index).empty
+
+    securities = ['000000012', '000000002', 'missing']
+    pd.testing.assert_frame_equal(get_securities(sorted_df, securities, index).reset_index(drop=True),
+                                  _expected(df, securities))
+    # Already sorted panels are kept as they are
+    assert index_panel(sorted_df)[0] is sorted_df
+    pass
+
+
+def test_is_sorted_by_security_missing_ids():
+    """
+    Tests that panels with missing ids are checked without errors, the missing ids being expected last as in `sort_panel`.
+    """
+    df = _panel(n_ids=5, n_dates=3)
+    df.loc[df.index[:4], 'cusip'] = [None, np.nan, None, np.nan]
+    sorted_df, _ = index_panel(df)
+    assert is_sorted_by_security(sorted_df)
+    assert sorted_df['cusip'].iloc[-4:].isna().all()
+    assert not is_sorted_by_security(sorted_df.iloc[::-1])
+    assert not is_sorted_by_security(df)
+    pass
@@ -0,0 +1,77 @@
+"""
+The module `test_sketches.py` is designed to test the mergeable aggregates used to compute descriptive statistics partition
+by partition, checking that merged moments are exact and that the quantiles of merged sketches stay within their bound.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from sketches import MomentAccumulator, QuantileSketch
+from compute_desc_stats import describe_partitions, describe_by_groups, LENDING_INDICATORS, ESG, PERCENTILES
+from test_compute_desc_stats import _merged_data
+
+
+def test_moment_accumulator():
+    """
+    Tests that the moments of merged partitions are the moments of the whole data.
+    """
+    values = np.random.default_rng(0).lognormal(size=1000)
+    accumulator = MomentAccumulator()
+    for part in np.array_split(values, 7):
+        accumulator.merge(MomentAccumulator.from_values(part))
+
+    stats = accumulator.to_dict()
+    assert stats['count'] == 1000
+    np.testing.assert_allclose([stats['mean'], stats['std'], stats['min'], stats['max']],
+                               [values.mean(), values.std(ddof=1), values.min(), values.max()], rtol=1e-12)
+    assert np.isnan(MomentAccumulator().to_dict()['mean'])
+    pass
+
+
+def test_quantile_sketch():
+    """
+    Tests that a sketch is exact until it compacts, and that the ranks of the quantiles of merged sketches are within the
+    reported error bound.
+    """
+    rng = np.random.default_rng(1)
+    small = rng.normal(size=100)
+    np.testing.assert_allclose(QuantileSketch(k=200).update(small).quantile(PERCENTILES),
+                               np.percentile(small, np.array(PERCENTILES) * 100))
+
+    values = rng.lognormal(size=200_000)
+    sketch = QuantileSketch(k=200)
+    for part in np.array_split(values, 50):
+        sketch.merge(QuantileSketch(k=200).update(part))
+
+    assert sketch.n == len(values)
+    assert len(sketch) < 200 * 20
+    assert 0 < sketch.rank_error < 0.05
+    sorted_values = np.sort(values)
+    ranks = np.searchsorted(sorted_values, sketch.quantile(PERCENTILES)) / len(values)
+    assert (np.abs(ranks - np.array(PERCENTILES)) <= sketch.rank_error).all()
+    pass
+
+
+def test_describe_partitions():
+    """
+    Tests that the statistics computed over partitions match the ones of the whole data: exact moments and percentiles
+    within the rank error bound.
+    """
+    df = _merged_data(n=20000, missing_esg=0.)
+    stats = describe_partitions(np.array_split(df, 4), by=ESG, columns=LENDING_INDICATORS, n_jobs=2, k=100)
+    expected = describe_by_groups(df, by=ESG, columns=LENDING_INDICATORS)
+
+    for key, table in expected.items():
+        moments = ['count', 'mean', 'std', 'min', 'max']
+        pd.testing.assert_frame_equal(stats[key][moments], table[moments], check_exact=False, rtol=1e-9)
+        assert (stats[key]['rank_error'] < 0.1).all()
+
+    # Percentiles of the partitioned statistics are within the bound of the exact ones
+    i, j = 'severity', 'loan fee'
+    for group, row in stats[(i, j)].dropna().iterrows():
+        group_values = np.sort(df.loc[df[i] == group, j].dropna().to_numpy())
+        for q in PERCENTILES:
+            rank = np.searchsorted(group_values, row[f"{q * 100:g}%"]) / len(group_values)
+            assert abs(rank - q) <= row['rank_error'] + 1 / len(group_values)
+    pass
@@ -0,0 +1,113 @@
+"""
+The module `test_trading_calendar.py` is designed to test the trading-day calendar on a short list of trading days, checking
+the mapping between dates and trading day numbers, the business-day offsets and the disk cache.
+"""
+import pandas as pd
+import numpy as np
+
+import pytest
+
+from trading_calendar import TradingCalendar, load_trading_calendar, pull_trading_calendar
+import misc_tools
+import config
+
+# Trading days around the 2023 New Year holiday (2023-01-02 is a holiday, 2023-01-07 and 2023-01-08 a weekend)
+trading_days = pd.to_datetime(['2022-12-29', '2022-12-30', '2023-01-03', '2023-01-04', '2023-01-05', '2023-01-06',
+                               '2023-01-09'])
+
+
+def test_to_day_num():
+    """
+    Tests that trading days are numbered in order and that other dates are rolled forward, backward, or mapped to NaN.
+    """
+    calendar = TradingCalendar(trading_days)
+    dates = pd.to_datetime(['2022-12-29', '2023-01-02', '2023-01-08', '2023-01-09', '2023-01-10', '2022-01-01', None])
+
+    np.testing.assert_array_equal(calendar.to_day_num(dates, roll=None), [0, np.nan, np.nan, 6, np.nan, np.nan, np.nan])
+    np.testing.assert_array_equal(calendar.to_day_num(dates, roll='forward'), [0, 2, 6, 6, np.nan, np.nan, np.nan])
+    np.testing.assert_array_equal(calendar.to_day_num(dates, roll='backward'), [0, 1, 5, 6, np.nan, np.nan, np.nan])
+    np.testing.assert_array_equal(calendar.is_trading_day(dates), [True, False, False, True, False, False, False])
+
+    with pytest.raises(ValueError):
+        calendar.day_numbers(dates)
+    pass
+
+
+def test_offset():
+    """
+    Tests the business-day offsets across the holiday and the weekend, and that offsets leaving the calendar give NaT.
+    """
+    calendar = TradingCalendar(trading_days)
+    dates = pd.to_datetime(['2022-12-30', '2023-01-06', '2023-01-07', '2023-01-09'])
+
+    offset = calendar.offset(dates, 1)
+    assert offset[:2].tolist() == pd.to_datetime(['2023-01-03', '2023-01-09']).tolist()
+    assert offset[2:].isna().all()
+    assert calendar.offset(dates, [-1, -4, -1, -6]).tolist() == pd.to_datetime(
+        ['2022-12-29', '2022-12-30', '2023-01-06', '2022-12-29']).tolist()
+    np.testing.assert_array_equal(calendar.trading_days_between(dates[:1], dates[1:]), [4, 4, 5])
+    pass
+
+
+def test_lags_in_trading_days():
+    """
+    Tests that lags count trading days with the calendar, and distinct dates of the data without it.
+    """
+    data = pd.DataFrame({
+        'id': [1, 1, 1],
+        'date': pd.to_datetime(['2022-12-30', '2023-01-03', '2023-01-05']),
+        'value': [1., 2., 3.],
+    })
+    calendar = TradingCalendar(trading_days)
+
+    by_dates = misc_tools.with_multi_horizon_lagged_columns(data=data, columns_to_lag=['value'], id_columns=['id'])
+    by_trading_days = misc_tools.with_multi_horizon_lagged_columns(data=data, columns_to_lag=['value'], id_columns=['id'],
+                                                                   day_numbers=calendar.day_numbers(data['date']))
+
+    np.testing.assert_array_equal(by_dates['L1_value'], [np.nan, 1., 2.])
+    np.testing.assert_array_equal(by_trading_days['L1_value'], [np.nan, 1., np.nan])
+    pass
+
+
+def test_load_trading_calendar(tmp_path):
+    """
+    Tests that the calendar is built from the exchange calendar, saved to the disk cache, and read back from it.
+    """
+    calendar = load_trading_calendar('NYSE', start_date='2022-12-20', end_date='2023-01-31', data_dir=tmp_path,
+                                     from_cache=False, save_cache=True)
+
+    assert (tmp_path / 'derived' / 'trading_calendar_NYSE.parquet').exists()
+    assert not calendar.is_trading_day(pd.to_datetime(['2023-01-02']))[0]
+    assert calendar.offset(pd.to_datetime(['2022-12-30']), 1)[0] == pd.Timestamp('2023-01-03')
+    np.testing.assert_array_equal(calendar.days, pull_trading_calendar('NYSE', '2022-12-20', '2023-01-31')['date']
+                                  .to_numpy().astype('datetime64[D]'))
+
+    # A sub-range of the cached range is read from the cache
+    cached = load_trading_calendar('NYSE', start_date='2023-01-01', end_date='2023-01-15', data_dir=tmp_path)
+    assert cached.days[0] == np.datetime64('2023-01-03')
+    assert cached.date_mapping()['day_num'].tolist() == list(range(len(cached)))
+    pass
+
+
+def test_load_date_mapping(tmp_path):
+    """
+    Tests that the date mapping of the DVP dates is extended with the trading days of the SIFMA calendar, including the
+    remaining days of the year of the last DVP date, without any hard-coded list of holidays.
+    """
+    sifma_days = pull_trading_calendar('SIFMA_US', '2016-01-01', '2024-12-31')['date']
+    dvp_days = sifma_days[sifma_days.between('2019-10-21', '2023-03-15') & (sifma_days != '2021-04-02')]
+    (tmp_path / 'derived').mkdir()
+    dvp_days.dt.strftime('%Y-%m-%d').to_csv(tmp_path / 'derived' / 'all_dates_dvp.csv', header=False, index=False)
+
+    df_dm = misc_tools.load_date_mapping(data_dir=tmp_path, future_end='2024-12-31')
+    assert df_dm['day_num'].tolist() == list(range(len(df_dm)))
+    assert df_dm['date'].is_monotonic_increasing and df_dm['date'].is_unique
+    expected = sifma_days[sifma_days != '2021-04-02'].reset_index(drop=True)
+    pd.testing.assert_series_equal(df_dm['date'], expected, check_names=False)
+
+    # By default, the future dates stop a few weeks after the end of the sample
+    df_dm = misc_tools.load_date_mapping(data_dir=tmp_path, max_horizon=26)
+    last_date = max(pd.Timestamp(config.END_DATE), pd.Timestamp('2023-12-31')) + pd.DateOffset(days=52)
+    assert df_dm['date'].max() <= last_date
+    assert (df_dm['date'] > max(pd.Timestamp(config.END_DATE), pd.Timestamp('2023-12-31'))).sum() >= 26
+    pass
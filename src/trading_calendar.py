@@ -0,0 +1,210 @@
+"""
+The `trading_calendar.py` module has been designed to provide a trading-day calendar that is built once, cached on disk
+and shared by the lag, plotting and statistics code.
+
+The module contains the following:
+    * TradingCalendar - Trading-day index with vectorized date <-> day number mapping and business-day offsets.
+    * pull_trading_calendar - Builds the trading days of an exchange with `pandas_market_calendars`.
+    * load_trading_calendar - Loads the calendar from memory, from the disk cache, or builds it.
+
+The calendar stores, for every calendar day of its range, the number of trading days on or before that day. Mapping a date
+to its trading day number, rolling it to the next or previous trading day, or moving it by a number of trading days is
+then a lookup in that array, whatever the number of dates.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import config
+except ModuleNotFoundError:
+    # Imported as `src.trading_calendar` from the root of the project, without `src` on the path
+    from src import config
+
+DATA_DIR = Path(config.DATA_DIR)
+CALENDAR_NAME = 'NYSE'
+CALENDAR_START_DATE = '2000-01-01'
+CALENDAR_END_DATE = '2030-12-31'
+
+# Calendars already loaded in this process, by (name, start date, end date)
+_CALENDARS = {}
+
+
+class TradingCalendar:
+    """
+    Trading-day index built from a list of trading days.
+
+    Trading days are numbered 0, 1, 2, ... in increasing order. Dates are mapped to day numbers with `to_day_num`, day
+    numbers back to dates with `to_date`, and `offset` moves dates by a number of trading days. All the methods take and
+    return arrays (or anything convertible to `datetime64`), and missing results are NaN / NaT.
+    """
+
+    def __init__(self, trading_days):
+        trading_days = pd.DatetimeIndex(trading_days)
+        if trading_days.tz is not None:
+            trading_days = trading_days.tz_localize(None)
+        days = np.unique(trading_days.to_numpy().astype('datetime64[D]'))
+        if len(days) == 0:
+            raise ValueError("A trading calendar needs at least one trading day")
+        self.days = days
+        self.first_day = days[0].astype(np.int64)
+        self.last_day = days[-1].astype(np.int64)
+
+        is_trading_day = np.zeros(self.last_day - self.first_day + 1, dtype=bool)
+        is_trading_day[days.astype(np.int64) - self.first_day] = True
+        self._is_trading_day = is_trading_day
+        # Number of trading days on or before each calendar day of the range
+        self._trading_days_until = np.cumsum(is_trading_day)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __repr__(self):
+        return f"TradingCalendar({len(self)} trading days from {self.days[0]} to {self.days[-1]})"
+
+    def _calendar_offsets(self, dates):
+        """
+        Returns the offsets of the dates from the first day of the calendar and whether they are inside its range.
+        """
+        dates = np.asarray(pd.to_datetime(dates)).astype('datetime64[D]')
+        offsets = dates.astype(np.int64) - self.first_day
+        inside = ~np.isnat(dates) & (offsets >= 0) & (offsets <= self.last_day - self.first_day)
+        return np.where(inside, offsets, 0), inside
+
+    def is_trading_day(self, dates):
+        """
+        Returns whether each date is a trading day.
+        """
+        offsets, inside = self._calendar_offsets(dates)
+        return inside & self._is_trading_day[offsets]
+
+    def to_day_num(self, dates, roll='forward'):
+        """
+        Returns the trading day number of each date as a float array (NaN outside of the calendar).
+
+        Dates that are not trading days are rolled to the next trading day with `roll='forward'`, to the previous one with
+        `roll='backward'`, or mapped to NaN with `roll=None`.
+        """
+        offsets, inside = self._calendar_offsets(dates)
+        trading = self._is_trading_day[offsets]
+        until = self._trading_days_until[offsets]
+
+        if roll == 'forward':
+            day_num = np.where(trading, until - 1, until)
+            inside &= day_num < len(self.days)
+        elif roll == 'backward':
+            day_num = until - 1
+            inside &= day_num >= 0
+        elif roll is None:
+            day_num = until - 1
+            inside &= trading
+        else:
+            raise ValueError(f"roll must be 'forward', 'backward' or None, got {roll!r}")
+
+        return np.where(inside, day_num, np.nan)
+
+    def to_date(self, day_nums):
+        """
+        Returns the date of each trading day number (NaT for numbers outside of the calendar).
+        """
+        day_nums = np.asarray(day_nums, dtype=np.float64)
+        valid = ~np.isnan(day_nums) & (day_nums >= 0) & (day_nums < len(self.days))
+        dates = self.days[np.where(valid, day_nums, 0).astype(np.int64)]
+        return pd.DatetimeIndex(np.where(valid, dates, np.datetime64('NaT')).astype('datetime64[ns]'))
+
+    def offset(self, dates, n, roll='forward'):
+        """
+        Moves each date by `n` trading days (n can be an array), after rolling it to a trading day with `roll`.
+        """
+        return self.to_date(self.to_day_num(dates, roll=roll) + np.asarray(n))
+
+    def day_numbers(self, dates):
+        """
+        Returns the trading day number of each date as an integer array, raising a ValueError if a date is not a trading
+        day of the calendar. This is the `day_numbers` argument of `misc_tools.with_multi_horizon_lagged_columns`.
+        """
+        day_nums = self.to_day_num(dates, roll=None)
+        if np.isnan(day_nums).any():
+            n_missing = int(np.isnan(day_nums).sum())
+            raise ValueError(f"{n_missing} dates are not trading days of the calendar")
+        return day_nums.astype(np.int64)
+
+    def date_mapping(self):
+        """
+        Returns the trading days as a DataFrame with the `day_num`, `date` and `date_str` columns (the format of
+        `misc_tools.load_date_mapping`).
+        """
+        df = pd.DataFrame({'day_num': np.arange(len(self.days)), 'date': self.days.astype('datetime64[ns]')})
+        df['date_str'] = df['date'].dt.strftime('%Y%m%d')
+        return df
+
+    def trading_days_between(self, start_dates, end_dates):
+        """
+        Returns the number of trading days from each start date (excluded) to each end date (included).
+        """
+        return self.to_day_num(end_dates, roll='backward') - self.to_day_num(start_dates, roll='backward')
+
+
+def pull_trading_calendar(calendar_name=CALENDAR_NAME, start_date=CALENDAR_START_DATE, end_date=CALENDAR_END_DATE):
+    """
+    The `pull_trading_calendar` function returns the trading days of the `calendar_name` exchange calendar of
+    `pandas_market_calendars` between `start_date` and `end_date` as a DataFrame with a `date` column.
+    """
+    import pandas_market_calendars
+
+    market_calendar = pandas_market_calendars.get_calendar(calendar_name)
+    valid_days = market_calendar.valid_days(start_date=start_date, end_date=end_date).tz_localize(None)
+    return pd.DataFrame({'date': valid_days.normalize()})
+
+
+def load_trading_calendar(
+        calendar_name=CALENDAR_NAME,
+        start_date=CALENDAR_START_DATE,
+        end_date=CALENDAR_END_DATE,
+        data_dir=DATA_DIR,
+        from_cache=True,
+        save_cache=True
+):
+    """
+    The `load_trading_calendar` function returns the `TradingCalendar` of the `calendar_name` exchange between
+    `start_date` and `end_date`.
+
+    The calendar is built only once per process. It is otherwise read from the `derived` folder of the data directory if a
+    cached file covering the requested range exists, or built with `pull_trading_calendar` and optionally saved there.
+    """
+    key = (calendar_name, str(start_date), str(end_date))
+    if from_cache and key in _CALENDARS:
+        return _CALENDARS[key]
+
+    file_path = Path(data_dir) / "derived" / f"trading_calendar_{calendar_name}.parquet"
+    df = None
+    if from_cache and file_path.exists():
+        cached = pd.read_parquet(file_path)
+        # The cached file stores the requested range in its first and last rows
+        if cached['requested'].iloc[0] <= pd.Timestamp(start_date) and cached['requested'].iloc[-1] >= pd.Timestamp(end_date):
+            df = cached[cached['is_trading_day']]
+
+    if df is None:
+        df = pull_trading_calendar(calendar_name=calendar_name, start_date=start_date, end_date=end_date)
+        if save_cache:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            to_save = df.assign(is_trading_day=True, requested=pd.NaT)
+            bounds = pd.DataFrame({'date': pd.to_datetime([start_date, end_date]), 'is_trading_day': False,
+                                   'requested': pd.to_datetime([start_date, end_date])})
+            # Written to a temporary file of this process first, as several tasks can build the calendar at once
+            temporary_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+            pd.concat([bounds.iloc[[0]], to_save, bounds.iloc[[1]]], ignore_index=True).to_parquet(temporary_path)
+            os.replace(temporary_path, file_path)
+
+    df = df[(df['date'] >= pd.Timestamp(start_date)) & (df['date'] <= pd.Timestamp(end_date))]
+    calendar = TradingCalendar(df['date'])
+    _CALENDARS[key] = calendar
+    return calendar
+
+
+if __name__ == "__main__":
+    # Build and save the cache of the trading calendar
+    _ = load_trading_calendar(data_dir=DATA_DIR, from_cache=False, save_cache=True)